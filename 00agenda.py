@@ -10,6 +10,14 @@ from oauth2client.service_account import ServiceAccountCredentials
 import socket
 import psutil
 import sys
+import threading
+import dir_watch
+import transcode
+import sheets_journal
+import storage
+import thermal
+import capacity
+import upload_planner
 
 CREDENTIALS_PATH = "/xcoutfy/credentials.json"
 SHEET_NAME = "dbgravacoes"
@@ -32,11 +40,25 @@ STREAM_PID_FILE = "/tmp/xcoutfy_stream_pid.txt"
 BROADCAST_PID_FILE = "/tmp/xcoutfy_broadcast_pid.txt"
 
 CHECK_INTERVAL = int(os.getenv("AGENDA_REFRESH_INTERVAL", 30))
+JOURNAL_FLUSH_INTERVAL = 120  # reenvio do diário do Sheets quando há conectividade
 EXECUTION_TOLERANCE_SEC = 90
+THERMAL_INTERVAL_SEC = 5      # amostragem do controle térmico
 
 os.makedirs(BROADCAST_DONE_DIR, exist_ok=True)
 os.makedirs("/xcoutfy/logs", exist_ok=True)
 
+# Filas de arquivos prontos (inotify); media_arrived acorda o loop FREE2UP
+media_arrived = threading.Event()
+recorded_queue = dir_watch.DirQueue(storage.RECORDING_TIERS, ".mp4", notify=media_arrived)
+uploaded_queue = dir_watch.DirQueue([UPLOADED_DIR], ".uploaded", notify=media_arrived)
+
+# Transcode H.264 opcional (XC_TRANSCODE=1), só com o equipamento ocioso
+transcode_stage = transcode.TranscodeStage()
+# Migração de vídeos prontos entre tiers (SD <-> HDD USB), também só ocioso
+tier_migrator = storage.TierMigrator()
+# transcode_stage é usado pelo loop principal e pelo thermal_watcher
+background_lock = threading.Lock()
+
 # ===========================
 # Logging
 # ===========================
@@ -84,6 +106,9 @@ def _sanitize_pidfile(pidfile: str):
 def _sanitize_all_pidfiles():
     for pf in (UPLOAD_PID_FILE, RECORD_PID_FILE, CONTINUOUS_PID_FILE, STREAM_PID_FILE, BROADCAST_PID_FILE):
         _sanitize_pidfile(pf)
+    # upload suspenso (SIGSTOP) por um 00agenda anterior: os pids só existiam na
+    # memória dele; sem isto o 02upload ficaria parado e o pidfile vivo para sempre
+    _resume_stopped_upload()
 
 # ===========================
 # Agenda handling
@@ -191,18 +216,112 @@ def launch_upload_or_broadcast():
     _sanitize_pidfile(UPLOAD_PID_FILE)
     _sanitize_pidfile(BROADCAST_PID_FILE)
 
-    if os.listdir(RECORDED_DIR):
-        if not _pidfile_alive(UPLOAD_PID_FILE):
-            launch_process_and_store_pid(UPLOAD_SCRIPT, UPLOAD_PID_FILE)
-        return
-    files = [f for f in os.listdir(UPLOADED_DIR) if f.endswith(".uploaded")]
-    if files:
+    if recorded_queue.has_items():
+        if _pidfile_alive(UPLOAD_PID_FILE):
+            return
+        # o 02upload já viu estes vídeos e nenhum cabe no resto da janela: não relança
+        # (custa agenda + Sheets a cada tick) e deixa o broadcast usar a janela
+        if not upload_planner.is_deferred(recorded_queue.snapshot()):
+            # mídia nova durante um broadcast espera ele terminar: os dois disputariam o uplink
+            if not _pidfile_alive(BROADCAST_PID_FILE):
+                launch_process_and_store_pid(UPLOAD_SCRIPT, UPLOAD_PID_FILE)
+            return
+    if uploaded_queue.has_items():
         if not _pidfile_alive(BROADCAST_PID_FILE):
             launch_process_and_store_pid(BROADCAST_SCRIPT, BROADCAST_PID_FILE)
 
+# ===========================
+# Diário do Sheets
+# ===========================
+def journal_flusher():
+    """Thread de fundo: reenvia registros pendentes assim que o Sheets responde."""
+    while True:
+        time.sleep(JOURNAL_FLUSH_INTERVAL)
+        try:
+            if sheets_journal.pending() and sheets_journal.sheets_reachable():
+                sheets_journal.flush()
+        except Exception as e:
+            print(f"⚠️ Erro no flush do diário do Sheets: {e}")
+
+# ===========================
+# Controle térmico
+# ===========================
+thermal_controller = thermal.AdaptiveController()
+_upload_suspended = set()
+
+def _upload_tree():
+    try:
+        with open(UPLOAD_PID_FILE, "r") as f:
+            root = psutil.Process(int(f.read().strip()))
+        return [root] + root.children(recursive=True)
+    except (OSError, ValueError, psutil.NoSuchProcess, psutil.AccessDenied):
+        return []
+
+def _set_upload_paused(paused):
+    """Suspende/retoma o 02upload e o rclone (SIGSTOP/SIGCONT) sem perder o progresso."""
+    if paused:
+        for p in _upload_tree():
+            if p.pid in _upload_suspended:
+                continue
+            try:
+                p.suspend()
+                _upload_suspended.add(p.pid)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+    elif _upload_suspended:
+        for pid in list(_upload_suspended):
+            try:
+                psutil.Process(pid).resume()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+        _upload_suspended.clear()
+        print("▶️ Upload retomado (controle térmico).")
+
+def _resume_stopped_upload():
+    resumed = 0
+    for p in _upload_tree():
+        try:
+            if p.status() == psutil.STATUS_STOPPED:
+                p.resume()
+                resumed += 1
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    if resumed:
+        print(f"▶️ Upload suspenso por execução anterior retomado ({resumed} processo(s)).")
+
+def thermal_watcher():
+    """Thread de fundo: roda também durante RECORDING (o loop principal fica bloqueado)."""
+    while True:
+        try:
+            temp_c, load, speed = thermal.read_sensors()
+            level, reason = thermal_controller.update(temp_c, load, speed)
+            while thermal_controller.decisions:
+                thermal.log_decision(thermal_controller.decisions.pop(0))
+            thermal.save_state(level, reason, temp_c, load, speed)
+            _set_upload_paused(level >= thermal.LEVEL_UPLOAD_PAUSED)
+            if level >= thermal.LEVEL_NO_BACKGROUND and transcode_stage.inflight:
+                # tick(idle=False) só barra novos envios; os ffmpeg em andamento param aqui
+                with background_lock:
+                    transcode_stage.stop()
+        except Exception as e:
+            print(f"⚠️ Erro no controle térmico: {e}")
+        time.sleep(THERMAL_INTERVAL_SEC)
+
 # ===========================
 # Schedule execution
 # ===========================
+def _slot_id(item):
+    return f"{item.get('equipment')}_{item.get('day')}_{item.get('hour')}_{item.get('minute')}_{item.get('customer')}"
+
+def _slot_start_epoch(item):
+    """Horário agendado de hoje (epoch), ou None se a linha não tiver hora válida."""
+    try:
+        start = datetime.now().replace(hour=int(item.get("hour", 0)), minute=int(item.get("minute", 0)),
+                                       second=0, microsecond=0)
+    except (TypeError, ValueError):
+        return None
+    return start.timestamp()
+
 def check_schedule():
     eqp_name = socket.gethostname()
     today = datetime.now().strftime("%A").lower()
@@ -227,7 +346,7 @@ def check_schedule():
         if t not in PRIORITY_ORDER:
             continue
 
-        task_id = f"{item.get('equipment')}_{item.get('day')}_{item.get('hour')}_{item.get('minute')}_{item.get('customer')}"
+        task_id = _slot_id(item)
         if task_id not in executed_slots:
             executed_slots.add(task_id)
             pending_tasks.append((t, item))
@@ -238,9 +357,14 @@ def process_pending_tasks():
         return
 
     selected_type, selected_item = pending_tasks.pop(0)
+    # Qualquer tarefa agendada tem prioridade sobre o transcode em segundo plano
+    with background_lock:
+        transcode_stage.stop()
+        tier_migrator.tick(idle=False)
     env = os.environ.copy()
     env["CUSTOMER"] = selected_item.get("customer", "unknown")
     env["EQUIPMENT"] = selected_item.get("equipment", "unknown")
+    env["SLOT_ID"] = _slot_id(selected_item)
 
     if selected_type == "RECORDING":
         args = [
@@ -253,6 +377,24 @@ def process_pending_tasks():
             "--crop_top", str(selected_item.get("crop_top", 0)),
             "--crop_bottom", str(selected_item.get("crop_bottom", 0))
         ]
+        # bitrate da agenda limitado pelo que as janelas FREE2UP da semana conseguem enviar
+        try:
+            bitrate, reason = capacity.slot_bitrate(selected_item)
+        except Exception as e:
+            bitrate, reason = selected_item.get("bitrate") or capacity.DEFAULT_BITRATE, f"sem modelo: {e}"
+        print(f"🎚️ Bitrate do slot: {bitrate} ({reason})")
+        args += ["--bitrate", str(bitrate)]
+        # o slot entra na fila até EXECUTION_TOLERANCE_SEC antes da hora: o gravador
+        # abre a câmera pouco antes e só começa o arquivo no segundo agendado
+        start_at = _slot_start_epoch(selected_item)
+        if start_at and start_at > time.time():
+            args += ["--start_at", f"{start_at:.0f}"]
+        # coluna "live" = yes: grava e transmite com uma única captura (tee)
+        if str(selected_item.get("live", "")).strip().lower() in ("yes", "sim", "1", "true") and selected_item.get("rtmp_key"):
+            args += [
+                "--stream_key", str(selected_item.get("rtmp_key")),
+                "--stream_bitrate", str(selected_item.get("live_bitrate") or "2500k")
+            ]
         print(f"🔔 Executando RECORDING para {selected_item.get('customer')} ({selected_item.get('duration')}s)")
         run_and_block_until_done(RECORD_SCRIPT, RECORD_PID_FILE, env=env, args=args)
 
@@ -261,7 +403,9 @@ def process_pending_tasks():
         start_time = time.time()
         while time.time() - start_time < dur:
             launch_upload_or_broadcast()
-            time.sleep(30)
+            # acorda assim que um vídeo fica pronto, ou a cada 30s para reavaliar
+            media_arrived.wait(30)
+            media_arrived.clear()
 
     elif selected_type == "CONTINUOUS":
         args = [
@@ -288,6 +432,8 @@ if __name__ == "__main__":
     executed_slots.clear()
     pending_tasks.clear()
     _sanitize_all_pidfiles()
+    threading.Thread(target=journal_flusher, name="journal_flusher", daemon=True).start()
+    threading.Thread(target=thermal_watcher, name="thermal_watcher", daemon=True).start()
 
     last_fetch = 0
     shown_upcoming = False
@@ -355,4 +501,17 @@ if __name__ == "__main__":
 
         check_schedule()
         process_pending_tasks()
+        idle = (
+            thermal_controller.level < thermal.LEVEL_NO_BACKGROUND
+            and not pending_tasks
+            and not _pidfile_alive(RECORD_PID_FILE)
+            and not _pidfile_alive(UPLOAD_PID_FILE)
+            and not _pidfile_alive(BROADCAST_PID_FILE)
+        )
+        with background_lock:
+            transcode_stage.tick(idle=idle)
+            tier_migrator.tick(idle=idle and not transcode_stage.inflight)
+        if idle and not transcode_stage.inflight:
+            # benchmark de escrita dos tiers fora do caminho da gravação
+            storage.refresh_stale_bench()
         time.sleep(1)
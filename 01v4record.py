@@ -6,8 +6,21 @@ import argparse
 import psutil
 import sys
 import time
+import json
+import threading
+from collections import deque
+import file_ready
+import sidecar
+import metrics
+import storage
+import frame_faults
+import devices
+import thermal
+import mp4check
+import proxy
 
 # === DEFAULT CONFIG ===
+MIN_RECORD_SEC = 60  # abaixo disso não vale gravar um trecho cortado por falta de espaço
 DEFAULT_DURATION = 5
 DEFAULT_BITRATE = '5M'
 DEFAULT_RESOLUTION = "2560x720"
@@ -15,6 +28,29 @@ DEFAULT_FPS = 30
 FRAME_HEIGHT = 720
 LENS_WIDTH = 1280
 OUTPUT_DIR = "/xcoutfy/recorded_videos"
+# Destino RTMP do modo gravação + transmissão (mesmo padrão do setupcamera_caio)
+RTMP_BASE_URL = os.getenv("XC_RTMP_BASE_URL", "rtmp://a.rtmp.youtube.com/live2").rstrip("/")
+DEFAULT_STREAM_BITRATE = '2500k'
+# Pré-aquecimento: câmera aberta e decodificando antes do slot; o arquivo
+# só recebe quadros a partir do segundo agendado (--start_at)
+PREWARM_SEC = int(os.getenv("XC_RECORD_PREWARM_SEC", 8))
+# Saúde da gravação: estado ao vivo e limites para marcar problemas no resumo
+HEALTH_STATE_PATH = "/tmp/xcoutfy_record_health.json"
+SLOW_SPEED = 0.97
+DROP_ALERT_PCT = 1.0
+# speed= do -progress é acumulado desde o disparo do ffmpeg (inclui o pré-aquecimento
+# e a abertura da câmera); a saúde usa a razão Δtempo gravado / Δrelógio nesta janela
+SPEED_WINDOW_SEC = 5
+# MP4 fragmentado (moov vazio no início + fragmentos de ~10s): se o ffmpeg for
+# morto, os fragmentos já escritos continuam legíveis e o remux recupera o arquivo
+FRAGMENTED = os.getenv("XC_RECORD_FRAGMENTED", "1") == "1"
+FRAGMENT_USEC = 10_000_000
+STDERR_WARNINGS = {
+    "alsa_xrun": "xrun",
+    "thread_queue_full": "thread message queue blocking",
+    "non_monotonic_dts": "non-monotonic dts",
+    "past_duration": "past duration too large",
+}
 
 DEFAULT_LEFT_CROP_LEFT = 0
 DEFAULT_LEFT_CROP_RIGHT = 300
@@ -35,6 +71,11 @@ parser.add_argument('--right_crop_left', type=int, default=DEFAULT_RIGHT_CROP_LE
 parser.add_argument('--right_crop_right', type=int, default=DEFAULT_RIGHT_CROP_RIGHT)
 parser.add_argument('--crop_top', type=int, default=DEFAULT_CROP_TOP)
 parser.add_argument('--crop_bottom', type=int, default=DEFAULT_CROP_BOTTOM)
+parser.add_argument('--stream_key', type=str, default="",
+                    help="se informado, transmite ao vivo a mesma captura (tee) enquanto grava")
+parser.add_argument('--stream_bitrate', type=str, default=DEFAULT_STREAM_BITRATE)
+parser.add_argument('--start_at', type=float, default=0,
+                    help="epoch do início agendado; a captura abre antes e o arquivo começa exatamente nele")
 args = parser.parse_args()
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -77,10 +118,12 @@ def clear_old_record_pid():
 
 
 def detect_usb_camera():
-    # ✅ Prioriza testar video1 antes do video2
-    preferred_order = [1, 2, 0, 3, 4]
-    for i in preferred_order:
-        device = f"/dev/video{i}"
+    # ✅ Prioriza o último dispositivo que funcionou (mesma câmera USB), depois video1 antes do video2
+    preferred_order = [f"/dev/video{i}" for i in [1, 2, 0, 3, 4]]
+    cached = devices.cached_video()
+    if cached:
+        preferred_order = [cached] + [d for d in preferred_order if d != cached]
+    for device in preferred_order:
         if os.path.exists(device):
             print(f"🔍 Testing {device}...")
             try:
@@ -91,6 +134,7 @@ def detect_usb_camera():
                 ]
                 subprocess.run(test_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
                 print(f"📷 Functional USB camera detected: {device}")
+                devices.remember_video(device)
                 return device
             except subprocess.CalledProcessError:
                 print(f"❌ {device} failed to capture.")
@@ -98,6 +142,138 @@ def detect_usb_camera():
     exit(1)
 
 
+class RecordingHealth(object):
+    """
+    Acompanha a captura pelo -progress (fps, dup/drop, speed) e pelos avisos
+    do stderr (xrun do ALSA, fila de thread cheia). Publica o estado ao vivo
+    em HEALTH_STATE_PATH e gera o resumo que vai para o sidecar.
+    """
+
+    def __init__(self, expected_fps):
+        self.expected_fps = expected_fps
+        self.first_frame_at = None
+        self.last = {}
+        self.fps_samples = []
+        self.speed_samples = []
+        self.slow_samples = 0
+        self._speed_window = deque()   # (relógio, out_time_us) dos últimos SPEED_WINDOW_SEC
+        self.warnings = {key: 0 for key in STDERR_WARNINGS}
+        self.faults = []
+        self.started = time.time()
+
+    def watch_progress(self, stdout):
+        block = {}
+        for line in stdout:
+            key, _, value = line.strip().partition("=")
+            if key != "progress":
+                block[key] = value
+                continue
+            self._sample(block, final=value == "end")
+            block = {}
+
+    def watch_stderr(self, stderr):
+        for line in stderr:
+            low = line.lower()
+            for key, needle in STDERR_WARNINGS.items():
+                if needle in low:
+                    self.warnings[key] += 1
+
+    def _sample(self, block, final=False):
+        raw = block.get("out_time_us") or block.get("out_time_ms") or ""
+        out_us = int(raw) if raw.lstrip("-").isdigit() else 0
+        if self.first_frame_at is None and out_us > 0:
+            # 1º quadro gravado: relógio agora menos o tempo já gravado
+            self.first_frame_at = time.time() - out_us / 1_000_000
+        fps = _to_float(block.get("fps"))
+        speed = self._interval_speed(out_us) if not final else None
+        if out_us > 0 and fps:
+            self.fps_samples.append(fps)
+        if speed is not None:
+            self.speed_samples.append(speed)
+            if speed < SLOW_SPEED:
+                self.slow_samples += 1
+        self.last = {
+            "out_time_sec": round(out_us / 1_000_000, 1),
+            "frame": _to_int(block.get("frame")),
+            "fps": fps,
+            "speed": speed,     # por intervalo: é o que o controle térmico lê
+            "ffmpeg_speed": _to_float((block.get("speed") or "").rstrip("x")),
+            "dup_frames": _to_int(block.get("dup_frames")) or 0,
+            "drop_frames": _to_int(block.get("drop_frames")) or 0,
+        }
+        self._publish("finished" if final else "recording")
+
+    def _interval_speed(self, out_us):
+        """Δtempo gravado / Δrelógio na última janela; None até haver SPEED_WINDOW_SEC de gravação."""
+        if out_us <= 0:
+            return None
+        now = time.time()
+        window = self._speed_window
+        window.append((now, out_us))
+        while len(window) > 1 and now - window[1][0] >= SPEED_WINDOW_SEC:
+            window.popleft()
+        then, then_us = window[0]
+        if now - then < SPEED_WINDOW_SEC:
+            return None
+        return round((out_us - then_us) / 1_000_000 / (now - then), 3)
+
+    def fault(self, lens, fault):
+        """Alerta do frame_faults: aparece no estado ao vivo na hora."""
+        self.faults.append(f"{lens}:{fault}")
+        self._publish("recording")
+
+    def _publish(self, status):
+        state = dict(self.last, status=status, pid=os.getpid(), warnings=self.warnings, faults=self.faults,
+                     updated_at=datetime.datetime.now().isoformat(timespec="seconds"))
+        try:
+            tmp = HEALTH_STATE_PATH + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp, HEALTH_STATE_PATH)
+        except OSError:
+            pass
+
+    def summary(self):
+        frames = self.last.get("frame") or 0
+        drop = self.last.get("drop_frames", 0)
+        dup = self.last.get("dup_frames", 0)
+        data = {
+            "frames": frames,
+            "dup_frames": dup,
+            "drop_frames": drop,
+            "drop_pct": round(100 * drop / (frames + drop), 2) if frames + drop else 0,
+            "avg_fps": round(sum(self.fps_samples) / len(self.fps_samples), 2) if self.fps_samples else None,
+            "min_fps": min(self.fps_samples) if self.fps_samples else None,
+            "avg_speed": round(sum(self.speed_samples) / len(self.speed_samples), 3) if self.speed_samples else None,
+            "min_speed": min(self.speed_samples) if self.speed_samples else None,
+            "slow_samples": self.slow_samples,
+            "warnings": dict(self.warnings),
+        }
+        issues = []
+        if data["drop_pct"] > DROP_ALERT_PCT or data["dup_frames"] > (frames * DROP_ALERT_PCT / 100):
+            issues.append("frames_perdidos")
+        if data["avg_fps"] is not None and data["avg_fps"] < self.expected_fps * 0.95:
+            issues.append("fps_baixo")
+        if self.slow_samples:
+            issues.append("abaixo_tempo_real")
+        if any(self.warnings.values()):
+            issues.append("avisos_ffmpeg")
+        data["issues"] = issues
+        return data
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
 def main():
     clear_old_record_pid()
 
@@ -111,18 +287,51 @@ def main():
         day = DIAS_SEMANA[datetime.datetime.now().strftime("%A").lower()]
 
     duration_secs = args.duration
+
+    # Controle térmico (00agenda): no degrau mais alto a gravação sai com fps reduzido
+    thermal_level = thermal.current_level()
+    if thermal_level >= thermal.LEVEL_ENCODER_REDUCED and args.fps > thermal.REDUCED_FPS:
+        print(f"🌡️ Equipamento quente: gravando a {thermal.REDUCED_FPS} fps em vez de {args.fps}")
+        args.fps = thermal.REDUCED_FPS
+
+    # Tier de gravação pela vazão de escrita medida (SD x HDD USB)
+    output_dir = storage.pick_recording_dir(args.bitrate, duration_secs)
+
+    # Prévia em baixo bitrate do mesmo quadro cortado (fora no degrau térmico mais alto)
+    make_proxy = proxy.PROXY_ENABLED and thermal_level < thermal.LEVEL_ENCODER_REDUCED
+
+    # Admissão: o arquivo previsto (bitrate × duração) precisa caber no disco
+    needed = storage.forecast_bytes(args.bitrate, duration_secs)
+    admitted, free = storage.admit(output_dir, needed + (proxy.forecast_bytes(duration_secs) if make_proxy else 0))
+    if not admitted and make_proxy:
+        # pouco espaço: a gravação completa tem prioridade sobre a prévia
+        print("⚠️ Sem espaço para a prévia; gravando só a versão completa.")
+        make_proxy = False
+        admitted, free = storage.admit(output_dir, needed)
+    if not admitted:
+        fits = storage.fit_duration(args.bitrate, free)
+        print(f"⚠️ Espaço insuficiente: previsto {needed / 1e9:.2f} GB, livre {free / 1e9:.2f} GB "
+              f"(reserva {storage.RESERVE_BYTES / 1e9:.2f} GB).")
+        if fits < MIN_RECORD_SEC:
+            print("❌ Gravação não admitida: disco cheio e nada elegível para a retenção.")
+            sys.exit(1)
+        print(f"✂️ Gravação reduzida para {fits}s para não encher o disco.")
+        duration_secs = fits
     duration_min = duration_secs / 60
 
-    now = datetime.datetime.now()
+    gated = args.start_at > time.time() + 1
+    now = datetime.datetime.fromtimestamp(args.start_at) if gated else datetime.datetime.now()
     filename = (
         f"{now.strftime('%Y_%m_%d___%H_%M')}___"
         f"{customer}_{equipment}_{day}_{duration_min:.1f}min.mp4"
     )
-    output_path = os.path.join(OUTPUT_DIR, filename)
+    output_path = os.path.join(output_dir, filename)
 
     print(f"🎬 v4record iniciado | CUSTOMER={customer} | EQUIPMENT={equipment} | DAY={day} | args={args}")
 
     device = detect_usb_camera()
+    # microfone da própria câmera (mesmo pai USB), estável entre reboots
+    audio = devices.audio_for(device, fallback="hw:3,0")
 
     crop_top = args.crop_top
     crop_bottom = args.crop_bottom
@@ -153,25 +362,52 @@ def main():
         f"[right]crop={right_width}:{crop_height}:{right_x}:{crop_top}[right_crop];"
         f"[left_crop][right_crop]hstack=inputs=2[out]"
     )
+    audio_filter = "volume=5.0,aresample=async=1:min_hard_comp=0.100:first_pts=0"
+    wallclock = []
+    if gated:
+        # com timestamps de relógio (-copyts), trim/atrim descartam o que chega antes do slot
+        start, end = args.start_at, args.start_at + duration_secs
+        filter_complex = f"[0:v]trim=start={start:.3f}:end={end:.3f},setpts=PTS-STARTPTS," + filter_complex[len("[0:v]"):]
+        audio_filter = f"atrim=start={start:.3f}:end={end:.3f},asetpts=PTS-STARTPTS," + audio_filter
+        wallclock = ["-use_wallclock_as_timestamps", "1"]
+
+    live = bool(args.stream_key)
+    analysis = frame_faults.available()
+    branches = ["out"] + (["live"] if live else []) + (["proxy"] if make_proxy else []) + (["an"] if analysis else [])
+    if len(branches) > 1:
+        # corte feito uma vez; o quadro cortado vai para cada saída
+        filter_complex = filter_complex.replace(
+            "hstack=inputs=2[out]", f"hstack=inputs=2,split={len(branches)}" + "".join(f"[{b}]" for b in branches))
+    if analysis:
+        # 1 fps reduzido em cinza para a detecção de falhas (preto/congelado/obstruída)
+        an_w, an_h, an_split = frame_faults.analysis_geometry(left_width, right_width, crop_height)
+        filter_complex += ";" + frame_faults.analysis_filter("an", "an_gray", an_w, an_h)
+    else:
+        print("ℹ️ NumPy indisponível: gravação sem detecção de falhas de imagem.")
+    if make_proxy:
+        filter_complex += ";" + proxy.proxy_filter("proxy", "proxy_s")
 
     ffmpeg_cmd = [
         "ffmpeg",
+        # relatório de progresso (1º quadro, fps, dup/drop, speed)
+        "-progress", "pipe:1", "-nostats",
+    ] + (["-copyts"] if gated else []) + [
         # entrada vídeo
-        "-thread_queue_size", "1024", "-f", "v4l2",
+        "-thread_queue_size", "1024", "-f", "v4l2", *wallclock,
         "-framerate", str(args.fps), "-video_size", args.resolution, "-input_format", "mjpeg",
         "-i", device,
 
         # entrada áudio (buffer maior)
-        "-thread_queue_size", "8192", "-f", "alsa",
-        "-channels", "1", "-sample_fmt", "s16", "-ar", "44100",
-        "-i", "hw:3,0",
+        "-thread_queue_size", "8192", "-f", "alsa", *wallclock,
+        "-channels", str(audio["channels"] or 1), "-sample_fmt", "s16", "-ar", str(audio["rate"] or 44100),
+        "-i", audio["device"],
 
         # duração
         "-t", str(duration_secs),
 
         # filtros de vídeo + áudio
         "-filter_complex", filter_complex,
-        "-filter:a", "volume=5.0,aresample=async=1:min_hard_comp=0.100:first_pts=0",
+        "-filter:a", audio_filter,
 
         # mapear vídeo processado + áudio
         "-map", "[out]", "-map", "1:a",
@@ -185,16 +421,79 @@ def main():
         "-c:v", "mpeg4", "-b:v", args.bitrate,
         "-c:a", "aac", "-b:a", "128k",
 
-        "-y", output_path
+        # grava em .part; o rename para .mp4 (após validar as caixas) sinaliza arquivo fechado
+        "-f", "mp4", "-y", file_ready.partial_path(output_path)
     ]
+    mp4_flags = ["-movflags", "+frag_keyframe+empty_moov+default_base_moof",
+                 "-min_frag_duration", str(FRAGMENT_USEC)] if FRAGMENTED else []
+    ffmpeg_cmd[-4:-4] = mp4_flags
+    proxy_output = proxy.proxy_path(output_path)
+    if make_proxy:
+        # saída extra do mesmo processo: sem segunda captura nem segundo corte
+        ffmpeg_cmd += (
+            ["-t", str(duration_secs)]
+            + proxy.output_args("proxy_s", "1:a", audio_filter)
+            + mp4_flags
+            + ["-f", "mp4", "-y", file_ready.partial_path(proxy_output)]
+        )
+        print(f"🔹 Prévia: {proxy.PROXY_HEIGHT}p {proxy.PROXY_FPS} fps @ {proxy.PROXY_BITRATE} -> "
+              f"{os.path.basename(proxy_output)}")
+    if live:
+        # segunda saída do mesmo processo: H.264 no bitrate da transmissão.
+        # tee com onfail=ignore: se o RTMP cair, a gravação continua. use_fifo põe o
+        # RTMP numa fila própria: peer lento descarta pacotes da live em vez de
+        # segurar o processo (e com ele o arquivo); attempt_recovery reconecta.
+        stream_url = f"{RTMP_BASE_URL}/{args.stream_key}"
+        # o ":" entre opções do fifo passa por dois níveis de unescape (tee, depois fifo_options)
+        tee_slave = ("f=flv:onfail=ignore:use_fifo=1:"
+                     "fifo_options=drop_pkts_on_overflow=1\\\\:attempt_recovery=1")
+        ffmpeg_cmd += [
+            "-t", str(duration_secs),
+            "-map", "[live]", "-map", "1:a",
+            "-filter:a", audio_filter,
+            "-c:v", "libx264", "-preset", "ultrafast", "-tune", "zerolatency", "-pix_fmt", "yuv420p",
+            "-b:v", args.stream_bitrate, "-maxrate", args.stream_bitrate, "-bufsize", args.stream_bitrate,
+            "-g", str(args.fps * 2),
+            "-c:a", "aac", "-b:a", "128k", "-ar", "44100",
+            "-flags", "+global_header",
+            "-f", "tee", f"[{tee_slave}]{stream_url}"
+        ]
+        print(f"📡 Transmitindo ao vivo a mesma captura @ {args.stream_bitrate}")
+    an_read = None
+    if analysis:
+        an_read, an_write = os.pipe()
+        ffmpeg_cmd += [
+            "-t", str(duration_secs),
+            "-map", "[an_gray]", "-f", "rawvideo", "-pix_fmt", "gray", f"pipe:{an_write}"
+        ]
 
     print(f"🎥 Recording for {duration_secs}s to: {output_path}")
     with open(RECORD_PID_FILE, 'w') as f:
         f.write(str(os.getpid()))
 
-    process = subprocess.Popen(ffmpeg_cmd, stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+    if gated:
+        warm_at = args.start_at - PREWARM_SEC
+        if warm_at > time.time():
+            print(f"⏳ Aguardando {warm_at - time.time():.0f}s para pré-aquecer a câmera ({PREWARM_SEC}s antes do slot)")
+            time.sleep(warm_at - time.time())
+
+    launched_at = time.time()
+    process = subprocess.Popen(ffmpeg_cmd, stderr=subprocess.PIPE, stdout=subprocess.PIPE,
+                               text=True, errors="replace", pass_fds=(an_write,) if analysis else ())
+    health = RecordingHealth(args.fps)
+    detector = None
+    if analysis:
+        os.close(an_write)  # só o ffmpeg escreve; o EOF chega quando ele sair
+        detector = frame_faults.FrameFaultDetector(
+            an_w, an_h, an_split, on_fault=health.fault,
+            context={"slot_id": os.environ.get("SLOT_ID", ""), "filename": filename})
+        analyzer = threading.Thread(target=detector.run, args=(an_read,), daemon=True)
+        analyzer.start()
+    reader = threading.Thread(target=health.watch_progress, args=(process.stdout,), daemon=True)
+    reader.start()
+    threading.Thread(target=health.watch_stderr, args=(process.stderr,), daemon=True).start()
     try:
-        process.wait(timeout=duration_secs + 5)
+        process.wait(timeout=duration_secs + 5 + max(0, args.start_at - launched_at))
     except subprocess.TimeoutExpired:
         print("⚠️ FFmpeg não finalizou no tempo esperado, forçando encerramento...")
         process.terminate()
@@ -203,9 +502,95 @@ def main():
         except subprocess.TimeoutExpired:
             process.kill()
 
-    if not os.path.exists(output_path):
+    print(f"🏁 FFmpeg saiu com código {process.returncode}")
+    reader.join(timeout=2)
+    scheduled = args.start_at if gated else launched_at
+    first_frame = health.first_frame_at
+    start_offset = round(first_frame - scheduled, 3) if first_frame else None
+    if first_frame:
+        print(f"⏱️ 1º quadro gravado {start_offset:+.2f}s em relação ao {'agendado' if gated else 'disparo'}")
+    metrics.emit(
+        "recording_start",
+        slot_id=os.environ.get("SLOT_ID", ""),
+        gated=gated,
+        scheduled=datetime.datetime.fromtimestamp(scheduled).isoformat(timespec="milliseconds"),
+        first_frame_offset_sec=start_offset,
+        warmup_sec=round(scheduled - launched_at, 1) if gated else 0,
+    )
+    recording_health = health.summary()
+    if detector is not None:
+        analyzer.join(timeout=2)
+        recording_health["image"] = detector.summary()
+        if detector.faults:
+            recording_health["issues"].append("falha_de_imagem")
+    print(f"🩺 Saúde: {recording_health['frames']} quadros, drop {recording_health['drop_frames']} "
+          f"({recording_health['drop_pct']}%), dup {recording_health['dup_frames']}, "
+          f"fps médio {recording_health['avg_fps']}, speed mín {recording_health['min_speed']}"
+          + (f" ⚠️ {', '.join(recording_health['issues'])}" if recording_health["issues"] else ""))
+    metrics.emit("recording_health", slot_id=os.environ.get("SLOT_ID", ""), filename=filename, **recording_health)
+    # valida as caixas do MP4 ainda como .part: só arquivo íntegro chega a ter o nome final
+    container = mp4check.check_partial(output_path)
+    if container["path"] is None:
         print("❌ Recording failed. File was not created.")
         return
+    media_path = container["path"]
+    output_path = container["final"]
+
+    # Sidecar com os dados reais do arquivo (probe no .part), escrito antes do rename:
+    # quando o .mp4 aparece na fila, upload/broadcast já acham os metadados
+    info = sidecar.probe(media_path)
+    meta = {
+        "filename": filename,
+        "customer": customer,
+        "equipment": equipment,
+        "day": day,
+        "slot_id": os.environ.get("SLOT_ID", ""),
+        "recorded_at": now.strftime("%Y-%m-%d %H:%M:%S"),
+        "requested_duration_sec": duration_secs,
+        "fps": args.fps,
+        "bitrate": args.bitrate,
+        "crop": {
+            "left_crop_left": lcl, "left_crop_right": lcr,
+            "right_crop_left": rcl, "right_crop_right": rcr,
+            "crop_top": crop_top, "crop_bottom": crop_bottom,
+        },
+        "audio_device": audio["device"],
+        "thermal_level": thermal_level,
+        "live_stream": live,
+        "first_frame_offset_sec": start_offset,
+        "health": recording_health,
+        "ffmpeg_returncode": process.returncode,
+        "container": {k: container[k] for k in ("status", "reason", "outcome")},
+        "size": os.path.getsize(media_path),
+    }
+    # prévia: validada depois da completa; sidecar escrito antes, rename por último
+    proxy_container = mp4check.check_partial(proxy_output) if make_proxy else None
+    proxy_meta = None
+    if proxy_container and proxy_container["outcome"] in ("ok", "repaired"):
+        proxy_file = proxy_container["path"]
+        proxy_meta = dict(meta, filename=os.path.basename(proxy_output), rendition="proxy",
+                          full_filename=filename, fps=proxy.PROXY_FPS, bitrate=proxy.PROXY_BITRATE,
+                          container={k: proxy_container[k] for k in ("status", "reason", "outcome")},
+                          size=os.path.getsize(proxy_file))
+        proxy_info = sidecar.probe(proxy_file)
+        if proxy_info:
+            proxy_meta.update(sidecar.probe_fields(proxy_info))
+        meta["proxy_filename"] = proxy_meta["filename"]
+    if info:
+        meta.update(sidecar.probe_fields(info))
+    else:
+        print("⚠️ ffprobe falhou no arquivo gravado; sidecar sem dados de mídia.")
+    sidecar.write(output_path, meta)
+    if media_path != output_path and container["outcome"] != "quarantined":
+        mp4check.publish(output_path)
+    if proxy_meta:
+        # por último: a prévia só entra na fila com o sidecar e a completa já resolvida
+        sidecar.write(proxy_output, proxy_meta)
+        mp4check.publish(proxy_output)
+        print(f"🔹 Prévia pronta: {proxy_meta['filename']} ({proxy_meta['size'] / 1e6:.1f} MB)")
+    if container["outcome"] == "quarantined":
+        print(f"❌ Gravação sem arquivo utilizável ({container['reason']}); mantida em quarentena.")
+        return
 
     print("✅ Recording completed.")
     print(f"FILENAME::{filename}")
@@ -6,12 +6,20 @@ import time
 from datetime import datetime, timedelta
 import gspread
 from google.oauth2.service_account import Credentials
-import shutil
 import sys
 import psutil
 import hashlib
+import json
 from contextlib import contextmanager
 from a07broadcast import get_agenda, get_current_window
+import upload_planner
+import dir_watch
+import transcode
+import sheets_journal
+import sidecar
+import storage
+import mp4check
+import proxy
 
 # =========================
 # Constantes / Paths
@@ -20,15 +28,16 @@ CREDENTIALS_PATH = "/xcoutfy/credentials.json"
 SHEET_NAME = "dbgravacoes"
 SHEET_REGISTERS = "registros"
 
-VIDEO_DIRS = ["/xcoutfy/recorded_videos", "/xcoutfy/storage_videos"]
+VIDEO_DIRS = storage.RECORDING_TIERS  # tiers de gravação (XC_STORAGE_TIERS)
 UPLOADED_DIR = "/xcoutfy/uploaded_videos"
 RCLONE_REMOTE = "xcoutfyvideos:xcvideos"
 
-UPLOAD_DELAY_SEC = 30  # mantém o buffer pra HDD/Drive
 LOCK_FILE = "/tmp/xcoutfy_upload.lock"
 PID_FILE = "/tmp/xcoutfy_upload.pid"
 LOG_FILE = "/xcoutfy/logs/02upload.log"
 
+MAX_VERIFY_RETRIES = 2  # reenvios por janela quando o checksum remoto não bate
+
 # Tolerâncias de janela FREE2UP
 GRACE_BEFORE_SEC = 90   # se faltar <= 90s pra janela abrir, espera e segue
 GRACE_AFTER_SEC  = 300  # se a janela abriu há <= 5min, ainda aceita
@@ -85,19 +94,21 @@ def clear_pid(pid_file):
     if os.path.exists(pid_file):
         os.remove(pid_file)
 
+_video_queue = None
+
+def get_video_queue():
+    """Fila inotify dos MP4 finalizados (fechados e estáveis) em VIDEO_DIRS."""
+    global _video_queue
+    if _video_queue is None:
+        _video_queue = dir_watch.DirQueue(VIDEO_DIRS, ".mp4")
+    return _video_queue
+
 def get_mp4_files():
-    """Coleta vídeos MP4 de diretórios configurados."""
-    all_files = []
-    for d in VIDEO_DIRS:
-        if not os.path.exists(d):
-            continue
-        for f in os.listdir(d):
-            if f.endswith(".mp4"):
-                all_files.append(os.path.join(d, f))
-    return all_files
+    """Coleta vídeos MP4 finalizados dos diretórios configurados, do mais antigo ao mais novo."""
+    return get_video_queue().snapshot()
 
 def file_hash(path):
-    """Hash MD5 para evitar uploads duplicados."""
+    """Hash MD5 para evitar uploads duplicados (reaproveitado na verificação pós-upload)."""
     h = hashlib.md5()
     with open(path, "rb") as f:
         while True:
@@ -155,7 +166,7 @@ def ensure_free2up_window():
     Garante que estamos numa janela FREE2UP, com tolerância:
       - Se faltar <= GRACE_BEFORE_SEC para iniciar, espera até abrir.
       - Se já abriu há <= GRACE_AFTER_SEC, segue mesmo assim.
-    Retorna True se pode seguir; False caso contrário.
+    Retorna o fim da janela (datetime) se pode seguir; None caso contrário.
     """
     try:
         agenda, _ = get_agenda()
@@ -165,9 +176,11 @@ def ensure_free2up_window():
         print(f"⚠️ Erro ao buscar agenda: {e}")
         agenda, window = None, None
 
-    # Compatibilidade com tupla
+    # Compatibilidade com tupla (janela, fim)
+    window_end = None
     if isinstance(window, tuple):
         try:
+            window_end = window[1] if len(window) > 1 else None
             window = window[0] if len(window) > 0 else {}
         except Exception:
             window = {}
@@ -177,13 +190,13 @@ def ensure_free2up_window():
     # 1) Se já veio uma janela ativa e for FREE2UP, segue
     if isinstance(window, dict) and str(window.get("type", "")).lower() == "free2up":
         print("✅ Janela FREE2UP ativa (via get_current_window).")
-        return True
+        return window_end or (now + timedelta(seconds=GRACE_AFTER_SEC))
 
     # 2) Descobrir próxima janela do dia e aplicar tolerâncias
     start_end = _find_upcoming_free2up(agenda or [])
     if not start_end:
         print("⏹️ Nenhuma janela FREE2UP encontrada para hoje. Encerrando.")
-        return False
+        return None
 
     start, end = start_end
     if now < start:
@@ -192,38 +205,45 @@ def ensure_free2up_window():
             print(f"⏳ Janela FREE2UP começa em {int(delta)}s. Aguardando abertura...")
             time.sleep(max(1, int(delta)))
             print("🟢 Janela aberta. Seguindo.")
-            return True
+            return end
         else:
             print(f"⏹️ Janela FREE2UP ainda demora ({int(delta)}s). Encerrando.")
-            return False
+            return None
     elif now > end:
         # passou, mas dá uma folga
         delta_end = (now - end).total_seconds()
         if delta_end <= GRACE_AFTER_SEC:
             print(f"🟡 Janela FREE2UP acabou há {int(delta_end)}s, mas dentro da tolerância. Seguindo.")
-            return True
+            return end + timedelta(seconds=GRACE_AFTER_SEC)
         else:
             print(f"⏹️ Janela FREE2UP encerrada há {int(delta_end)}s. Encerrando.")
-            return False
+            return None
     else:
         # dentro do intervalo
         print("✅ Dentro da janela FREE2UP.")
-        return True
+        return end
 
 # ---------- Upload + Link ----------
-def upload_to_drive(filepath):
-    """Faz upload via rclone e retorna o link público."""
+def upload_to_drive(filepath, force=False):
+    """
+    Faz upload via rclone e retorna o link público (None se o copy falhar).
+    force=True (reenvio após falha na verificação): compara por checksum, não
+    por tamanho+data, senão o rclone pula o remoto corrompido de mesmo tamanho.
+    """
     filename = os.path.basename(filepath)
     remote_path = f"{RCLONE_REMOTE}/{filename}"
-    print(f"☁️ Enviando {filename} para {remote_path} ...")
+    print(f"☁️ Enviando {filename} para {remote_path}{' (reenvio por checksum)' if force else ''} ...")
 
     result = subprocess.run(
-        ["rclone", "copy", filepath, RCLONE_REMOTE, "--progress"],
+        ["rclone", "copy", filepath, RCLONE_REMOTE, "--progress"] + (["--checksum"] if force else []),
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
         text=True,
     )
     print(result.stdout)
+    if result.returncode != 0:
+        print(f"❌ rclone copy falhou (código {result.returncode}) para {filename}")
+        return None
 
     # Gera link público
     try:
@@ -239,6 +259,36 @@ def upload_to_drive(filepath):
         link = "N/A"
     return link
 
+def verify_remote(filepath, local_md5):
+    """
+    Confere o arquivo remoto pelo MD5 que o Drive já guarda (rclone lsjson --hash),
+    comparando com o hash local calculado antes do upload — sem reler o arquivo.
+    Retorna (ok, motivo).
+    """
+    filename = os.path.basename(filepath)
+    try:
+        out = subprocess.run(
+            ["rclone", "lsjson", "--hash", "--hash-type", "md5", "--files-only", f"{RCLONE_REMOTE}/{filename}"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=120,
+        )
+        entries = json.loads(out.stdout or "[]") if out.returncode == 0 else []
+    except Exception as e:
+        return False, f"lsjson falhou: {e}"
+    if not entries:
+        return False, "arquivo não encontrado no remoto"
+    remote = entries[0]
+    if int(remote.get("Size", -1)) != os.path.getsize(filepath):
+        return False, f"tamanho difere (remoto {remote.get('Size')})"
+    remote_md5 = (remote.get("Hashes") or {}).get("md5", "")
+    if not remote_md5:
+        return True, "remoto sem MD5; conferido só o tamanho"
+    if remote_md5.lower() != local_md5.lower():
+        return False, f"MD5 difere (remoto {remote_md5})"
+    return True, "MD5 confere"
+
 # ---------- Registro por cabeçalho ----------
 def _parse_from_filename(filename):
     """
@@ -264,89 +314,42 @@ def _parse_from_filename(filename):
 
 
 
-def register_on_sheet(sheet_client, filename, drive_link):
+def _metadata_for(filename, meta=None):
+    """cliente, equipamento, dia, duração: do sidecar gravado pelo 01v4record; nome do arquivo como fallback."""
+    if meta and meta.get("customer"):
+        duration_sec = meta.get("duration_sec", meta.get("requested_duration_sec", 0)) or 0
+        return meta.get("customer", ""), meta.get("equipment", ""), meta.get("day", ""), f"{float(duration_sec) / 60:.1f}min"
+    return _parse_from_filename(filename)
+
+def register_on_sheet(sheet_client, filename, drive_link, meta=None, status="uploaded"):
     """
-    Lê a primeira linha (cabeçalho) e preenche por nome de coluna.
-    Suporta diretamente os headers:
+    Grava o registro no diário local (sheets_journal) e tenta sincronizar.
+    A linha é montada por nome de coluna no flush, suportando os headers:
       timestamp, duration, customer, local, equipment, day,
       filename, drive_link, youtube_link, status, notes
-    Mantém compatibilidade com sinônimos usados em versões antigas.
+    e os sinônimos usados em versões antigas. Se o Sheets estiver fora,
+    o registro fica no diário e é reenviado depois (00agenda / drive_reg_sync).
     """
+    customer, equipment, day_name, duration = _metadata_for(filename, meta)
+    sheets_journal.enqueue(
+        sheets_journal.OP_REGISTRO, filename,
+        timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        duration=duration,
+        customer=customer,
+        local="",
+        equipment=equipment,
+        day=day_name,
+        drive_link=drive_link,
+        youtube_link="",   # ainda não temos aqui
+        status=status,
+        notes="prévia em baixa resolução" if status == "preview" else "",
+        host=os.uname()[1],
+    )
     try:
-        sheet = sheet_client.open(SHEET_NAME).worksheet(SHEET_REGISTERS)
-        header = sheet.row_values(1)
-        if not header:
-            # Fallback simples se não houver cabeçalho
-            sheet.append_row([datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                              filename, drive_link, os.uname()[1]])
-            print(f"📊 Registro adicionado (fallback) para {filename}")
-            return
-
-        # ====== dados vindos do arquivo ======
-        now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        customer, equipment, day_name, duration = _parse_from_filename(filename)
-        host = os.uname()[1]
-        status = "uploaded"
-        youtube_link = ""   # ainda não temos aqui
-        notes = ""          # opcional
-
-        # ====== mapa por nomes de coluna ======
-        # Mapeia tanto os nomes "oficiais" quanto sinônimos comuns
-        candidates = {
-            # timestamp
-            "timestamp": now_str, "data_hora": now_str, "datahora": now_str, "data": now_str,
-
-            # duration
-            "duration": duration, "duracao": duration,
-
-            # customer
-            "customer": customer, "cliente": customer,
-
-            # local (deixa vazio por enquanto; pode preencher com site/campo se tiver)
-            "local": "",
-
-            # equipment
-            "equipment": equipment, "equipamento": equipment, "eqp": equipment,
-
-            # day
-            "day": day_name, "dia_semana": day_name, "weekday": day_name, "dia": day_name,
-
-            # filename
-            "filename": filename, "arquivo": filename, "file": filename,
-
-            # drive_link
-            "drive_link": drive_link, "link": drive_link, "url": drive_link,
-
-            # youtube_link
-            "youtube_link": youtube_link, "yt_link": youtube_link,
-
-            # status
-            "status": status,
-
-            # notes
-            "notes": notes, "observacoes": notes,
-
-            # host/pc
-            "host": host, "pc": host, "hostname": host,
-        }
-
-        # monta a linha respeitando a ordem real do cabeçalho
-        row = []
-        for col in header:
-            key = col.strip().lower()
-            row.append(candidates.get(key, ""))
-
-        sheet.append_row(row)
-        print(f"📊 Registro adicionado para {filename}")
+        sheets_journal.flush(client=sheet_client)
+        print(f"📊 Registro enviado/enfileirado para {filename}")
     except Exception as e:
-        print(f"⚠️ Falha ao registrar no Sheets: {e}")
-
-
-
-
-
-
-
+        print(f"⚠️ Registro de {filename} mantido no diário: {e}")
 
 
 # =========================
@@ -359,16 +362,14 @@ def main():
 
     with file_lock(LOCK_FILE):
         # Janela com tolerância (espera se estiver prestes a abrir)
-        if not ensure_free2up_window():
+        window_end = ensure_free2up_window()
+        if not window_end:
             print("⏹️ Nenhuma janela FREE2UP ativa (ou fora da tolerância). Encerrando.")
             clear_pid(PID_FILE)
             return
 
         print("✅ Janela FREE2UP confirmada. Iniciando uploads...")
 
-        time.sleep(UPLOAD_DELAY_SEC)
-        print(f"⏳ Aguardado {UPLOAD_DELAY_SEC}s antes de iniciar uploads...")
-
         files = get_mp4_files()
         if not files:
             print("📭 Nenhum vídeo para enviar.")
@@ -376,18 +377,91 @@ def main():
             return
 
         print(f"🎞️ {len(files)} vídeo(s) encontrado(s). Conectando ao Sheets...")
-        client = connect_sheets()
-
+        try:
+            client = connect_sheets()
+        except Exception as e:
+            # sem Sheets os registros ficam no diário local; o upload segue
+            print(f"⚠️ Sheets indisponível agora ({e}). Registros irão para o diário.")
+            client = None
+
+        # Plano inicial: o que cabe no restante da janela pela vazão medida
+        bps = upload_planner.load_throughput()
+        report = upload_planner.WindowReport(window_end, bps)
+        seconds_left = (window_end - datetime.now()).total_seconds()
+        plan = upload_planner.plan_uploads(files, seconds_left, bps)
+        report.set_plan(plan, len(files))
+        print(f"🧮 Plano: {len(plan)}/{len(files)} vídeo(s) cabem nos {int(seconds_left)}s restantes "
+              f"(uplink estimado {bps * 8 / 1e6:.2f} Mbit/s).")
+
+        upload_planner.clear_deferred()
         uploaded_hashes = set()
-        for f in files:
+        attempted = set()
+        verify_failures = {}
+        while True:
+            # Inclui vídeos que ficaram prontos durante a janela
+            pending = [p for p in get_mp4_files() if p not in attempted]
+            if not pending:
+                break
+            # Replaneja a cada arquivo com o tempo restante e a vazão atualizada
+            seconds_left = (window_end - datetime.now()).total_seconds()
+            plan = upload_planner.plan_uploads(pending, seconds_left, upload_planner.load_throughput())
+            if not plan:
+                print(f"⏹️ {len(pending)} vídeo(s) não cabem nos {int(max(0, seconds_left))}s restantes. Ficam para a próxima janela.")
+                upload_planner.save_deferred(get_mp4_files(), window_end)
+                break
+            item = plan[0]
+            f = item["path"]
+            attempted.add(f)
+
+            # MP4 sem moov/truncado não gasta banda da janela: remux ou quarentena
+            if not mp4check.ensure_valid(f):
+                get_video_queue().discard(f)
+                continue
+
             h = file_hash(f)
-            if h in uploaded_hashes:
+            if h in uploaded_hashes and f not in verify_failures:
                 print(f"⚠️ Arquivo duplicado detectado: {f}")
                 continue
             uploaded_hashes.add(h)
 
-            link = upload_to_drive(f)
-            register_on_sheet(client, os.path.basename(f), link)
+            t0 = time.time()
+            link = upload_to_drive(f, force=f in verify_failures)
+            elapsed = time.time() - t0
+            if link is None:
+                report.record(item, elapsed, False, transcode.saved_bytes(f))
+                continue
+
+            # Verificação de integridade: MD5 remoto x hash local já calculado
+            t1 = time.time()
+            verified, reason = verify_remote(f, h)
+            verify_sec = time.time() - t1
+            report.record(item, elapsed, verified, transcode.saved_bytes(f),
+                          verify_sec=verify_sec, verify_failed=not verified)
+            if not verified:
+                verify_failures[f] = verify_failures.get(f, 0) + 1
+                print(f"❌ Verificação falhou para {os.path.basename(f)}: {reason}")
+                if verify_failures[f] <= MAX_VERIFY_RETRIES:
+                    print(f"🔁 Reenfileirado ({verify_failures[f]}/{MAX_VERIFY_RETRIES}).")
+                    attempted.discard(f)
+                continue
+            print(f"🔒 Verificado: {os.path.basename(f)} ({reason}, {verify_sec:.1f}s)")
+            # prova para a retenção (storage.py) de que a cópia no Drive confere
+            sidecar.update(f, remote_verified=True, md5=h, drive_link=link,
+                           uploaded_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            upload_planner.update_throughput(item["size"], elapsed)
+            if proxy.is_proxy(f):
+                # prévia já está no Drive e não vai para broadcast: sai do disco
+                register_on_sheet(client, os.path.basename(f), link, sidecar.read(f), status="preview")
+                try:
+                    os.remove(f)
+                    if os.path.exists(sidecar.sidecar_path(f)):
+                        os.remove(sidecar.sidecar_path(f))
+                    get_video_queue().discard(f)
+                    print(f"🔹 Prévia enviada e removida do disco: {os.path.basename(f)}")
+                except OSError as e:
+                    print(f"⚠️ Falha ao remover prévia: {e}")
+                continue
+            register_on_sheet(client, os.path.basename(f), link, sidecar.read(f))
 
             # Move o arquivo para uploaded_videos
             os.makedirs(UPLOADED_DIR, exist_ok=True)
@@ -395,11 +469,13 @@ def main():
                 UPLOADED_DIR, os.path.basename(f).replace(".mp4", ".uploaded")
             )
             try:
-                shutil.move(f, dest)
+                sidecar.move_with_media(f, dest)
+                get_video_queue().discard(f)
                 print(f"📦 Movido para {dest}")
             except Exception as e:
                 print(f"⚠️ Falha ao mover arquivo: {e}")
 
+        report.log()
         print("✅ Todos os uploads finalizados.")
         clear_pid(PID_FILE)
 
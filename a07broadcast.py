@@ -1,13 +1,20 @@
 #!/usr/bin/env python3
 # === a07broadcast.py (com retry/backoff no get_agenda) ===
 import os
+import json
 import time
 import subprocess
+from collections import deque
 from datetime import datetime, timedelta
 import gspread
 from google.oauth2.service_account import Credentials
-import shutil
 import logging
+import dir_watch
+import sheets_journal
+import transcode
+import sidecar
+import metrics
+import storage
 
 # === CONFIGURATION ===
 CREDENTIALS_PATH = "/xcoutfy/credentials.json"
@@ -17,10 +24,34 @@ AGENDA_TAB = "agenda"
 UPLOADED_DIR = "/xcoutfy/uploaded_videos"
 DONE_DIR = "/xcoutfy/broadcastdone"
 LOG_FILE = "/xcoutfy/logs/a07broadcast.log"
-WAIT_AFTER_STREAM_SEC = 120  # Tempo (em segundos) para esperar entre transmissões
+WAIT_AFTER_STREAM_SEC = 120  # Tempo (em segundos) para esperar entre transmissões (modo por vídeo)
+# Playlist: todos os vídeos que cabem na janela, em sequência, numa única sessão RTMP
+PLAYLIST_MODE = os.getenv("XC_BROADCAST_PLAYLIST", "1") == "1"
+PLAYLIST_PATH = "/tmp/xcoutfy_broadcast_playlist.ffconcat"
+# Destino RTMP; tools/rtmp_sink.py aponta para um receptor local
+RTMP_BASE_URL = os.getenv("XC_RTMP_BASE_URL", "rtmp://a.rtmp.youtube.com/live2").rstrip("/")
+PLAYLIST_MARGIN_SEC = 30       # folga para conexão RTMP/arredondamentos
+# Seleção que preenche a janela (mochila por duração, com peso por idade)
+AGE_WEIGHT_PER_DAY = 0.1       # cada dia de espera vale +10% na escolha
+PACK_BUCKET_SEC = 10
+PACK_MAX_CANDIDATES = 50
+# Saúde do broadcast: degraus de bitrate abaixo do primeiro (copy/encode padrão) e limites;
+# só entram na sessão os degraus abaixo do bitrate da fonte (ver bitrate_ladder)
+BITRATE_STEPS = ["2500k", "1500k", "800k"]
+# speed= do ffmpeg é acumulado desde o início (conexão RTMP, latência do x264): fica
+# em 0.98x–0.999x por minutos numa sessão saudável. Julgamos Δsaída/Δrelógio na janela.
+SLOW_SPEED = 0.95
+SPEED_WINDOW_SEC = 5
+SLOW_SUSTAIN_SEC = 20
+SLOW_WARMUP_SEC = 10
+MAX_STREAM_RESTARTS = 6
+HEALTH_DIR = os.getenv("XC_BROADCAST_HEALTH_DIR", "/xcoutfy/logs/broadcast_health")
 
 # === LOGGING ===
-logging.basicConfig(filename=LOG_FILE, level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
+# configurado em main(): importar o módulo (02upload, tools/) não pode exigir /xcoutfy/logs
+def setup_logging():
+    os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+    logging.basicConfig(filename=LOG_FILE, level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
 
 # === PATCH START: função de retry/backoff para chamadas ao Sheets ===
 def safe_get_all_records(client, sheet_name, tab_name, retries=5):
@@ -73,20 +104,280 @@ def get_current_window(agenda):
     return None, None
 
 
+_uploaded_queue = None
+
+def get_uploaded_queue():
+    """Fila inotify dos .uploaded, criada só por quem transmite."""
+    global _uploaded_queue
+    if _uploaded_queue is None:
+        _uploaded_queue = dir_watch.DirQueue([UPLOADED_DIR], ".uploaded")
+    return _uploaded_queue
+
+
 def get_oldest_uploaded():
-    files = sorted([f for f in os.listdir(UPLOADED_DIR) if f.endswith(".uploaded")])
-    return files[0] if files else None
+    oldest = get_uploaded_queue().next_item()
+    return os.path.basename(oldest) if oldest else None
 
 
-def stream_video(video_path, rtmp_key):
-    ffmpeg_cmd = [
+def build_stream_cmd(video_path, rtmp_url, copy, bitrate=None):
+    """
+    copy=True: asset já H.264+AAC (transcode.py), só remux para FLV; senão encoda
+    em tempo real. bitrate (ex.: "1500k") limita o encode — degraus de bitrate_ladder().
+    """
+    if copy:
+        return [
+            "ffmpeg", "-re", "-i", video_path,
+            "-c", "copy",
+            "-f", "flv", rtmp_url
+        ]
+    rate = []
+    if bitrate:
+        kbps = int(bitrate.rstrip("kK"))
+        rate = ["-b:v", bitrate, "-maxrate", bitrate, "-bufsize", f"{kbps * 2}k"]
+    return [
         "ffmpeg", "-re", "-i", video_path,
         "-f", "lavfi", "-i", "anullsrc=r=44100:cl=mono",
         "-shortest", "-c:v", "libx264", "-preset", "veryfast",
+    ] + rate + [
         "-c:a", "aac", "-b:a", "128k",
-        "-f", "flv", f"rtmp://a.rtmp.youtube.com/live2/{rtmp_key}"
+        "-f", "flv", rtmp_url
     ]
-    return subprocess.run(ffmpeg_cmd).returncode == 0
+
+
+def stream_video(video_path, rtmp_key):
+    """Um vídeo só: playlist de um item, com o mesmo monitoramento de saúde."""
+    item = (os.path.basename(video_path), video_path, probe_duration(video_path))
+    return stream_playlist([item], f"{RTMP_BASE_URL}/{rtmp_key}", lambda _f: None)
+
+
+def probe_duration(video_path):
+    """Duração em segundos (float, sem truncar), do sidecar (ffprobe só se faltar); levanta exceção se falhar."""
+    info = sidecar.media_info(video_path)
+    if not info:
+        raise RuntimeError("sem sidecar e ffprobe falhou")
+    return float(info["duration"])
+
+
+def build_playlist_cmd(playlist_path, rtmp_url, copy, bitrate=None):
+    """Mesmo pipeline do build_stream_cmd, lendo a lista pelo concat demuxer e reportando -progress."""
+    cmd = build_stream_cmd(playlist_path, rtmp_url, copy, bitrate)
+    i = cmd.index("-i")
+    return cmd[:i] + ["-f", "concat", "-safe", "0"] + cmd[i:-1] + ["-progress", "pipe:1", "-nostats", cmd[-1]]
+
+
+def write_playlist(items, playlist_path=PLAYLIST_PATH, inpoint=0.0):
+    """inpoint: segundos a pular no primeiro item (retomada após reconexão)."""
+    with open(playlist_path, "w", encoding="utf-8") as f:
+        f.write("ffconcat version 1.0\n")
+        for n, (_video_file, video_path, duration) in enumerate(items):
+            escaped = video_path.replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+            if n == 0 and inpoint > 0:
+                f.write(f"inpoint {inpoint:.3f}\n")
+                f.write(f"duration {max(0.0, duration - inpoint):.3f}\n")
+            else:
+                f.write(f"duration {duration:.3f}\n")
+
+
+# =========================
+# Saúde do broadcast (-progress)
+# =========================
+class BroadcastHealth(object):
+    """Amostras do -progress de uma sessão, gravadas em HEALTH_DIR/<sessão>.jsonl."""
+
+    def __init__(self):
+        os.makedirs(HEALTH_DIR, exist_ok=True)
+        self.session = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.path = os.path.join(HEALTH_DIR, f"{self.session}.jsonl")
+        self.speeds = []
+        self.drops = 0
+        self.slow_events = 0
+        self.restarts = 0
+        self.rungs = set()
+
+    def sample(self, **fields):
+        fields["ts"] = datetime.now().isoformat(timespec="seconds")
+        if fields.get("speed") is not None:
+            self.speeds.append(fields["speed"])
+        self.drops = max(self.drops, fields.get("drop_frames") or 0)
+        self.rungs.add(fields.get("rung", 0))
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(fields) + "\n")
+        except OSError:
+            pass
+
+    def summary(self, ok):
+        avg = sum(self.speeds) / len(self.speeds) if self.speeds else None
+        data = {
+            "session": self.session,
+            "ok": ok,
+            "samples": len(self.speeds),
+            "avg_speed": round(avg, 3) if avg else None,
+            "min_speed": min(self.speeds) if self.speeds else None,
+            "drop_frames": self.drops,
+            "slow_events": self.slow_events,
+            "restarts": self.restarts,
+            "max_rung": max(self.rungs) if self.rungs else 0,
+        }
+        logging.info(f"Saúde do broadcast: {data}")
+        metrics.emit("broadcast_session", **data)
+
+
+def _parse_speed(value):
+    try:
+        return float((value or "").strip().rstrip("x"))
+    except ValueError:
+        return None
+
+def _parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _interval_speed(window, out_sec):
+    """Δtempo de saída / Δrelógio nos últimos SPEED_WINDOW_SEC; None até a janela encher."""
+    now = time.time()
+    window.append((now, out_sec))
+    while len(window) > 1 and now - window[1][0] >= SPEED_WINDOW_SEC:
+        window.popleft()
+    then, then_out = window[0]
+    if now - then < SPEED_WINDOW_SEC:
+        return None
+    return round((out_sec - then_out) / (now - then), 3)
+
+
+def _source_bps(video_path):
+    """Bitrate médio do arquivo (tamanho × 8 / duração), do sidecar."""
+    sc = sidecar.read(video_path)
+    size = sc.get("size") or os.path.getsize(video_path)
+    duration = float(sc.get("duration_sec") or probe_duration(video_path))
+    return size * 8 / duration if duration > 0 else 0
+
+
+def bitrate_ladder(items):
+    """
+    Degraus da sessão: None (copy/encode padrão) seguido dos BITRATE_STEPS
+    abaixo do maior bitrate entre os itens. Um asset de 2M em copy nunca
+    "desce" para um encode de 2500k, que gastaria mais banda e CPU.
+    """
+    try:
+        source = max(_source_bps(p) for _f, p, _d in items)
+    except Exception as e:
+        logging.warning(f"Bitrate da fonte indisponível, usando todos os degraus: {e}")
+        return [None] + BITRATE_STEPS
+    return [None] + [b for b in BITRATE_STEPS if storage.parse_bitrate(b) < source]
+
+
+def _run_monitored(cmd, health, rung, on_position):
+    """
+    Roda o ffmpeg lendo o -progress. Retorna (status, out_sec): "ok", "failed"
+    (saiu com erro/RTMP caiu) ou "slow" (speed por intervalo < SLOW_SPEED por
+    SLOW_SUSTAIN_SEC, o ffmpeg é interrompido para trocar de degrau).
+    """
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    block, out_sec, slow_since = {}, 0.0, None
+    window = deque()   # (relógio, out_sec) dos últimos SPEED_WINDOW_SEC
+    for line in process.stdout:
+        key, _, value = line.strip().partition("=")
+        if key != "progress":
+            block[key] = value
+            continue
+        raw = block.get("out_time_us") or block.get("out_time_ms") or ""
+        if raw.lstrip("-").isdigit():
+            out_sec = max(0.0, int(raw) / 1_000_000)
+            on_position(out_sec)
+        speed = _interval_speed(window, out_sec) if out_sec > 0 else None
+        health.sample(rung=rung, out_sec=round(out_sec, 1), speed=speed,
+                      ffmpeg_speed=_parse_speed(block.get("speed")),
+                      fps=block.get("fps"), bitrate=block.get("bitrate"),
+                      drop_frames=_parse_int(block.get("drop_frames")),
+                      dup_frames=_parse_int(block.get("dup_frames")))
+        block = {}
+        if speed is not None and speed < SLOW_SPEED and out_sec > SLOW_WARMUP_SEC:
+            slow_since = slow_since or time.time()
+            if time.time() - slow_since >= SLOW_SUSTAIN_SEC:
+                health.slow_events += 1
+                logging.warning(f"Broadcast abaixo do tempo real (speed={speed}x nos últimos "
+                                f"{SPEED_WINDOW_SEC}s) por {SLOW_SUSTAIN_SEC}s")
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                return "slow", out_sec
+        else:
+            slow_since = None
+    return ("ok" if process.wait() == 0 else "failed"), out_sec
+
+
+def stream_playlist(items, rtmp_url, on_item_done):
+    """
+    Transmite items [(video_file, video_path, duração)] em sequência por uma
+    única conexão RTMP. on_item_done(video_file) é chamado quando o tempo de
+    saída do ffmpeg (-progress) passa do fim de cada item.
+    Se o envio ficar abaixo do tempo real, desce um degrau de bitrate_ladder();
+    se o RTMP cair, reconecta com backoff — ambos retomando do ponto atingido.
+    Retorna True se a playlist chegou ao fim.
+    """
+    infos = [sidecar.media_info(p) for _f, p, _d in items]
+    copy_ok = all(transcode.broadcast_compatible(i) for i in infos) and len(
+        {(i["width"], i["height"]) for i in infos}) == 1
+
+    boundaries = []
+    total = 0
+    for video_file, _p, duration in items:
+        total += duration
+        boundaries.append((total, video_file))
+
+    ladder = bitrate_ladder(items)
+    health = BroadcastHealth()
+    state = {"next_idx": 0, "base": 0.0}
+
+    def on_position(out_sec):
+        pos = state["base"] + out_sec
+        while state["next_idx"] < len(boundaries) and pos >= boundaries[state["next_idx"]][0] - 0.5:
+            on_item_done(boundaries[state["next_idx"]][1])
+            state["next_idx"] += 1
+
+    rung = 0
+    while True:
+        idx = state["next_idx"]
+        start_of_item = boundaries[idx - 1][0] if idx > 0 else 0
+        state["base"] = max(state["base"], start_of_item)
+        write_playlist(items[idx:], PLAYLIST_PATH, inpoint=state["base"] - start_of_item)
+        copy = copy_ok and rung == 0
+        bitrate = ladder[rung]
+        cmd = build_playlist_cmd(PLAYLIST_PATH, rtmp_url, copy, bitrate)
+        logging.info(f"Playlist: {len(items) - idx} vídeo(s) a partir de {state['base']:.0f}s, "
+                     f"modo {'copy' if copy else 'encode'}, bitrate {bitrate or 'padrão'}")
+
+        status, out_sec = _run_monitored(cmd, health, rung, on_position)
+        state["base"] += out_sec
+        if status == "ok":
+            # o último -progress pode chegar antes do fim exato do último item
+            while state["next_idx"] < len(boundaries):
+                on_item_done(boundaries[state["next_idx"]][1])
+                state["next_idx"] += 1
+            health.summary(True)
+            return True
+        if state["next_idx"] >= len(boundaries):
+            health.summary(True)
+            return True
+        if health.restarts >= MAX_STREAM_RESTARTS:
+            logging.error("Broadcast: limite de reconexões atingido.")
+            health.summary(False)
+            return False
+        health.restarts += 1
+        if status == "slow" and rung < len(ladder) - 1:
+            rung += 1
+            print(f"📉 Uplink lento: descendo para {ladder[rung]} e retomando em {state['base']:.0f}s")
+        else:
+            wait = min(60, 5 * 2 ** (health.restarts - 1))
+            print(f"🔌 RTMP caiu/instável: reconectando em {wait}s (tentativa {health.restarts}/{MAX_STREAM_RESTARTS})")
+            time.sleep(wait)
 
 
 def move_to_done(video_file):
@@ -94,21 +385,136 @@ def move_to_done(video_file):
         os.makedirs(DONE_DIR)
     src = os.path.join(UPLOADED_DIR, video_file)
     dst = os.path.join(DONE_DIR, video_file.replace(".uploaded", ".broadcasted"))
-    shutil.move(src, dst)
+    sidecar.move_with_media(src, dst)
+    sidecar.update(dst, broadcasted_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    if _uploaded_queue is not None:
+        _uploaded_queue.discard(src)
+
+
+def registro_filename(video_file):
+    """
+    Nome com que o 02upload gravou a linha na aba registros (basename do .mp4):
+    o filename do sidecar, ou "<stem>.mp4" se o sidecar não tiver.
+    """
+    for d in (DONE_DIR, UPLOADED_DIR):
+        name = sidecar.read(os.path.join(d, video_file)).get("filename")
+        if name:
+            return name
+    return os.path.splitext(video_file)[0] + ".mp4"
 
 
 def register_link(registros_sheet, video_file, yt_link):
-    registros = registros_sheet.get_all_records()
-    for idx, row in enumerate(registros, start=2):
-        if row.get("filename") == video_file.replace(".uploaded", ""):
-            headers = registros_sheet.row_values(1)
-            if "youtube_link" in headers:
-                col_index = headers.index("youtube_link") + 1
-                registros_sheet.update_cell(idx, col_index, yt_link)
+    """Enfileira o youtube_link no diário local e tenta sincronizar com a aba registros."""
+    filename = registro_filename(video_file)
+    sheets_journal.enqueue(sheets_journal.OP_YOUTUBE_LINK, filename, yt_link)
+    try:
+        sheets_journal.flush(worksheet=registros_sheet)
+    except Exception as e:
+        logging.warning(f"youtube_link de {filename} mantido no diário: {e}")
+
+
+def _age_days(video_path):
+    recorded_at = sidecar.read(video_path).get("recorded_at")
+    try:
+        ts = datetime.strptime(recorded_at, "%Y-%m-%d %H:%M:%S").timestamp()
+    except (TypeError, ValueError):
+        ts = os.path.getmtime(video_path)
+    return max(0.0, (time.time() - ts) / 86400)
+
+
+def pack_window(candidates, capacity_sec):
+    """
+    Mochila 0/1 sobre candidates [(video_file, video_path, duração, peso)]:
+    maximiza soma(duração × peso) com soma(duração) <= capacity_sec.
+    Durações arredondadas para cima em PACK_BUCKET_SEC para manter a tabela pequena.
+    Retorna os escolhidos na ordem original (mais antigo primeiro).
+    """
+    cap = int(capacity_sec // PACK_BUCKET_SEC)
+    if cap <= 0:
+        return []
+    best = [0.0] * (cap + 1)
+    keep = []
+    for _f, _p, duration, weight in candidates:
+        size = int(-(-duration // PACK_BUCKET_SEC))
+        value = duration * weight
+        row = bytearray(cap + 1)
+        for c in range(cap, size - 1, -1):
+            v = best[c - size] + value
+            if v > best[c]:
+                best[c] = v
+                row[c] = 1
+        keep.append((size, row))
+    chosen, c = [], cap
+    for i in range(len(candidates) - 1, -1, -1):
+        size, row = keep[i]
+        if row[c]:
+            chosen.append(i)
+            c -= size
+    return [candidates[i][:3] for i in sorted(chosen)]
+
+
+def select_playlist(end_window):
+    """
+    Preenche o restante da janela: escolhe entre os .uploaded o conjunto que
+    mais ocupa o tempo disponível, favorecendo vídeos mais antigos (peso por idade).
+    Durações vêm do sidecar.
+    """
+    remaining = (end_window - datetime.now()).total_seconds() - PLAYLIST_MARGIN_SEC
+    candidates = []
+    for video_path in get_uploaded_queue().snapshot()[:PACK_MAX_CANDIDATES]:
+        video_file = os.path.basename(video_path)
+        try:
+            duration = probe_duration(video_path)
+        except Exception as e:
+            logging.error(f"Erro ao obter duração de {video_file}: {e}")
+            print(f"❌ Erro ao obter duração de {video_file}: {e}")
+            continue
+        if 0 < duration <= remaining:
+            weight = 1 + AGE_WEIGHT_PER_DAY * _age_days(video_path)
+            candidates.append((video_file, video_path, duration, weight))
+
+    items = pack_window(candidates, remaining)
+    if items:
+        total = sum(d for _f, _p, d in items)
+        utilization = 100 * total / remaining if remaining > 0 else 0
+        logging.info(f"Seleção: {len(items)}/{len(candidates)} vídeo(s), {total:.0f}s de {int(remaining)}s "
+                     f"({utilization:.1f}% da janela)")
+        print(f"🧩 Seleção: {len(items)} vídeo(s), {total:.0f}s de {int(remaining)}s ({utilization:.1f}% da janela)")
+    return items
+
+
+def broadcast_playlist(free2up_info, end_window, registros_sheet):
+    rtmp_key = free2up_info.get("rtmp_key")
+    yt_link = f"https://youtube.com/channel/{free2up_info.get('youtube_channel_id')}"
+
+    def on_item_done(video_file):
+        move_to_done(video_file)
+        register_link(registros_sheet, video_file, yt_link)
+        logging.info(f"Item da playlist concluído: {video_file}")
+        print(f"✅ Transmitido: {video_file}")
+
+    while True:
+        items = select_playlist(end_window)
+        if not items:
+            if get_oldest_uploaded():
+                logging.info("Tempo restante insuficiente para o próximo vídeo.")
+                print("⏳ Tempo restante insuficiente para o próximo vídeo.")
+            else:
+                logging.info("Nenhum vídeo restante para transmitir.")
+                print("✅ Todos os vídeos foram transmitidos.")
+            break
+
+        total = sum(d for _f, _p, d in items)
+        logging.info(f"Iniciando playlist de {len(items)} vídeo(s) ({total:.0f}s) para RTMP {rtmp_key}")
+        print(f"🚀 Transmitindo playlist de {len(items)} vídeo(s) ({total:.0f}s) numa única sessão RTMP...")
+        if not stream_playlist(items, f"{RTMP_BASE_URL}/{rtmp_key}", on_item_done):
+            logging.error("Erro na transmissão da playlist.")
+            print("❌ Falha na transmissão da playlist.")
             break
 
 
 def main():
+    setup_logging()
     agenda, registros_sheet = get_agenda()
     free2up_info, end_window = get_current_window(agenda)
     if not free2up_info:
@@ -116,28 +522,23 @@ def main():
         print("ℹ️ Nenhuma janela FREE2UP ativa no momento.")
         return
 
+    if PLAYLIST_MODE:
+        broadcast_playlist(free2up_info, end_window, registros_sheet)
+        return
+
     while True:
-        oldest = get_oldest_uploaded()
-        if not oldest:
+        if not get_oldest_uploaded():
             logging.info("Nenhum vídeo restante para transmitir.")
             print("✅ Todos os vídeos foram transmitidos.")
             break
 
-        video_path = os.path.join(UPLOADED_DIR, oldest)
-        try:
-            video_duration = int(float(subprocess.check_output([
-                "ffprobe", "-v", "error", "-show_entries",
-                "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", video_path
-            ]).decode().strip()))
-        except Exception as e:
-            logging.error(f"Erro ao obter duração de {oldest}: {e}")
-            print(f"❌ Erro ao obter duração de {oldest}: {e}")
-            break
-
-        if (end_window - datetime.now()).total_seconds() < video_duration:
-            logging.info(f"Tempo restante insuficiente para vídeo de {video_duration}s")
-            print(f"⏳ Tempo restante insuficiente para vídeo de {video_duration}s")
+        # Mesmo critério da playlist: o próximo vídeo vem do conjunto que preenche a janela
+        selection = select_playlist(end_window)
+        if not selection:
+            logging.info("Tempo restante insuficiente para qualquer vídeo pendente")
+            print("⏳ Tempo restante insuficiente para qualquer vídeo pendente")
             break
+        oldest, video_path, video_duration = selection[0]
 
         rtmp_key = free2up_info.get("rtmp_key")
         visibility = free2up_info.get("visibility", "unlisted").strip().lower()
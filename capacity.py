@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# === capacity.py (orçamento de bitrate pela capacidade de upload da semana) ===
+import os
+import json
+import socket
+from datetime import datetime, timedelta
+import storage
+import upload_planner
+import proxy
+
+AGENDA_PATH = "/xcoutfy/schedules/agenda_backup.json"
+BUDGET_ENABLED = os.getenv("XC_BITRATE_BUDGET", "1") == "1"
+DEFAULT_BITRATE = "5M"          # o mesmo padrão do 01v4record
+MIN_BITRATE_BPS = 1_000_000     # abaixo disso a imagem não serve ao cliente
+PAYDOWN_WEEKS = 2               # backlog atual é pago em 2 semanas
+SIM_STEP_SEC = 600
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+
+def load_agenda(host=None):
+    """Linhas da agenda deste equipamento (lista pura ou formato do refresh_agenda)."""
+    host = (host or socket.gethostname()).strip().lower()
+    try:
+        with open(AGENDA_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return []
+    rows = data.get("rows", []) if isinstance(data, dict) else data
+    return [r for r in rows if str(r.get("equipment", "")).strip().lower() == host]
+
+def _duration_sec(row):
+    # RECORDING e FREE2UP usam segundos na agenda (3500, 28800)
+    try:
+        return int(float(row.get("duration", 0)))
+    except (TypeError, ValueError):
+        return 0
+
+def next_occurrence(row, now):
+    """Próximo início (datetime) da linha a partir de now, dentro de 7 dias."""
+    day = str(row.get("day", "")).strip().lower()
+    if day not in WEEKDAYS:
+        return None
+    try:
+        hour, minute = int(row.get("hour", 0)), int(row.get("minute", 0))
+    except (TypeError, ValueError):
+        return None
+    delta_days = (WEEKDAYS.index(day) - now.weekday()) % 7
+    start = (now + timedelta(days=delta_days)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if start < now:
+        start += timedelta(days=7)
+    return start
+
+
+# =========================
+# Modelo de capacidade
+# =========================
+def current_backlog_bytes():
+    total = 0
+    for d in storage.RECORDING_TIERS:
+        try:
+            names = os.listdir(d)
+        except OSError:
+            continue
+        for f in names:
+            if f.endswith(".mp4"):
+                try:
+                    total += os.path.getsize(os.path.join(d, f))
+                except OSError:
+                    continue
+    return total
+
+def _recording_bytes(bitrate, duration_sec):
+    extra = proxy.forecast_bytes(duration_sec) if proxy.PROXY_ENABLED else 0
+    return storage.forecast_bytes(bitrate, duration_sec) + extra
+
+def weekly_model(agenda=None, bps=None, backlog=None):
+    """
+    Soma a semana: segundos gravados, segundos de janela FREE2UP e bytes que
+    o uplink medido consegue enviar nelas. Deduz o bitrate de vídeo que
+    mantém o backlog estável (pagando o backlog atual em PAYDOWN_WEEKS).
+    """
+    agenda = load_agenda() if agenda is None else agenda
+    bps = upload_planner.load_throughput() if bps is None else bps
+    backlog = current_backlog_bytes() if backlog is None else backlog
+
+    recordings = [r for r in agenda if str(r.get("type", "RECORDING")).upper() == "RECORDING"]
+    windows = [r for r in agenda if str(r.get("type", "")).upper() == "FREE2UP"]
+    record_sec = sum(_duration_sec(r) for r in recordings)
+    window_sec = sum(_duration_sec(r) for r in windows)
+    overhead_sec = upload_planner.PER_FILE_OVERHEAD_SEC * len(recordings)
+    capacity = max(0.0, (window_sec * upload_planner.SAFETY_MARGIN - overhead_sec) * bps)
+    scheduled = sum(_recording_bytes(r.get("bitrate") or DEFAULT_BITRATE, _duration_sec(r))
+                    for r in recordings)
+
+    available = capacity - backlog / PAYDOWN_WEEKS
+    if record_sec > 0:
+        # a prévia (01v4record) também sobe na janela: sai do orçamento do vídeo completo
+        proxy_bps = proxy.bitrate_bps() if proxy.PROXY_ENABLED else 0
+        budget_bps = available * 8 / (record_sec * storage.FORECAST_MARGIN) - storage.AUDIO_BPS - proxy_bps
+    else:
+        budget_bps = None
+    return {
+        "uplink_bps": bps,
+        "recordings": len(recordings),
+        "record_sec": record_sec,
+        "window_sec": window_sec,
+        "capacity_bytes": int(capacity),
+        "scheduled_bytes": int(scheduled),
+        "backlog_bytes": int(backlog),
+        "budget_video_bps": int(budget_bps) if budget_bps is not None else None,
+    }
+
+def slot_bitrate(row, model=None):
+    """
+    Bitrate para o slot: o da agenda (ou padrão), limitado pelo orçamento
+    da semana, nunca abaixo de MIN_BITRATE_BPS. Retorna (bitrate, motivo).
+    """
+    requested = row.get("bitrate") or DEFAULT_BITRATE
+    if not BUDGET_ENABLED:
+        return requested, "orçamento desativado"
+    model = model or weekly_model()
+    budget = model["budget_video_bps"]
+    req_bps = storage.parse_bitrate(requested)
+    if budget is None or req_bps <= budget:
+        return requested, "cabe no orçamento"
+    capped = max(MIN_BITRATE_BPS, budget)
+    return f"{capped // 1000}k", f"orçamento semanal {budget / 1e6:.2f} Mbit/s"
+
+
+# =========================
+# Projeção do backlog
+# =========================
+def project_backlog(agenda=None, bps=None, backlog=None, use_budget=False, now=None, days=7):
+    """
+    Simula a semana em passos de SIM_STEP_SEC: gravações somam bytes no fim
+    do slot, janelas FREE2UP drenam na vazão medida. Retorna [(datetime, bytes)].
+    """
+    agenda = load_agenda() if agenda is None else agenda
+    bps = upload_planner.load_throughput() if bps is None else bps
+    backlog = current_backlog_bytes() if backlog is None else backlog
+    now = now or datetime.now()
+    model = weekly_model(agenda, bps, backlog) if use_budget else None
+
+    adds, windows = [], []
+    for r in agenda:
+        start = next_occurrence(r, now)
+        if start is None:
+            continue
+        dur = _duration_sec(r)
+        kind = str(r.get("type", "RECORDING")).upper()
+        if kind == "RECORDING":
+            bitrate = slot_bitrate(r, model)[0] if use_budget else (r.get("bitrate") or DEFAULT_BITRATE)
+            adds.append((start + timedelta(seconds=dur), _recording_bytes(bitrate, dur)))
+        elif kind == "FREE2UP":
+            windows.append((start, start + timedelta(seconds=dur)))
+
+    drain = bps * upload_planner.SAFETY_MARGIN * SIM_STEP_SEC
+    curve, level, t = [], float(backlog), now
+    end = now + timedelta(days=days)
+    while t <= end:
+        nxt = t + timedelta(seconds=SIM_STEP_SEC)
+        level += sum(b for when, b in adds if t <= when < nxt)
+        if any(a <= t < b for a, b in windows):
+            level = max(0.0, level - drain)
+        curve.append((t, int(level)))
+        t = nxt
+    return curve
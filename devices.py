@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# === devices.py (câmera e microfone USB: detecção pelo sysfs e cache) ===
+import os
+import re
+import json
+
+CACHE_PATH = "/xcoutfy/schedules/device_cache.json"
+SYS_VIDEO = "/sys/class/video4linux"
+SYS_SOUND = "/sys/class/sound"
+PROC_ASOUND = "/proc/asound"
+PREFERRED_RATES = [44100, 48000]
+
+
+def _load_cache():
+    try:
+        with open(CACHE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def _save_cache(cache):
+    try:
+        os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+        tmp = CACHE_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp, CACHE_PATH)
+    except OSError as e:
+        print(f"⚠️ Falha ao salvar cache de dispositivos: {e}")
+
+def _read(path):
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+def usb_parent(sys_device_link):
+    """Caminho sysfs do dispositivo USB físico (diretório com idVendor) acima do nó."""
+    try:
+        path = os.path.realpath(sys_device_link)
+    except OSError:
+        return None
+    while path and path != "/":
+        if os.path.exists(os.path.join(path, "idVendor")):
+            return path
+        path = os.path.dirname(path)
+    return None
+
+
+# =========================
+# Vídeo
+# =========================
+def video_usb_parent(device):
+    """/dev/videoN -> dispositivo USB que o contém."""
+    return usb_parent(os.path.join(SYS_VIDEO, os.path.basename(device), "device"))
+
+def cached_video():
+    """Último /dev/video que funcionou, se ainda pertence à mesma câmera USB."""
+    entry = _load_cache().get("video", {})
+    device = entry.get("device")
+    if device and os.path.exists(device) and video_usb_parent(device) == entry.get("usb"):
+        return device
+    return None
+
+def remember_video(device):
+    cache = _load_cache()
+    cache["video"] = {"device": device, "usb": video_usb_parent(device)}
+    _save_cache(cache)
+
+
+# =========================
+# Áudio
+# =========================
+def _parse_stream_caps(text):
+    """Canais/taxas da seção Capture de /proc/asound/cardN/stream0 (placas USB)."""
+    caps = {"channels": None, "rates": []}
+    section = text.split("Capture:", 1)[1] if "Capture:" in text else ""
+    m = re.search(r"Channels:\s*(\d+)", section)
+    if m:
+        caps["channels"] = int(m.group(1))
+    m = re.search(r"Rates:\s*([^\n]+)", section)
+    if m:
+        rates = m.group(1)
+        rng = re.match(r"\s*(\d+)\s*-\s*(\d+)", rates)
+        if rng:
+            lo, hi = int(rng.group(1)), int(rng.group(2))
+            caps["rates"] = [r for r in PREFERRED_RATES if lo <= r <= hi]
+        else:
+            caps["rates"] = [int(r) for r in re.findall(r"\d+", rates)]
+    return caps
+
+def list_audio_capture():
+    """Placas com PCM de captura: [{index, id, name, pcm, usb, channels, rates}]."""
+    cards = []
+    text = _read(os.path.join(PROC_ASOUND, "cards"))
+    for m in re.finditer(r"^\s*(\d+)\s+\[(\S+)\s*\]:\s*(.+)$", text, re.M):
+        index, card_id, name = int(m.group(1)), m.group(2), m.group(3).strip()
+        card_dir = os.path.join(PROC_ASOUND, f"card{index}")
+        try:
+            pcms = sorted(p for p in os.listdir(card_dir) if re.fullmatch(r"pcm\d+c", p))
+        except OSError:
+            continue
+        if not pcms:
+            continue
+        caps = _parse_stream_caps(_read(os.path.join(card_dir, "stream0")))
+        cards.append({
+            "index": index,
+            "id": card_id,
+            "name": name,
+            "pcm": int(pcms[0][3:-1]),
+            "usb": usb_parent(os.path.join(SYS_SOUND, f"card{index}", "device")),
+            "channels": caps["channels"],
+            "rates": caps["rates"],
+        })
+    return cards
+
+def _alsa_name(card):
+    # por id (não por índice): estável quando a ordem de enumeração USB muda
+    return f"hw:CARD={card['id']},DEV={card['pcm']}"
+
+def audio_for(video_device, fallback):
+    """
+    Dispositivo ALSA de captura para a câmera: XC_AUDIO_DEVICE, senão a placa
+    no mesmo dispositivo USB da câmera, senão a primeira placa USB com captura.
+    Retorna {"device", "channels", "rate"}; sem nada detectado, usa fallback.
+    """
+    override = os.getenv("XC_AUDIO_DEVICE")
+    if override:
+        return {"device": override, "channels": None, "rate": None}
+
+    cache = _load_cache()
+    cards = list_audio_capture()
+    video_usb = video_usb_parent(video_device) if video_device else None
+
+    card = None
+    cached = cache.get("audio", {})
+    for c in cards:
+        if c["id"] == cached.get("id") and c["usb"] == cached.get("usb") and cached.get("video_usb") == video_usb:
+            card = c
+            break
+    if card is None and video_usb:
+        card = next((c for c in cards if c["usb"] == video_usb), None)
+    if card is None:
+        card = next((c for c in cards if c["usb"]), None)
+    if card is None:
+        print(f"⚠️ Nenhuma placa de captura USB detectada; usando {fallback}")
+        return {"device": fallback, "channels": None, "rate": None}
+
+    rate = next((r for r in PREFERRED_RATES if r in card["rates"]), card["rates"][0] if card["rates"] else None)
+    result = {"device": _alsa_name(card), "channels": card["channels"], "rate": rate}
+    if cached.get("id") != card["id"] or cached.get("video_usb") != video_usb:
+        cache["audio"] = {"id": card["id"], "name": card["name"], "usb": card["usb"], "video_usb": video_usb,
+                          "channels": card["channels"], "rates": card["rates"]}
+        _save_cache(cache)
+    print(f"🎙️ Áudio: {card['name']} -> {result['device']} ({card['channels'] or '?'} canal(is), {rate or '?'} Hz)")
+    return result
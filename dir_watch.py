@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# === dir_watch.py (fila em memória de vídeos prontos, via inotify) ===
+import os
+import time
+import struct
+import ctypes
+import ctypes.util
+import threading
+from collections import OrderedDict
+import file_ready
+
+# Máscaras do <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+
+_EVENT_HEADER = struct.Struct("iIII")
+POLL_FALLBACK_SEC = 5  # sem inotify (ex.: fora do Linux), rescaneia nesse intervalo
+
+
+def _inotify_init():
+    """Abre um descritor inotify via libc. Retorna None se indisponível."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+        if fd < 0:
+            return None, None
+        return libc, fd
+    except (OSError, AttributeError):
+        return None, None
+
+
+class DirQueue(object):
+    """
+    Mantém, em ordem de idade (nome), os arquivos prontos com o sufixo dado
+    nos diretórios observados. Chegadas (rename do .part, close-write) e
+    saídas (move/delete) chegam pelo inotify; next_item() é O(1) e wait()
+    acorda assim que algum arquivo fica pronto. Se notify (threading.Event)
+    for passado, ele é setado a cada chegada — útil para esperar várias filas.
+    """
+
+    def __init__(self, dirs, suffix, notify=None):
+        self.dirs = [d for d in dirs]
+        self.suffix = suffix
+        self.notify = notify
+        self._items = OrderedDict()
+        self._cond = threading.Condition()
+        self._wd_dirs = {}
+        self._libc, self._fd = _inotify_init()
+        for d in self.dirs:
+            os.makedirs(d, exist_ok=True)
+            if self._fd is not None:
+                wd = self._libc.inotify_add_watch(self._fd, d.encode(), WATCH_MASK)
+                if wd >= 0:
+                    self._wd_dirs[wd] = d
+        self.rescan()
+        target = self._inotify_loop if self._fd is not None else self._poll_loop
+        threading.Thread(target=target, name="dir_watch", daemon=True).start()
+        # arquivos recentes demais no scan inicial entram numa segunda passada
+        settle = threading.Timer(file_ready.STABLE_SEC + 1, self.rescan)
+        settle.daemon = True
+        settle.start()
+
+    # ---------- estado ----------
+    def _matches(self, name):
+        return name.endswith(self.suffix)
+
+    def _add(self, path):
+        with self._cond:
+            if path in self._items:
+                return
+            last = next(reversed(self._items)) if self._items else None
+            self._items[path] = True
+            if last is not None and os.path.basename(path) < os.path.basename(last):
+                # chegada fora de ordem (raro): reordena por nome
+                self._items = OrderedDict((p, True) for p in sorted(self._items, key=os.path.basename))
+            self._cond.notify_all()
+        if self.notify is not None:
+            self.notify.set()
+
+    def _discard(self, path):
+        with self._cond:
+            self._items.pop(path, None)
+            self._cond.notify_all()
+
+    def rescan(self):
+        """Relista os diretórios (boot, overflow do inotify ou fallback sem inotify)."""
+        found = []
+        for d in self.dirs:
+            try:
+                names = os.listdir(d)
+            except OSError:
+                continue
+            for f in names:
+                path = os.path.join(d, f)
+                if self._matches(f) and file_ready.is_file_ready(path):
+                    found.append(path)
+        with self._cond:
+            self._items = OrderedDict((p, True) for p in sorted(found, key=os.path.basename))
+            self._cond.notify_all()
+        if self.notify is not None and found:
+            self.notify.set()
+
+    # ---------- consumo ----------
+    def __len__(self):
+        return len(self._items)
+
+    def has_items(self):
+        return bool(self._items)
+
+    def next_item(self):
+        """Arquivo pronto mais antigo (sem remover), ou None."""
+        with self._cond:
+            return next(iter(self._items)) if self._items else None
+
+    def snapshot(self):
+        with self._cond:
+            return list(self._items)
+
+    def discard(self, path):
+        """Remove da fila (ex.: arquivo consumido/movido pelo próprio processo)."""
+        self._discard(path)
+
+    def wait(self, timeout):
+        """Bloqueia até haver item pronto ou até timeout. Retorna has_items()."""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            return bool(self._items)
+
+    # ---------- threads ----------
+    def _inotify_loop(self):
+        while True:
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except InterruptedError:
+                continue
+            except OSError as e:
+                print(f"⚠️ inotify falhou ({e}); usando varredura periódica.")
+                self._fd = None
+                self._poll_loop()
+                return
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(buf):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(buf, offset)
+                offset += _EVENT_HEADER.size
+                name = buf[offset:offset + length].rstrip(b"\0").decode("utf-8", "surrogateescape")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    self.rescan()
+                    continue
+                d = self._wd_dirs.get(wd)
+                if d is None or mask & IN_ISDIR or not self._matches(name):
+                    continue
+                path = os.path.join(d, name)
+                if mask & (IN_MOVED_TO | IN_CLOSE_WRITE):
+                    if os.path.exists(path):
+                        self._add(path)
+                elif mask & (IN_MOVED_FROM | IN_DELETE):
+                    self._discard(path)
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(POLL_FALLBACK_SEC)
+            self.rescan()
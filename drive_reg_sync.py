@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+# === drive_reg_sync.py (reenvia o diário de registros pendentes para o Sheets) ===
+# Executado pelo systemd/xcoutfy-drive-sync.timer; o 00agenda também faz flush em segundo plano.
+import sys
+import sheets_journal
+
+def main():
+    entries = sheets_journal.pending()
+    if not entries:
+        print("✅ Nenhum registro pendente no diário.")
+        return 0
+    print(f"🔁 {len(entries)} escrita(s) pendente(s) no diário. Sincronizando...")
+    left = sheets_journal.flush()
+    if left:
+        print(f"⚠️ {left} escrita(s) continuam pendentes.")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except Exception as e:
+        print(f"❌ Falha no sync do diário: {e}", file=sys.stderr)
+        sys.exit(1)
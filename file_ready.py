@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# === file_ready.py (detecção de arquivo de vídeo finalizado) ===
+import os
+import time
+import sidecar
+
+# O gravador escreve em "<nome>.mp4.part" e só renomeia para ".mp4" depois
+# que o ffmpeg sai; o rename é atômico, então um ".mp4" já está fechado.
+PARTIAL_SUFFIX = ".part"
+
+# Para arquivos que chegam por outros caminhos (ex.: storage_videos copiado
+# à mão), exige que o tamanho/mtime não mude por alguns segundos. Vídeo com
+# sidecar veio do rename do gravador (o sidecar é escrito antes): já está fechado.
+STABLE_SEC = int(os.getenv("XC_FILE_STABLE_SEC", 5))
+
+
+def partial_path(final_path):
+    return final_path + PARTIAL_SUFFIX
+
+def finalize_partial(final_path):
+    """Renomeia o .part para o nome final. Retorna True se o arquivo final existe."""
+    part = partial_path(final_path)
+    if os.path.exists(part):
+        os.replace(part, final_path)
+    return os.path.exists(final_path)
+
+def is_file_ready(path, stable_sec=STABLE_SEC):
+    """True se o arquivo não é parcial, não está vazio e tem sidecar ou está estável há stable_sec."""
+    if path.endswith(PARTIAL_SUFFIX):
+        return False
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if st.st_size == 0:
+        return False
+    if os.path.exists(sidecar.sidecar_path(path)):
+        return True
+    return (time.time() - st.st_mtime) >= stable_sec
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# === frame_faults.py (detecção barata de falhas de imagem durante a gravação) ===
+import os
+import time
+import metrics
+
+try:
+    import numpy as np
+except ImportError:  # opcional: sem NumPy a gravação segue sem a análise
+    np = None
+
+ANALYSIS_SCALE = 8          # 1/8 da resolução já cortada
+ANALYSIS_FPS = 1
+BLACK_MEAN = 16             # luminância média abaixo disso = preto
+BLACK_STD = 8
+OBSTRUCTED_STD = 6          # imagem quase uniforme (lente tampada/encostada)
+FROZEN_DIFF = 0.8           # diferença média entre amostras abaixo disso = congelado...
+# ...e quase nenhum pixel mudou: numa cena parada de verdade (campo vazio) o ruído
+# do sensor ainda muda parte dos pixels; captura travada repete o mesmo buffer
+FROZEN_CHANGED_FRAC = 0.002
+FAULT_SUSTAIN_SAMPLES = 5   # ~5 s seguidos antes de alertar
+
+FAULT_BLACK = "preto"
+FAULT_OBSTRUCTED = "lente_obstruida"
+FAULT_FROZEN = "congelado"
+
+
+def available():
+    return np is not None
+
+def analysis_geometry(left_width, right_width, crop_height):
+    """(largura, altura, coluna da divisão entre lentes) da saída reduzida."""
+    total = left_width + right_width
+    width = max(2, total // ANALYSIS_SCALE)
+    height = max(2, crop_height // ANALYSIS_SCALE)
+    split = max(1, min(width - 1, round(left_width * width / total)))
+    return width, height, split
+
+def analysis_filter(label_in, label_out, width, height):
+    """Ramo do filter_complex: 1 fps, reduzido, em cinza."""
+    return f"[{label_in}]fps={ANALYSIS_FPS},scale={width}:{height},format=gray[{label_out}]"
+
+
+class FrameFaultDetector(object):
+    """
+    Lê quadros cinza (rawvideo) de um pipe e avalia cada metade (lente) com
+    estatísticas vetorizadas: preto, obstruída (uniforme) e congelada.
+    Alerta na hora (print + métrica recording_fault) quando a condição dura
+    FAULT_SUSTAIN_SAMPLES amostras; on_fault(lens, fault) é chamado junto.
+    """
+
+    def __init__(self, width, height, split, on_fault=None, context=None):
+        self.width = width
+        self.height = height
+        self.split = split
+        self.on_fault = on_fault
+        self.context = context or {}
+        self.samples = 0
+        self.cpu_sec = 0.0
+        self._prev = {}
+        self._streak = {}
+        self.faults = []      # [{"lens", "fault", "at_sec", "duration_sec"}]
+        self._open = {}
+        self.error = None
+
+    def _halves(self, frame):
+        return {"esquerda": frame[:, :self.split], "direita": frame[:, self.split:]}
+
+    def _check(self, lens, half):
+        mean = float(half.mean())
+        std = float(half.std())
+        found = set()
+        if mean < BLACK_MEAN and std < BLACK_STD:
+            found.add(FAULT_BLACK)
+        elif std < OBSTRUCTED_STD:
+            found.add(FAULT_OBSTRUCTED)
+        cur = half.astype(np.int16)
+        prev = self._prev.get(lens)
+        # imagem uniforme (preta/tampada) já tem alerta próprio e repete igual sem estar travada
+        if prev is not None and std >= OBSTRUCTED_STD:
+            diff = np.abs(cur - prev)
+            if float(diff.mean()) < FROZEN_DIFF and np.count_nonzero(diff) < FROZEN_CHANGED_FRAC * diff.size:
+                found.add(FAULT_FROZEN)
+        self._prev[lens] = cur
+        return found
+
+    def feed(self, buf):
+        # thread_time: só a thread do detector (process_time somaria o processo todo)
+        t0 = time.thread_time()
+        frame = np.frombuffer(buf, dtype=np.uint8).reshape(self.height, self.width)
+        self.samples += 1
+        for lens, half in self._halves(frame).items():
+            found = self._check(lens, half)
+            for fault in (FAULT_BLACK, FAULT_OBSTRUCTED, FAULT_FROZEN):
+                key = (lens, fault)
+                if fault in found:
+                    self._streak[key] = self._streak.get(key, 0) + 1
+                    if self._streak[key] == FAULT_SUSTAIN_SAMPLES:
+                        self._raise(lens, fault)
+                else:
+                    self._streak[key] = 0
+                    self._close(key)
+        self.cpu_sec += time.thread_time() - t0
+
+    def _raise(self, lens, fault):
+        at = max(0, self.samples - FAULT_SUSTAIN_SAMPLES) / ANALYSIS_FPS
+        entry = {"lens": lens, "fault": fault, "at_sec": at, "duration_sec": None}
+        self.faults.append(entry)
+        self._open[(lens, fault)] = entry
+        print(f"🚨 Falha de imagem na lente {lens}: {fault} desde {at:.0f}s de gravação")
+        metrics.emit("recording_fault", lens=lens, fault=fault, at_sec=at, **self.context)
+        if self.on_fault:
+            self.on_fault(lens, fault)
+
+    def _close(self, key):
+        entry = self._open.pop(key, None)
+        if entry is not None:
+            entry["duration_sec"] = self.samples / ANALYSIS_FPS - entry["at_sec"]
+
+    def run(self, fd):
+        """Consome o pipe até o ffmpeg fechar."""
+        size = self.width * self.height
+        with os.fdopen(fd, "rb", buffering=0) as pipe:
+            buf = bytearray()
+            while True:
+                chunk = pipe.read(size - len(buf))
+                if not chunk:
+                    break
+                buf.extend(chunk)
+                if len(buf) == size:
+                    # erro na análise não pode travar o ffmpeg: segue drenando o pipe
+                    if not self.error:
+                        try:
+                            self.feed(bytes(buf))
+                        except Exception as e:
+                            self.error = str(e)
+                            print(f"⚠️ Análise de imagem desativada nesta gravação: {e}")
+                    buf.clear()
+        for key in list(self._open):
+            self._close(key)
+
+    def summary(self):
+        return {
+            "samples": self.samples,
+            "analysis_cpu_sec": round(self.cpu_sec, 2),
+            "faults": self.faults,
+            "error": self.error,
+        }
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+# === metrics.py (métricas locais em JSON Lines) ===
+import os
+import json
+import socket
+from datetime import datetime
+
+METRICS_PATH = os.getenv("XC_METRICS_PATH", "/xcoutfy/logs/metrics.jsonl")
+
+
+def emit(event, **fields):
+    """Acrescenta uma linha JSON em METRICS_PATH. Nunca derruba o chamador."""
+    record = {
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "host": socket.gethostname(),
+        "event": event,
+    }
+    record.update(fields)
+    try:
+        os.makedirs(os.path.dirname(METRICS_PATH), exist_ok=True)
+        with open(METRICS_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"⚠️ Falha ao gravar métrica {event}: {e}")
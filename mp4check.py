@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# === mp4check.py (validação rápida de MP4 pelas caixas do container) ===
+#   uso: python3 mp4check.py arquivo.mp4 [...]
+import os
+import sys
+import shutil
+import struct
+import subprocess
+from datetime import datetime
+import file_ready
+import sidecar
+import metrics
+
+QUARANTINE_DIR = "/xcoutfy/quarantine"
+REPAIR_SUFFIX = ".remux"
+MAX_TOP_BOXES = 100_000     # fMP4 de 1h com fragmentos de 10s tem ~720 moof/mdat
+
+STATUS_COMPLETE = "completo"
+STATUS_REPAIRABLE = "reparavel"
+STATUS_CORRUPT = "corrompido"
+
+_HEADER = struct.Struct(">I4s")
+_LARGE = struct.Struct(">Q")
+
+
+def _valid_type(box_type):
+    # tipos de caixa são 4 caracteres ASCII imprimíveis (ftyp, moov, mdat, ©nam é só dentro do udta)
+    return all(32 <= c < 127 for c in box_type)
+
+def read_boxes(f, start, end):
+    """
+    Lê só os cabeçalhos das caixas entre start e end, pulando o conteúdo.
+    Retorna (caixas, problema): caixas = [(tipo, offset, tamanho)] e
+    problema = None, "truncado" (caixa passa do fim) ou "lixo" (cabeçalho inválido).
+    """
+    boxes = []
+    offset = start
+    while offset < end:
+        if end - offset < _HEADER.size or len(boxes) >= MAX_TOP_BOXES:
+            return boxes, "truncado"
+        f.seek(offset)
+        size, raw = _HEADER.unpack(f.read(_HEADER.size))
+        header = _HEADER.size
+        if size == 1:
+            data = f.read(_LARGE.size)
+            if len(data) < _LARGE.size:
+                return boxes, "truncado"
+            size = _LARGE.unpack(data)[0]
+            header += _LARGE.size
+        elif size == 0:
+            # "até o fim do arquivo": o ffmpeg deixa assim o mdat que nunca foi fechado
+            size = end - offset
+        if not _valid_type(raw) or size < header:
+            return boxes, "lixo"
+        box_type = raw.decode("ascii")
+        if offset + size > end:
+            boxes.append((box_type, offset, end - offset))
+            return boxes, "truncado"
+        boxes.append((box_type, offset, size))
+        offset += size
+    return boxes, None
+
+def _child_types(f, box, header=8):
+    _type, offset, size = box
+    children, problem = read_boxes(f, offset + header, offset + size)
+    return {t for t, _o, _s in children}, problem
+
+def classify(path):
+    """
+    Classifica o MP4 lendo só os cabeçalhos (alguns KB, nunca o payload):
+      completo   - ftyp + moov íntegro + mídia até o fim do arquivo
+      reparavel  - índice presente, mas com sobra/corte no fim (remux -c copy resolve)
+      corrompido - sem moov (ffmpeg morto antes de fechar) ou estrutura ilegível
+    Retorna (status, motivo).
+    """
+    try:
+        file_size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            boxes, problem = read_boxes(f, 0, file_size)
+            types = [t for t, _o, _s in boxes]
+            if not boxes or types[0] != "ftyp":
+                return STATUS_CORRUPT, "não começa com ftyp"
+            moov = next((b for b in boxes if b[0] == "moov"), None)
+            if moov is None:
+                if "mdat" in types or "moof" in types:
+                    return STATUS_CORRUPT, "sem moov (gravação interrompida antes de fechar o arquivo)"
+                return STATUS_CORRUPT, "sem moov nem mídia"
+            moov_children, moov_problem = _child_types(f, moov)
+    except OSError as e:
+        return STATUS_CORRUPT, f"ilegível: {e}"
+
+    if moov_problem or "mvhd" not in moov_children or "trak" not in moov_children:
+        return STATUS_CORRUPT, "moov incompleto"
+    fragmented = "mvex" in moov_children
+    if fragmented:
+        if "moof" not in types:
+            return STATUS_CORRUPT, "fragmentado sem nenhum fragmento"
+        if problem:
+            return STATUS_REPAIRABLE, f"último fragmento {problem}"
+        return STATUS_COMPLETE, "fragmentado"
+    if "mdat" not in types:
+        return STATUS_CORRUPT, "sem mdat"
+    if problem:
+        # índice aponta para dados que podem ter sido cortados: o remux é verificado depois
+        return STATUS_REPAIRABLE, f"fim do arquivo {problem}"
+    return STATUS_COMPLETE, "ok"
+
+
+# =========================
+# Reparo / quarentena
+# =========================
+def repair(src, dst):
+    """
+    Remux -c copy de src para um temporário com o moov no início; só vira
+    dst se o resultado for classificado como completo e tiver duração.
+    Retorna o probe do arquivo reparado, ou None.
+    """
+    tmp = dst + REPAIR_SUFFIX
+    cmd = [
+        "ffmpeg", "-v", "error", "-y", "-err_detect", "ignore_err",
+        "-i", src, "-map", "0", "-c", "copy", "-movflags", "+faststart",
+        "-f", "mp4", tmp
+    ]
+    try:
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=1800)
+        status, reason = classify(tmp)
+        info = sidecar.probe(tmp) if status == STATUS_COMPLETE else None
+        if not info or info["duration"] <= 0:
+            raise RuntimeError(f"remux não gerou arquivo válido ({reason})")
+        os.replace(tmp, dst)
+        if src != dst:
+            os.remove(src)
+        return info
+    except Exception as e:
+        print(f"⚠️ Reparo falhou para {os.path.basename(dst)}: {e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return None
+
+def _quarantine_path(name):
+    os.makedirs(QUARANTINE_DIR, exist_ok=True)
+    return os.path.join(QUARANTINE_DIR, name)
+
+def _report(name, status, reason, outcome, path):
+    if outcome == "repaired":
+        print(f"✅ {name} reparado ({reason}).")
+    elif outcome == "quarantined":
+        print(f"🚫 {name} em quarentena ({reason}): {path}")
+    metrics.emit("mp4_check", filename=name, status=status, reason=reason, outcome=outcome,
+                 size=os.path.getsize(path) if os.path.exists(path) else None)
+
+def check_partial(final_path):
+    """
+    Valida o .part do gravador antes do rename: reparável é remuxado no
+    próprio .part, corrompido vai para QUARANTINE_DIR. Nada é publicado
+    aqui: o chamador escreve o sidecar e só então chama publish(), então
+    o .mp4 nunca aparece na fila sem metadados.
+    Retorna {"status", "reason", "outcome", "path", "final"}: path é onde a
+    mídia está agora (None se o ffmpeg não chegou a criar o arquivo) e final
+    é o nome que ela terá (o do sidecar).
+    """
+    part = file_ready.partial_path(final_path)
+    name = os.path.basename(final_path)
+    if not os.path.exists(part):
+        path = final_path if os.path.exists(final_path) else None
+        return {"status": None, "reason": "arquivo não criado", "outcome": "missing",
+                "path": path, "final": path}
+    status, reason = classify(part)
+    outcome, path, final = "ok", part, final_path
+    if status != STATUS_COMPLETE:
+        if status == STATUS_REPAIRABLE:
+            print(f"🛠️ {name}: {reason}; remuxando...")
+        if status == STATUS_REPAIRABLE and repair(part, part):
+            outcome = "repaired"
+        else:
+            outcome, final = "quarantined", _quarantine_path(name)
+            try:
+                shutil.move(part, final)   # quarentena pode estar em outro disco que o tier
+                path = final
+            except OSError as e:
+                print(f"⚠️ Falha ao mover {name} para a quarentena: {e}")
+                final = part
+        _report(name, status, reason, outcome, path)
+    return {"status": status, "reason": reason, "outcome": outcome, "path": path, "final": final}
+
+def publish(final_path):
+    """Rename atômico .part -> nome final: a partir daqui o arquivo entra na fila."""
+    return file_ready.finalize_partial(final_path)
+
+def ensure_valid(path):
+    """
+    Gate antes do upload, para MP4 que chegou por outro caminho (cópia
+    manual, tier, versão antiga do gravador): completo segue, reparável é
+    remuxado no lugar, corrompido vai com o sidecar para QUARANTINE_DIR.
+    Retorna True se o arquivo pode seguir.
+    """
+    name = os.path.basename(path)
+    status, reason = classify(path)
+    if status == STATUS_COMPLETE:
+        return True
+    if status == STATUS_REPAIRABLE:
+        print(f"🛠️ {name}: {reason}; remuxando...")
+        info = repair(path, path)
+        if info:
+            sidecar.update(path, repaired_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                           **sidecar.probe_fields(info, os.path.getsize(path)))
+            _report(name, status, reason, "repaired", path)
+            return True
+    dest = _quarantine_path(name)
+    try:
+        sidecar.update(path, quarantined_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                       quarantine_reason=reason)
+        sidecar.move_with_media(path, dest)
+    except OSError as e:
+        print(f"⚠️ Falha ao mover {name} para a quarentena: {e}")
+        dest = path
+    _report(name, status, reason, "quarantined", dest)
+    return False
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("uso: python3 mp4check.py arquivo.mp4 [...]")
+        sys.exit(1)
+    for p in sys.argv[1:]:
+        status, reason = classify(p)
+        print(f"{status:<11} {reason:<45} {p}")
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# === proxy.py (rendição de prévia em baixo bitrate, gerada junto com a gravação) ===
+import os
+import storage
+
+PROXY_ENABLED = os.getenv("XC_RECORD_PROXY", "1") == "1"
+PROXY_HEIGHT = int(os.getenv("XC_PROXY_HEIGHT", 360))
+PROXY_FPS = int(os.getenv("XC_PROXY_FPS", 15))
+PROXY_BITRATE = os.getenv("XC_PROXY_BITRATE", "500k")
+PROXY_AUDIO_BITRATE = "64k"
+PROXY_PRESET = "ultrafast"   # roda ao lado do encode principal, em tempo real
+
+# "<nome>.mp4" -> "<nome>_proxy.mp4": mesmo prefixo de data, então fica ao lado do original
+PROXY_TAG = "_proxy"
+
+
+def proxy_path(full_path):
+    stem, ext = os.path.splitext(full_path)
+    return stem + PROXY_TAG + ext
+
+def is_proxy(path):
+    return os.path.splitext(os.path.basename(path))[0].endswith(PROXY_TAG)
+
+def bitrate_bps():
+    """Vídeo + áudio da prévia, em bits/s."""
+    return storage.parse_bitrate(PROXY_BITRATE) + storage.parse_bitrate(PROXY_AUDIO_BITRATE)
+
+def forecast_bytes(duration_sec):
+    return int(bitrate_bps() * duration_sec / 8 * storage.FORECAST_MARGIN)
+
+def proxy_filter(label_in, label_out):
+    """Ramo do filter_complex: quadro já cortado -> fps e altura da prévia."""
+    return f"[{label_in}]fps={PROXY_FPS},scale=-2:{PROXY_HEIGHT}[{label_out}]"
+
+def output_args(label, audio_map, audio_filter, gop_fps=PROXY_FPS):
+    """Codecs da prévia: H.264 (abre direto no player do Drive) + AAC mono."""
+    return [
+        "-map", f"[{label}]", "-map", audio_map,
+        "-filter:a", audio_filter,
+        "-c:v", "libx264", "-preset", PROXY_PRESET, "-pix_fmt", "yuv420p",
+        "-b:v", PROXY_BITRATE, "-maxrate", PROXY_BITRATE, "-bufsize", PROXY_BITRATE,
+        "-g", str(gop_fps * 2),
+        "-c:a", "aac", "-b:a", PROXY_AUDIO_BITRATE, "-ac", "1",
+    ]
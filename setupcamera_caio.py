@@ -3,9 +3,16 @@
 import subprocess
 import argparse
 import os
+import time
+import queue
+import shutil
 import datetime
+import threading
 import gspread
 from google.oauth2.service_account import Credentials
+import file_ready
+import sidecar
+import devices
 
 # ============================
 # 🎠 PARÂMETROS PADRÃO
@@ -16,6 +23,28 @@ RESOLUTION = "1280x360"
 FPS = 25
 FRAME_HEIGHT = 360
 LENS_WIDTH = 640
+# Destino RTMP; tools/rtmp_sink.py aponta para um receptor local
+RTMP_BASE_URL = os.getenv("XC_RTMP_BASE_URL", "rtmp://a.rtmp.youtube.com/live2").rstrip("/")
+
+# 🛟 Modo spool: captura desacoplada da rede (segmentos locais + RTMP reconectável)
+SPOOL_DIR = "/xcoutfy/stream_spool"
+RECORDED_DIR = "/xcoutfy/recorded_videos"
+SEGMENT_SEC = 10
+PRE_ROLL_SEGMENTS = 2           # segmentos mantidos antes de uma queda detectada
+RECONNECT_BACKOFF_MAX_SEC = 60
+NET_STABLE_SEC = 30             # conexão viva por esse tempo zera o backoff
+RELAY_CHUNK = 188 * 348         # múltiplo do pacote MPEG-TS
+RELAY_QUEUE_CHUNKS = 256        # ~16 MB; se a rede travar, descarta em vez de travar a câmera
+
+DIAS_SEMANA = {
+    "monday": "Segunda",
+    "tuesday": "Terca",
+    "wednesday": "Quarta",
+    "thursday": "Quinta",
+    "friday": "Sexta",
+    "saturday": "Sabado",
+    "sunday": "Domingo"
+}
 
 # 🎛️ Cortes padrão
 LEFT_CROP_LEFT = 0
@@ -36,11 +65,16 @@ parser.add_argument('--right_crop_right', type=int, default=RIGHT_CROP_RIGHT)
 parser.add_argument('--crop_top', type=int, default=CROP_TOP)
 parser.add_argument('--crop_bottom', type=int, default=CROP_BOTTOM)
 parser.add_argument('--fps', type=int, default=FPS)
+parser.add_argument('--spool', type=int, default=int(os.getenv("XC_STREAM_SPOOL", "1")),
+                    help="1 = reconecta o RTMP sem fechar a câmera e guarda as quedas localmente")
 args = parser.parse_args()
 
 def detectar_camera_usb():
-    for i in range(5):
-        device = f"/dev/video{i}"
+    candidatos = [f"/dev/video{i}" for i in range(5)]
+    cached = devices.cached_video()
+    if cached:
+        candidatos = [cached] + [d for d in candidatos if d != cached]
+    for device in candidatos:
         if os.path.exists(device):
             print(f"🔍 Testando {device}...")
             try:
@@ -51,13 +85,15 @@ def detectar_camera_usb():
                 ]
                 subprocess.run(test_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
                 print(f"📷 Câmera funcional detectada: {device}")
+                devices.remember_video(device)
                 return device
             except subprocess.CalledProcessError:
                 print(f"❌ {device} falhou ao capturar imagem.")
     print("❌ Nenhuma câmera USB funcional encontrada.")
     exit(1)
 
-def iniciar_transmissao(device, stream_url):
+def montar_filtro():
+    """Filtro de corte das duas lentes. Retorna (filter_complex, descrição) ou (None, None)."""
     crop_top = args.crop_top
     crop_bottom = args.crop_bottom
     crop_height = FRAME_HEIGHT - crop_top - crop_bottom
@@ -74,7 +110,7 @@ def iniciar_transmissao(device, stream_url):
 
     if left_width <= 0 or right_width <= 0 or crop_height <= 0:
         print("❌ ERRO: Dimensões de corte inválidas. Ajuste os valores.")
-        return
+        return None, None
 
     filter_complex = (
         f"[0:v]split=2[left][right];"
@@ -82,13 +118,23 @@ def iniciar_transmissao(device, stream_url):
         f"[right]crop={right_width}:{crop_height}:{right_x}:{crop_top}[right_crop];"
         f"[left_crop][right_crop]hstack=inputs=2[out]"
     )
+    cortes = f"L({lcl}:{left_width}) R({right_x}:{right_width}) Top/Bottom({crop_top}/{crop_bottom})"
+    return filter_complex, cortes
 
-    ffmpeg_cmd = [
+def captura_e_encode(device, filter_complex):
+    """Entrada da câmera + corte + encode, comum aos dois modos (falta só a saída)."""
+    audio = devices.audio_for(device, fallback="default")
+    audio_in = []
+    if audio["channels"]:
+        audio_in += ["-channels", str(audio["channels"])]
+    if audio["rate"]:
+        audio_in += ["-sample_rate", str(audio["rate"])]
+    return [
         "ffmpeg",
         "-thread_queue_size", "4096",
         "-f", "v4l2", "-framerate", str(args.fps), "-video_size", RESOLUTION,
         "-input_format", "mjpeg", "-i", device,
-        "-thread_queue_size", "4096", "-f", "alsa", "-i", "default",
+        "-thread_queue_size", "4096", "-f", "alsa", *audio_in, "-i", audio["device"],
         "-filter_complex", filter_complex, "-map", "[out]", "-map", "1:a",
         "-vcodec", "libx264", "-preset", "ultrafast", "-tune", "zerolatency",
         "-pix_fmt", "yuv420p", "-r", str(args.fps),
@@ -96,18 +142,252 @@ def iniciar_transmissao(device, stream_url):
         "-g", str(args.fps * 2),
         "-acodec", "aac", "-ar", "44100", "-b:a", "128k",
         "-t", str(args.duration),
-        "-f", "flv", stream_url
     ]
 
+def iniciar_transmissao(device, stream_url):
+    filter_complex, cortes = montar_filtro()
+    if not filter_complex:
+        return
+
+    ffmpeg_cmd = captura_e_encode(device, filter_complex) + ["-f", "flv", stream_url]
+
     print("\n🌟 Iniciando transmissão ao vivo para o YouTube")
     print(f"   🕛 Duração: {args.duration} segundos")
-    print(f"   🎙️ Dispositivo de áudio: default")
     print(f"   🔌 Resolução: {RESOLUTION} @ {args.fps}fps")
-    print(f"   👀 Cortes: L({lcl}:{left_width}) R({right_x}:{right_width}) Top/Bottom({crop_top}/{crop_bottom})")
+    print(f"   👀 Cortes: {cortes}")
     print(f"   ✉️ Enviando para: {stream_url}\n")
 
     subprocess.run(ffmpeg_cmd)
 
+
+# ============================
+# 🛟 Transmissão com spool local
+# ============================
+def _segment_start(path):
+    try:
+        return datetime.datetime.strptime(os.path.basename(path)[:15], "%Y%m%d_%H%M%S").timestamp()
+    except ValueError:
+        return None
+
+def _segments(spool):
+    try:
+        return sorted(os.path.join(spool, f) for f in os.listdir(spool) if f.endswith(".ts"))
+    except OSError:
+        return []
+
+def _em_queda(start, quedas, now):
+    """O segmento [start, start+SEGMENT_SEC] encosta em alguma queda (com pre-roll)?"""
+    margem = PRE_ROLL_SEGMENTS * SEGMENT_SEC
+    for ini, fim in quedas:
+        fim = fim if fim is not None else now
+        if start <= fim and start + SEGMENT_SEC >= ini - margem:
+            return True
+    return False
+
+class RelayRTMP(object):
+    """
+    Repassa o MPEG-TS da captura para um ffmpeg de rede (-c copy -> FLV).
+    Se o RTMP cair, a captura continua; o relay reconecta com backoff e
+    registra os intervalos sem transmissão em self.quedas.
+    """
+
+    def __init__(self, stream_url):
+        self.stream_url = stream_url
+        self.fila = queue.Queue(maxsize=RELAY_QUEUE_CHUNKS)
+        self.quedas = []
+        self.descartados = 0
+        self.net = None
+        self.net_inicio = 0
+        self.tentativas = 0
+        self.proxima_tentativa = 0
+
+    def ler_captura(self, stdout):
+        for chunk in iter(lambda: stdout.read(RELAY_CHUNK), b""):
+            try:
+                self.fila.put_nowait(chunk)
+            except queue.Full:
+                self.descartados += 1
+        self.fila.put(None)
+
+    def _abrir_queda(self):
+        if not self.quedas or self.quedas[-1][1] is not None:
+            self.quedas.append([time.time(), None])
+            print("🔌 RTMP caiu: captura segue no spool local.")
+
+    def _fechar_queda(self):
+        if self.quedas and self.quedas[-1][1] is None:
+            self.quedas[-1][1] = time.time()
+            print(f"🔁 RTMP reconectado após {self.quedas[-1][1] - self.quedas[-1][0]:.0f}s")
+
+    def _conectar(self):
+        cmd = [
+            "ffmpeg", "-v", "error",
+            "-f", "mpegts", "-i", "pipe:0",
+            "-c", "copy", "-bsf:a", "aac_adtstoasc",
+            "-rw_timeout", "15000000",
+            "-f", "flv", self.stream_url
+        ]
+        self.net = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        self.net_inicio = time.time()
+
+    def _derrubar(self):
+        if self.net is not None:
+            try:
+                self.net.stdin.close()
+            except OSError:
+                pass
+            try:
+                self.net.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.net.kill()
+            self.net = None
+        self._abrir_queda()
+        espera = min(RECONNECT_BACKOFF_MAX_SEC, 2 ** self.tentativas)
+        self.tentativas += 1
+        self.proxima_tentativa = time.time() + espera
+        print(f"⏳ Nova tentativa de RTMP em {espera}s")
+
+    def executar(self):
+        """Consome a fila até a captura terminar."""
+        self._conectar()
+        while True:
+            try:
+                chunk = self.fila.get(timeout=1)
+            except queue.Empty:
+                chunk = b""
+            if chunk is None:
+                break
+            if self.net is not None and self.net.poll() is not None:
+                self._derrubar()
+            if self.net is None:
+                if time.time() < self.proxima_tentativa:
+                    continue
+                self._conectar()
+            if not chunk:
+                continue
+            try:
+                self.net.stdin.write(chunk)
+                if self.quedas and self.quedas[-1][1] is None:
+                    self._fechar_queda()
+                if self.tentativas and time.time() - self.net_inicio > NET_STABLE_SEC:
+                    self.tentativas = 0
+            except (BrokenPipeError, OSError):
+                self._derrubar()
+        if self.net is not None:
+            try:
+                self.net.stdin.close()
+            except OSError:
+                pass
+            self.net.wait()
+        self._fechar_queda()
+
+def consolidar_spool(spool, quedas, inicio):
+    """
+    Junta os segmentos gravados durante as quedas num .mp4 em recorded_videos
+    (mesmo padrão de nome do 01v4record), para o 02upload enviar como gravação.
+    """
+    trechos = [p for p in _segments(spool) if _em_queda(_segment_start(p) or 0, quedas, time.time())]
+    if not trechos:
+        return None
+    customer = os.environ.get("CUSTOMER", "unknown_client")
+    equipment = os.environ.get("EQUIPMENT", "unknown_eqp")
+    day_env = os.environ.get("DAY", "").lower()
+    day = DIAS_SEMANA.get(day_env) or DIAS_SEMANA[inicio.strftime("%A").lower()]
+    segundos = len(trechos) * SEGMENT_SEC
+    filename = (
+        f"{inicio.strftime('%Y_%m_%d___%H_%M')}___"
+        f"{customer}_{equipment}_{day}_{segundos / 60:.1f}min.mp4"
+    )
+    os.makedirs(RECORDED_DIR, exist_ok=True)
+    output_path = os.path.join(RECORDED_DIR, filename)
+    lista = os.path.join(spool, "concat.txt")
+    with open(lista, "w", encoding="utf-8") as f:
+        for p in trechos:
+            f.write(f"file '{p}'\n")
+    rc = subprocess.run([
+        "ffmpeg", "-v", "error", "-f", "concat", "-safe", "0", "-i", lista,
+        "-c", "copy", "-bsf:a", "aac_adtstoasc",
+        "-f", "mp4", "-y", file_ready.partial_path(output_path)
+    ]).returncode
+    parcial = file_ready.partial_path(output_path)
+    if rc != 0 or not os.path.exists(parcial):
+        print("⚠️ Falha ao consolidar o spool; segmentos mantidos em", spool)
+        return None
+    meta = {
+        "filename": filename,
+        "customer": customer,
+        "equipment": equipment,
+        "day": day,
+        "slot_id": os.environ.get("SLOT_ID", ""),
+        "recorded_at": inicio.strftime("%Y-%m-%d %H:%M:%S"),
+        "source": "stream_spool",
+        "outages": [[datetime.datetime.fromtimestamp(a).strftime("%H:%M:%S"),
+                     datetime.datetime.fromtimestamp(b).strftime("%H:%M:%S")] for a, b in quedas],
+        "size": os.path.getsize(parcial),
+    }
+    info = sidecar.probe(parcial)
+    if info:
+        meta.update(sidecar.probe_fields(info))
+    # sidecar antes do rename: o .mp4 entra na fila de upload já com os metadados
+    sidecar.write(output_path, meta)
+    file_ready.finalize_partial(output_path)
+    print(f"💾 Trechos sem transmissão salvos para upload: {filename}")
+    return output_path
+
+def iniciar_transmissao_spool(device, stream_url):
+    filter_complex, cortes = montar_filtro()
+    if not filter_complex:
+        return
+
+    inicio = datetime.datetime.now()
+    spool = os.path.join(SPOOL_DIR, inicio.strftime("%Y%m%d_%H%M%S"))
+    os.makedirs(spool, exist_ok=True)
+    segment_pattern = os.path.join(spool, "%Y%m%d_%H%M%S.ts")
+    tee = (
+        f"[f=segment:segment_time={SEGMENT_SEC}:strftime=1:reset_timestamps=1]{segment_pattern}|"
+        f"[f=mpegts:onfail=ignore]pipe:1"
+    )
+    ffmpeg_cmd = captura_e_encode(device, filter_complex) + ["-f", "tee", tee]
+
+    print("\n🌟 Iniciando transmissão ao vivo (spool local + RTMP reconectável)")
+    print(f"   🕛 Duração: {args.duration} segundos")
+    print(f"   🔌 Resolução: {RESOLUTION} @ {args.fps}fps")
+    print(f"   👀 Cortes: {cortes}")
+    print(f"   🛟 Spool: {spool}")
+    print(f"   ✉️ Enviando para: {stream_url}\n")
+
+    captura = subprocess.Popen(ffmpeg_cmd, stdout=subprocess.PIPE)
+    relay = RelayRTMP(stream_url)
+    leitor = threading.Thread(target=relay.ler_captura, args=(captura.stdout,), daemon=True)
+    leitor.start()
+
+    def podar():
+        # apaga segmentos já transmitidos, fora das quedas (com folga para o arquivo em escrita)
+        while captura.poll() is None:
+            time.sleep(SEGMENT_SEC)
+            limite = time.time() - (PRE_ROLL_SEGMENTS + 1) * SEGMENT_SEC
+            for p in _segments(spool):
+                start = _segment_start(p)
+                if start is not None and start + SEGMENT_SEC < limite and not _em_queda(start, relay.quedas, time.time()):
+                    try:
+                        os.remove(p)
+                    except OSError:
+                        pass
+
+    threading.Thread(target=podar, daemon=True).start()
+    relay.executar()
+    captura.wait()
+
+    print(f"🏁 Captura saiu com código {captura.returncode}")
+    if relay.descartados:
+        print(f"⚠️ {relay.descartados} bloco(s) descartados no relay (rede travada); o spool ficou completo.")
+    if relay.quedas:
+        total = sum(b - a for a, b in relay.quedas)
+        print(f"📉 {len(relay.quedas)} queda(s) de RTMP, {total:.0f}s sem transmissão")
+        if consolidar_spool(spool, relay.quedas, inicio) is None:
+            return
+    shutil.rmtree(spool, ignore_errors=True)
+
 #def registrar_link_youtube():
 #    try:
 #        youtube_channel_id = os.getenv("YOUTUBE_CHANNEL_ID", "")
@@ -132,8 +412,11 @@ def iniciar_transmissao(device, stream_url):
 
 def main():
     device = detectar_camera_usb()
-    stream_url = f"rtmp://a.rtmp.youtube.com/live2/{args.stream_key}"
-    iniciar_transmissao(device, stream_url)
+    stream_url = f"{RTMP_BASE_URL}/{args.stream_key}"
+    if args.spool:
+        iniciar_transmissao_spool(device, stream_url)
+    else:
+        iniciar_transmissao(device, stream_url)
     print("✅ Transmissão encerrada.")
     registrar_link_youtube()
 
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# === sheets_journal.py (diário local das escritas na aba registros) ===
+import os
+import re
+import json
+import fcntl
+import socket
+import time
+import hashlib
+from datetime import datetime
+import gspread
+from gspread.utils import rowcol_to_a1
+from google.oauth2.service_account import Credentials
+
+CREDENTIALS_PATH = "/xcoutfy/credentials.json"
+SHEET_NAME = "dbgravacoes"
+SHEET_REGISTERS = "registros"
+
+# Fica em /xcoutfy (não em /tmp) para sobreviver a reboot do equipamento
+JOURNAL_PATH = "/xcoutfy/schedules/sheets_journal.jsonl"
+LOCK_PATH = JOURNAL_PATH + ".lock"
+# Só quem fala com a planilha segura este; o LOCK_PATH fica só para ler/escrever o diário
+FLUSH_LOCK_PATH = JOURNAL_PATH + ".flush.lock"
+INDEX_PATH = "/xcoutfy/schedules/registros_index.json"
+# filenames de links sem linha na planilha: quando foi a última varredura por eles
+MISSING_PATH = "/xcoutfy/schedules/registros_missing.json"
+MISSING_BACKOFF_SEC = 300          # dobra a cada varredura sem achar a linha
+MISSING_BACKOFF_MAX_SEC = 6 * 3600
+BATCH_SIZE = 50
+
+OP_REGISTRO = "registro"
+OP_YOUTUBE_LINK = "youtube_link"
+
+# Sinônimos aceitos no cabeçalho da aba registros (versões antigas da planilha)
+HEADER_SYNONYMS = {
+    "timestamp": ["timestamp", "data_hora", "datahora", "data"],
+    "duration": ["duration", "duracao"],
+    "customer": ["customer", "cliente"],
+    "local": ["local"],
+    "equipment": ["equipment", "equipamento", "eqp"],
+    "day": ["day", "dia_semana", "weekday", "dia"],
+    "filename": ["filename", "arquivo", "file"],
+    "drive_link": ["drive_link", "link", "url"],
+    "youtube_link": ["youtube_link", "yt_link"],
+    "status": ["status"],
+    "notes": ["notes", "observacoes"],
+    "host": ["host", "pc", "hostname"],
+}
+
+
+# =========================
+# Diário (append-only)
+# =========================
+def idempotency_key(op, filename, value=""):
+    return hashlib.sha1(f"{op}|{filename}|{value}".encode("utf-8")).hexdigest()[:16]
+
+def _append_lines(records):
+    os.makedirs(os.path.dirname(JOURNAL_PATH), exist_ok=True)
+    with open(JOURNAL_PATH, "a", encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def _journal_lock():
+    os.makedirs(os.path.dirname(LOCK_PATH), exist_ok=True)
+    lock = open(LOCK_PATH, "w")
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    return lock
+
+def _flush_lock():
+    """Um flush por vez entre processos; quem chega com outro em andamento não espera."""
+    os.makedirs(os.path.dirname(FLUSH_LOCK_PATH), exist_ok=True)
+    lock = open(FLUSH_LOCK_PATH, "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return None
+    return lock
+
+def enqueue(op, filename, value="", **fields):
+    """Grava a escrita pendente no diário antes de tentar a planilha. Retorna a chave."""
+    key = idempotency_key(op, filename, value)
+    with _journal_lock():
+        _append_lines([{
+            "id": key,
+            "op": op,
+            "filename": filename,
+            "value": value,
+            "fields": fields,
+            "queued_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }])
+    return key
+
+def pending():
+    """
+    Entradas ainda sem ack, na ordem em que entraram (uma por chave).
+    attempted=True: já foram mandadas à planilha ao menos uma vez.
+    """
+    entries, acked, attempted = {}, set(), set()
+    try:
+        with open(JOURNAL_PATH, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    r = json.loads(line)
+                except ValueError:
+                    continue  # linha truncada por queda de energia
+                if "ack" in r:
+                    acked.add(r["ack"])
+                elif "attempt" in r:
+                    attempted.add(r["attempt"])
+                elif "id" in r and r["id"] not in entries:
+                    entries[r["id"]] = r
+    except FileNotFoundError:
+        return []
+    left = [e for k, e in entries.items() if k not in acked]
+    for e in left:
+        if e["id"] in attempted:
+            e["attempted"] = True   # o _compact preserva a marca no próprio registro
+    return left
+
+def _ack(keys):
+    if keys:
+        with _journal_lock():
+            _append_lines([{"ack": k} for k in keys])
+
+def _mark_attempted(keys):
+    """Gravado antes do append: se a resposta se perder, o próximo flush relê a planilha antes de repetir."""
+    if keys:
+        with _journal_lock():
+            _append_lines([{"attempt": k} for k in keys])
+
+def _compact():
+    """Reescreve o diário só com o que falta enviar. Chamar com o _journal_lock."""
+    left = pending()
+    tmp = JOURNAL_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for r in left:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, JOURNAL_PATH)
+
+
+# =========================
+# Planilha
+# =========================
+def connect():
+    scopes = [
+        "https://www.googleapis.com/auth/spreadsheets",
+        "https://www.googleapis.com/auth/drive"
+    ]
+    creds = Credentials.from_service_account_file(CREDENTIALS_PATH, scopes=scopes)
+    return gspread.authorize(creds)
+
+def build_row(header, fields):
+    """Monta a linha respeitando a ordem real do cabeçalho."""
+    by_col = {}
+    for field, names in HEADER_SYNONYMS.items():
+        for n in names:
+            by_col.setdefault(n, fields.get(field, ""))
+    return [by_col.get(col.strip().lower(), "") for col in header]
+
+def _find_col(header, field):
+    names = HEADER_SYNONYMS[field]
+    for i, col in enumerate(header):
+        if col.strip().lower() in names:
+            return i + 1
+    return None
+
+# =========================
+# Índice filename -> linha da aba registros
+# =========================
+def _load_index():
+    try:
+        with open(INDEX_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def _save_index(index):
+    os.makedirs(os.path.dirname(INDEX_PATH), exist_ok=True)
+    tmp = INDEX_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp, INDEX_PATH)
+
+def _rescan_index(ws, fname_col):
+    """Varredura completa (só a coluna filename). Usada no primeiro uso e quando o índice diverge."""
+    values = ws.col_values(fname_col)
+    index = {v: row for row, v in enumerate(values, start=1) if row > 1 and v}
+    _save_index(index)
+    print(f"🔎 Índice da aba registros reconstruído ({len(index)} linha(s)).")
+    return index
+
+def _load_missing():
+    try:
+        with open(MISSING_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def _save_missing(missing):
+    try:
+        os.makedirs(os.path.dirname(MISSING_PATH), exist_ok=True)
+        tmp = MISSING_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(missing, f, ensure_ascii=False)
+        os.replace(tmp, MISSING_PATH)
+    except OSError as e:
+        print(f"⚠️ Falha ao salvar pendências do índice: {e}")
+
+def _missing_due(missing, names, now):
+    """Algum filename sem linha ainda não foi procurado dentro do seu backoff?"""
+    for name in names:
+        entry = missing.get(name)
+        if entry is None:
+            return True
+        wait = min(MISSING_BACKOFF_MAX_SEC, MISSING_BACKOFF_SEC * 2 ** (entry["tries"] - 1))
+        if now - entry["at"] >= wait:
+            return True
+    return False
+
+def _rows_from_append(response, count):
+    """Linhas ocupadas por um append_rows, pelo updatedRange da resposta (ex.: registros!A12:L13)."""
+    rng = ((response or {}).get("updates") or {}).get("updatedRange", "")
+    m = re.search(r"![A-Z]+(\d+)", rng)
+    if not m:
+        return None
+    start = int(m.group(1))
+    return list(range(start, start + count))
+
+def _verify_rows(ws, fname_col, targets):
+    """Confere, numa só leitura, se as linhas do índice ainda têm os filenames esperados."""
+    if not targets:
+        return True
+    ranges = [rowcol_to_a1(row, fname_col) for _name, row in targets]
+    values = ws.batch_get(ranges)
+    for (name, _row), vr in zip(targets, values):
+        cell = vr[0][0] if vr and vr[0] else ""
+        if cell != name:
+            return False
+    return True
+
+
+def _flush_registros(ws, header, entries, index):
+    fname_col = _find_col(header, "filename")
+    # append já tentado e não confirmado no índice: pode ter entrado na planilha
+    # sem resposta (timeout) ou antes de o processo cair; relê antes de repetir
+    retried = [e for e in entries if e.get("attempted") and e["filename"] not in index]
+    if fname_col and (not index or retried):
+        index.clear()
+        index.update(_rescan_index(ws, fname_col))
+    rows, names, done = [], [], []
+    for e in entries:
+        done.append(e["id"])
+        if e["filename"] in index or e["filename"] in names:
+            continue  # já está na planilha: retry idempotente
+        names.append(e["filename"])
+        if header:
+            rows.append(build_row(header, dict(e["fields"], filename=e["filename"])))
+        else:
+            f = e["fields"]
+            rows.append([f.get("timestamp", ""), e["filename"], f.get("drive_link", ""), f.get("host", "")])
+    if rows:
+        _mark_attempted(done)
+        response = ws.append_rows(rows, value_input_option="USER_ENTERED")
+        appended = _rows_from_append(response, len(rows))
+        if appended:
+            index.update(zip(names, appended))
+            _save_index(index)
+        elif fname_col:
+            index.clear()
+            index.update(_rescan_index(ws, fname_col))
+    return done
+
+def _link_name(entry):
+    """
+    Filename da linha alvo do link. Entradas antigas do a07broadcast vinham
+    sem extensão ("X" em vez de "X.mp4") e nunca casavam com o índice.
+    """
+    name = entry["filename"]
+    return name if os.path.splitext(name)[1] else name + ".mp4"
+
+def _flush_links(ws, header, entries, index):
+    done = []
+    link_col = _find_col(header, "youtube_link")
+    fname_col = _find_col(header, "filename")
+    if not link_col or not fname_col:
+        return [e["id"] for e in entries]
+    if not index:
+        index.update(_rescan_index(ws, fname_col))
+
+    names = [_link_name(e) for e in entries]
+    targets = [(name, index[name]) for name in names if name in index]
+    absent = [name for name in names if name not in index]
+    missing = _load_missing()
+    now = time.time()
+    # linha reordenada/removida: reconstrói sempre; filename sem linha (registro
+    # pendente ou apagado da planilha): só dentro do backoff, senão cada flush relê a coluna
+    if not _verify_rows(ws, fname_col, targets) or _missing_due(missing, absent, now):
+        index.clear()
+        index.update(_rescan_index(ws, fname_col))
+        for name in absent:
+            if name in index:
+                missing.pop(name, None)
+            else:
+                tries = missing.get(name, {}).get("tries", 0) + 1
+                missing[name] = {"at": now, "tries": tries}
+        _save_missing(missing)
+
+    updates = []
+    for e, name in zip(entries, names):
+        row = index.get(name)
+        if row is None:
+            continue  # sem linha ainda (registro pendente): fica para o próximo flush
+        updates.append({"range": rowcol_to_a1(row, link_col), "values": [[e["value"]]]})
+        done.append(e["id"])
+    found = [name for name in missing if name in index]
+    if found:
+        # a linha apareceu (ex.: registro enviado neste mesmo flush)
+        for name in found:
+            missing.pop(name)
+        _save_missing(missing)
+    if updates:
+        ws.batch_update(updates, value_input_option="USER_ENTERED")
+    return done
+
+def flush(client=None, worksheet=None):
+    """
+    Reenvia as escritas pendentes em lotes. Seguro para rodar em paralelo
+    (um flush por vez; os outros saem e deixam no diário) e repetido (chaves
+    de idempotência). O lock do diário nunca fica preso durante a rede, para
+    não travar o enqueue da gravação/upload. Retorna quantas entradas
+    continuam pendentes.
+    """
+    flush_lock = _flush_lock()
+    if flush_lock is None:
+        left = len(pending())
+        print(f"ℹ️ Outro processo está sincronizando o Sheets; {left} escrita(s) seguem no diário.")
+        return left
+    with flush_lock:
+        entries = pending()
+        if not entries:
+            return 0
+        try:
+            if worksheet is None:
+                client = client or connect()
+                worksheet = client.open(SHEET_NAME).worksheet(SHEET_REGISTERS)
+            header = worksheet.row_values(1)
+            index = _load_index()
+            for i in range(0, len(entries), BATCH_SIZE):
+                batch = entries[i:i + BATCH_SIZE]
+                regs = [e for e in batch if e["op"] == OP_REGISTRO]
+                links = [e for e in batch if e["op"] == OP_YOUTUBE_LINK]
+                if regs:
+                    _ack(_flush_registros(worksheet, header, regs, index))
+                if links:
+                    _ack(_flush_links(worksheet, header, links, index))
+        except Exception as e:
+            print(f"⚠️ Sheets indisponível, {len(pending())} escrita(s) seguem no diário: {e}")
+        with _journal_lock():
+            _compact()
+            left = len(pending())
+        if left == 0:
+            print(f"📊 Diário do Sheets sincronizado ({len(entries)} escrita(s)).")
+        return left
+
+def sheets_reachable(timeout=3):
+    try:
+        socket.create_connection(("sheets.googleapis.com", 443), timeout=timeout).close()
+        return True
+    except OSError:
+        return False
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# === sidecar.py (metadados JSON que acompanham cada vídeo) ===
+import os
+import json
+import shutil
+import subprocess
+
+# O sidecar usa o nome sem extensão, então "<stem>.json" continua válido
+# quando o vídeo vira .mp4 -> .uploaded -> .broadcasted.
+SIDECAR_EXT = ".json"
+
+
+def sidecar_path(media_path):
+    stem = os.path.splitext(os.path.basename(media_path))[0]
+    return os.path.join(os.path.dirname(media_path), stem + SIDECAR_EXT)
+
+def read(media_path):
+    try:
+        with open(sidecar_path(media_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def write(media_path, data):
+    path = sidecar_path(media_path)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+def update(media_path, **fields):
+    """Mescla campos no sidecar (cria se não existir). Nunca derruba o chamador."""
+    try:
+        data = read(media_path)
+        data.update(fields)
+        write(media_path, data)
+        return data
+    except Exception as e:
+        print(f"⚠️ Falha ao atualizar sidecar de {os.path.basename(media_path)}: {e}")
+        return {}
+
+def move_with_media(src, dst):
+    """shutil.move do vídeo levando o sidecar junto."""
+    shutil.move(src, dst)
+    sc_src, sc_dst = sidecar_path(src), sidecar_path(dst)
+    if os.path.exists(sc_src) and sc_src != sc_dst:
+        shutil.move(sc_src, sc_dst)
+
+
+# =========================
+# Probe
+# =========================
+def probe(path):
+    """Retorna {'codec', 'pix_fmt', 'width', 'height', 'audio', 'duration'} via ffprobe, ou None."""
+    try:
+        out = subprocess.check_output([
+            "ffprobe", "-v", "error",
+            "-show_entries", "stream=codec_type,codec_name,pix_fmt,width,height:format=duration",
+            "-of", "json", path
+        ], stderr=subprocess.DEVNULL)
+        data = json.loads(out.decode())
+        streams = data.get("streams") or []
+        video = next((s for s in streams if s.get("codec_type") == "video"), {})
+        audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+        return {
+            "codec": video.get("codec_name", ""),
+            "pix_fmt": video.get("pix_fmt", ""),
+            "width": int(video.get("width", 0) or 0),
+            "height": int(video.get("height", 0) or 0),
+            "audio": audio.get("codec_name", ""),
+            "duration": float(data.get("format", {}).get("duration", 0) or 0),
+        }
+    except Exception:
+        return None
+
+def probe_fields(info, size=None):
+    """Converte o resultado do probe nos campos gravados no sidecar."""
+    fields = {
+        "duration_sec": round(info["duration"], 2),
+        "video_codec": info["codec"],
+        "pix_fmt": info["pix_fmt"],
+        "width": info["width"],
+        "height": info["height"],
+        "audio_codec": info["audio"],
+    }
+    if size is not None:
+        fields["size"] = size
+    return fields
+
+def media_info(media_path):
+    """
+    Dados de mídia no formato do probe(), lidos do sidecar. Só roda ffprobe
+    se o sidecar não existir/estiver incompleto (ex.: arquivo antigo), e
+    guarda o resultado para a próxima vez.
+    """
+    sc = read(media_path)
+    keys = ("duration_sec", "video_codec", "pix_fmt", "width", "height", "audio_codec")
+    if all(k in sc for k in keys):
+        return {
+            "codec": sc["video_codec"],
+            "pix_fmt": sc["pix_fmt"],
+            "width": sc["width"],
+            "height": sc["height"],
+            "audio": sc["audio_codec"],
+            "duration": float(sc["duration_sec"]),
+        }
+    info = probe(media_path)
+    if info:
+        update(media_path, **probe_fields(info, os.path.getsize(media_path)))
+    return info
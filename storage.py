@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# === storage.py (espaço em disco: admissão, retenção e tiers de gravação) ===
+import os
+import re
+import json
+import shutil
+import time
+import threading
+import metrics
+import sidecar
+import file_ready
+
+# Folga mínima que sempre fica livre no cartão (sistema, logs, sidecars)
+RESERVE_BYTES = int(os.getenv("XC_DISK_RESERVE_MB", 1024)) * 1024 * 1024
+FORECAST_MARGIN = 1.15      # mpeg4 em VBR passa do bitrate nominal
+AUDIO_BPS = 128_000
+# Retenção: só arquivos já enviados, verificados no Drive e transmitidos
+RETENTION_DIRS = [("/xcoutfy/broadcastdone", ".broadcasted")]
+RETENTION_MIN_AGE_DAYS = float(os.getenv("XC_RETENTION_MIN_AGE_DAYS", 2))
+
+# Tiers de gravação (ordem = preferência no empate); todos são lidos pelo 02upload
+RECORDING_TIERS = [d.strip() for d in os.getenv(
+    "XC_STORAGE_TIERS", "/xcoutfy/recorded_videos,/xcoutfy/storage_videos").split(",") if d.strip()]
+BENCH_PATH = "/xcoutfy/schedules/storage_bench.json"
+BENCH_MB = 64
+BENCH_MAX_AGE_SEC = 24 * 3600
+BENCH_CHECK_SEC = 600       # o 00agenda confere a idade das medições nesse intervalo, ocioso
+WRITE_MARGIN = 3.0          # o tier precisa escrever 3× o bitrate da gravação
+MIGRATE_BELOW_FREE = 0.20   # tier com menos de 20% livre manda vídeos prontos para outro
+MIGRATE_CHUNK = 4 * 1024 * 1024
+
+
+def parse_bitrate(value):
+    """'5M' / '800k' / '2500000' -> bits/s."""
+    m = re.fullmatch(r"\s*([\d.]+)\s*([kKmMgG]?)\s*", str(value or ""))
+    if not m:
+        return 0
+    mult = {"": 1, "k": 1e3, "m": 1e6, "g": 1e9}[m.group(2).lower()]
+    return int(float(m.group(1)) * mult)
+
+def forecast_bytes(bitrate, duration_sec):
+    """Bytes esperados para uma gravação: (vídeo + áudio) × duração, com margem."""
+    bps = parse_bitrate(bitrate) + AUDIO_BPS
+    return int(bps * duration_sec / 8 * FORECAST_MARGIN)
+
+def free_bytes(path):
+    return shutil.disk_usage(path).free
+
+
+# =========================
+# Retenção
+# =========================
+def _evictable(path):
+    """Só sai do disco o que tem prova no sidecar: upload verificado + broadcast feito."""
+    sc = sidecar.read(path)
+    if not sc.get("remote_verified") or not sc.get("broadcasted_at"):
+        return False
+    try:
+        age_days = (time.time() - os.path.getmtime(path)) / 86400
+    except OSError:
+        return False
+    return age_days >= RETENTION_MIN_AGE_DAYS
+
+def eviction_candidates(dev=None):
+    """
+    Arquivos elegíveis, do mais antigo para o mais novo (nome começa com a data).
+    dev: só os que estão nesse dispositivo (st_dev), os únicos que liberam espaço nele.
+    """
+    found = []
+    for d, suffix in RETENTION_DIRS:
+        try:
+            names = os.listdir(d)
+        except OSError:
+            continue
+        for f in names:
+            path = os.path.join(d, f)
+            if not f.endswith(suffix) or not _evictable(path):
+                continue
+            try:
+                if dev is not None and os.stat(path).st_dev != dev:
+                    continue
+            except OSError:
+                continue
+            found.append(path)
+    return sorted(found, key=os.path.basename)
+
+def _remove_with_sidecar(path):
+    size = os.path.getsize(path)
+    os.remove(path)
+    sc = sidecar.sidecar_path(path)
+    if os.path.exists(sc):
+        os.remove(sc)
+    return size
+
+
+# =========================
+# Admissão
+# =========================
+def admit(target_dir, needed_bytes):
+    """
+    Garante needed_bytes + RESERVE_BYTES livres em target_dir, apagando os
+    arquivos mais antigos já processados se preciso. Retorna (ok, livre_depois).
+    Exporta a folga como métrica disk_headroom.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    free = free_bytes(target_dir)
+    evicted, evicted_bytes = [], 0
+    if free - needed_bytes < RESERVE_BYTES:
+        # apagar do cartão não libera nada no HDD USB (e vice-versa)
+        for path in eviction_candidates(os.stat(target_dir).st_dev):
+            try:
+                evicted_bytes += _remove_with_sidecar(path)
+                evicted.append(os.path.basename(path))
+            except OSError as e:
+                print(f"⚠️ Falha ao remover {os.path.basename(path)}: {e}")
+                continue
+            free = free_bytes(target_dir)
+            if free - needed_bytes >= RESERVE_BYTES:
+                break
+        if evicted:
+            print(f"🧹 Retenção: {len(evicted)} arquivo(s) antigos removidos ({evicted_bytes / 1e9:.2f} GB)")
+    ok = free - needed_bytes >= RESERVE_BYTES
+    metrics.emit(
+        "disk_headroom",
+        path=target_dir,
+        free_bytes=free,
+        forecast_bytes=needed_bytes,
+        headroom_bytes=free - needed_bytes - RESERVE_BYTES,
+        admitted=ok,
+        evicted_files=len(evicted),
+        evicted_bytes=evicted_bytes,
+    )
+    return ok, free
+
+def fit_duration(bitrate, free, reserve=None):
+    """Maior duração (s) que cabe em free, dado o bitrate."""
+    reserve = RESERVE_BYTES if reserve is None else reserve
+    per_sec = forecast_bytes(bitrate, 1) or 1
+    return max(0, int((free - reserve) / per_sec))
+
+
+# =========================
+# Tiers: benchmark de escrita
+# =========================
+def _load_bench():
+    try:
+        with open(BENCH_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def _save_bench(state):
+    os.makedirs(os.path.dirname(BENCH_PATH), exist_ok=True)
+    tmp = BENCH_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, BENCH_PATH)
+
+def bench_write(path, size_mb=BENCH_MB):
+    """Escrita sequencial com fsync (o que o ffmpeg sustenta). Retorna bytes/s ou 0."""
+    os.makedirs(path, exist_ok=True)
+    tmp = os.path.join(path, ".xc_bench.tmp")
+    block = os.urandom(1024 * 1024)
+    try:
+        t0 = time.time()
+        with open(tmp, "wb") as f:
+            for _ in range(size_mb):
+                f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+        elapsed = time.time() - t0
+        return size_mb * len(block) / elapsed if elapsed > 0 else 0
+    except OSError as e:
+        print(f"⚠️ Benchmark de escrita falhou em {path}: {e}")
+        return 0
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def tier_throughput(refresh=False):
+    """{tier: bytes/s}, medindo de novo o que não tiver medição recente."""
+    state = _load_bench()
+    changed = False
+    for tier in RECORDING_TIERS:
+        entry = state.get(tier, {})
+        if refresh or time.time() - entry.get("ts", 0) > BENCH_MAX_AGE_SEC:
+            bps = bench_write(tier)
+            state[tier] = {"bps": bps, "ts": time.time()}
+            changed = True
+            print(f"💽 {tier}: escrita sustentada {bps * 8 / 1e6:.0f} Mbit/s")
+            metrics.emit("storage_bench", path=tier, write_bps=round(bps))
+    if changed:
+        _save_bench(state)
+    return {t: state[t]["bps"] for t in RECORDING_TIERS}
+
+def cached_throughput():
+    """{tier: bytes/s} só do cache (mesmo vencido), sem medir: o gravador não pode esperar I/O."""
+    state = _load_bench()
+    return {t: state[t]["bps"] for t in RECORDING_TIERS if t in state}
+
+_last_bench_check = 0.0
+_bench_thread = None
+
+def refresh_stale_bench():
+    """
+    Chamado pelo 00agenda com o equipamento ocioso: mede de novo os tiers
+    vencidos numa thread (64 MB com fsync levam segundos e o loop não pode parar).
+    """
+    global _last_bench_check, _bench_thread
+    if time.time() - _last_bench_check < BENCH_CHECK_SEC:
+        return
+    if _bench_thread is not None and _bench_thread.is_alive():
+        return
+    _last_bench_check = time.time()
+    _bench_thread = threading.Thread(target=_bench_stale, name="storage_bench", daemon=True)
+    _bench_thread.start()
+
+def _bench_stale():
+    try:
+        tier_throughput()
+    except Exception as e:
+        print(f"⚠️ Benchmark dos tiers falhou: {e}")
+
+def pick_recording_dir(bitrate, duration_sec):
+    """
+    Tier mais rápido entre os que sustentam WRITE_MARGIN × o bitrate e têm
+    espaço para a previsão; sem nenhum com espaço, o mais rápido que sustenta
+    (a admissão/retenção resolve o espaço). Fallback: primeiro tier.
+    """
+    need_bps = (parse_bitrate(bitrate) + AUDIO_BPS) / 8 * WRITE_MARGIN
+    needed = forecast_bytes(bitrate, duration_sec)
+    speeds = cached_throughput()
+    if not speeds:
+        # sem nenhuma medição ainda (1º boot): ordem de preferência; o 00agenda mede quando ocioso
+        return RECORDING_TIERS[0]
+    able = sorted((t for t in RECORDING_TIERS if speeds.get(t, 0) >= need_bps),
+                  key=lambda t: speeds[t], reverse=True)
+    for tier in able:
+        try:
+            if free_bytes(tier) - needed >= RESERVE_BYTES:
+                return tier
+        except OSError:
+            continue
+    if able:
+        return able[0]
+    print(f"⚠️ Nenhum tier sustenta {need_bps * 8 / 1e6:.1f} Mbit/s com margem; usando {RECORDING_TIERS[0]}")
+    return RECORDING_TIERS[0]
+
+
+# =========================
+# Tiers: migração em segundo plano
+# =========================
+def _copy_then_replace(src, dst, abort):
+    """
+    Cópia para .part com fsync, rename atômico e só então remove a origem
+    (com sidecar). Se abort (Event) for setado no meio, descarta o .part.
+    """
+    part = file_ready.partial_path(dst)
+    with open(src, "rb") as fi, open(part, "wb") as fo:
+        while True:
+            if abort.is_set():
+                break
+            chunk = fi.read(MIGRATE_CHUNK)
+            if not chunk:
+                break
+            fo.write(chunk)
+        fo.flush()
+        os.fsync(fo.fileno())
+    if abort.is_set() or os.path.getsize(part) != os.path.getsize(src):
+        os.remove(part)
+        raise OSError("interrompida" if abort.is_set() else "tamanho divergente após a cópia")
+    sc_src = sidecar.sidecar_path(src)
+    if os.path.exists(sc_src):
+        shutil.copy2(sc_src, sidecar.sidecar_path(dst))
+    file_ready.finalize_partial(dst)
+    os.remove(src)
+    if os.path.exists(sc_src):
+        os.remove(sc_src)
+
+class TierMigrator(object):
+    """
+    Move vídeos prontos, um por vez numa thread, do tier apertado para o de
+    mais espaço livre (outro disco). tick(idle=False) interrompe a cópia em
+    andamento (ex.: RECORDING começando); a origem fica intacta.
+    """
+
+    def __init__(self, tiers=None):
+        self.tiers = tiers or RECORDING_TIERS
+        self._thread = None
+        self._abort = threading.Event()
+
+    def _plan(self):
+        usage = {}
+        for t in self.tiers:
+            try:
+                du = shutil.disk_usage(t)
+                usage[t] = (os.stat(t).st_dev, du.free, du.free / du.total if du.total else 1)
+            except OSError:
+                continue
+        if len(usage) < 2:
+            return None, None
+        target = max(usage, key=lambda t: usage[t][1])
+        for src, (dev, _free, ratio) in usage.items():
+            if src != target and dev != usage[target][0] and ratio < MIGRATE_BELOW_FREE:
+                return src, target
+        return None, None
+
+    def busy(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def tick(self, idle):
+        if not idle:
+            if self.busy():
+                self._abort.set()
+            return
+        if self.busy():
+            return
+        src_dir, dst_dir = self._plan()
+        if not src_dir:
+            return
+        try:
+            names = sorted(f for f in os.listdir(src_dir) if f.endswith(".mp4"))
+        except OSError:
+            return
+        for f in names:
+            if file_ready.is_file_ready(os.path.join(src_dir, f)):
+                self._abort.clear()
+                self._thread = threading.Thread(target=self._migrate, args=(f, src_dir, dst_dir),
+                                                name="tier_migration", daemon=True)
+                self._thread.start()
+                return
+
+    def _migrate(self, f, src_dir, dst_dir):
+        src, dst = os.path.join(src_dir, f), os.path.join(dst_dir, f)
+        t0 = time.time()
+        try:
+            size = os.path.getsize(src)
+            _copy_then_replace(src, dst, self._abort)
+        except OSError as e:
+            print(f"⚠️ Migração de {f} não concluída: {e}")
+            return
+        print(f"🚚 Migrado {f}: {src_dir} -> {dst_dir} ({size / 1e6:.0f} MB em {time.time() - t0:.0f}s)")
+        metrics.emit("storage_migration", file=f, src=src_dir, dst=dst_dir, size=size,
+                     elapsed_sec=round(time.time() - t0, 1))
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# === thermal.py (controle adaptativo por temperatura, carga e speed do encoder) ===
+#   replay de amostras sintéticas: python3 thermal.py amostras.jsonl
+#   (uma linha por amostra: {"temp_c": 78, "load": 0.95, "speed": 0.98})
+import os
+import sys
+import json
+import glob
+import time
+import metrics
+
+STATE_PATH = "/tmp/xcoutfy_thermal.json"
+RECORD_HEALTH_PATH = "/tmp/xcoutfy_record_health.json"   # publicado pelo 01v4record
+HEALTH_MAX_AGE_SEC = 10
+
+# Degraus, do mais leve ao mais agressivo
+LEVEL_NORMAL = 0
+LEVEL_NO_BACKGROUND = 1    # sem transcode/migração em segundo plano
+LEVEL_UPLOAD_PAUSED = 2    # upload (rclone) suspenso enquanto a situação durar
+LEVEL_ENCODER_REDUCED = 3  # próxima gravação com fps reduzido
+LEVEL_NAMES = ["normal", "sem_segundo_plano", "upload_pausado", "encoder_reduzido"]
+
+TEMP_HIGH_C = float(os.getenv("XC_TEMP_HIGH_C", 75))
+TEMP_CRIT_C = float(os.getenv("XC_TEMP_CRIT_C", 82))
+TEMP_HYSTERESIS_C = 5
+LOAD_HIGH = 0.9            # load average por núcleo
+SPEED_WARN = 0.98          # encoder começando a perder o tempo real
+SPEED_CRIT = 0.95
+UP_AFTER = 2               # amostras seguidas sob estresse para subir um degrau
+DOWN_AFTER = 6             # amostras seguidas calmas para descer um degrau
+REDUCED_FPS = 24
+
+
+class AdaptiveController(object):
+    """
+    Decide o degrau a partir de (temperatura, carga, speed). Não lê sensores
+    nem age sobre processos: update() recebe os valores e devolve
+    (nível, motivo), então pode ser exercitado com entradas sintéticas.
+    Sobe um degrau após UP_AFTER amostras estressadas (na hora se crítico) e
+    desce um após DOWN_AFTER amostras calmas (com histerese na temperatura).
+    """
+
+    def __init__(self, level=LEVEL_NORMAL):
+        self.level = level
+        self._stressed = 0
+        self._calm = 0
+        self.decisions = []
+
+    def _classify(self, temp_c, load, speed):
+        reasons = []
+        critical = False
+        if temp_c is not None and temp_c >= TEMP_CRIT_C:
+            reasons.append(f"temp {temp_c:.0f}°C crítica")
+            critical = True
+        elif temp_c is not None and temp_c >= TEMP_HIGH_C:
+            reasons.append(f"temp {temp_c:.0f}°C")
+        if load is not None and load >= LOAD_HIGH:
+            reasons.append(f"carga {load:.2f}/núcleo")
+        if speed is not None and speed < SPEED_CRIT:
+            reasons.append(f"encoder {speed:.2f}x")
+            critical = True
+        elif speed is not None and speed < SPEED_WARN:
+            reasons.append(f"encoder {speed:.2f}x")
+        calm = (
+            not reasons
+            and (temp_c is None or temp_c < TEMP_HIGH_C - TEMP_HYSTERESIS_C)
+            and (load is None or load < LOAD_HIGH * 0.8)
+        )
+        return reasons, critical, calm
+
+    def update(self, temp_c, load, speed=None):
+        reasons, critical, calm = self._classify(temp_c, load, speed)
+        previous = self.level
+        reason = ", ".join(reasons)
+        if reasons:
+            self._calm = 0
+            self._stressed += 1
+            if (critical or self._stressed >= UP_AFTER) and self.level < LEVEL_ENCODER_REDUCED:
+                self.level += 1
+                self._stressed = 0
+        elif calm:
+            self._stressed = 0
+            self._calm += 1
+            if self._calm >= DOWN_AFTER and self.level > LEVEL_NORMAL:
+                self.level -= 1
+                self._calm = 0
+                reason = "estável"
+        else:
+            # zona de histerese: mantém o degrau
+            self._stressed = 0
+            self._calm = 0
+        if self.level != previous:
+            self.decisions.append({"from": previous, "to": self.level, "reason": reason,
+                                   "temp_c": temp_c, "load": load, "speed": speed})
+        return self.level, reason
+
+
+# =========================
+# Sensores (psutil / sysfs)
+# =========================
+def read_temperature():
+    try:
+        import psutil
+        temps = psutil.sensors_temperatures() or {}
+        values = [t.current for entries in temps.values() for t in entries if t.current]
+        if values:
+            return max(values)
+    except (ImportError, AttributeError):
+        pass
+    values = []
+    for path in glob.glob("/sys/class/thermal/thermal_zone*/temp"):
+        try:
+            with open(path) as f:
+                values.append(int(f.read().strip()) / 1000)
+        except (OSError, ValueError):
+            continue
+    return max(values) if values else None
+
+def read_load():
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except OSError:
+        return None
+
+def read_encoder_speed():
+    """
+    speed da gravação em andamento (estado publicado pelo 01v4record): já
+    calculado por intervalo, só depois do 1º quadro. O speed= do ffmpeg é
+    acumulado desde o disparo e fica abaixo de 1 por minutos após o pré-aquecimento.
+    """
+    try:
+        if time.time() - os.path.getmtime(RECORD_HEALTH_PATH) > HEALTH_MAX_AGE_SEC:
+            return None
+        with open(RECORD_HEALTH_PATH, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get("status") != "recording" or not state.get("out_time_sec"):
+        return None
+    return state.get("speed")
+
+def read_sensors():
+    return read_temperature(), read_load(), read_encoder_speed()
+
+
+# =========================
+# Estado compartilhado
+# =========================
+def save_state(level, reason, temp_c, load, speed):
+    state = {"level": level, "name": LEVEL_NAMES[level], "reason": reason,
+             "temp_c": temp_c, "load": load, "speed": speed, "ts": time.time()}
+    try:
+        tmp = STATE_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, STATE_PATH)
+    except OSError:
+        pass
+
+def current_level(max_age_sec=300):
+    """Degrau publicado pelo 00agenda (0 se não houver estado recente)."""
+    try:
+        with open(STATE_PATH, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return LEVEL_NORMAL
+    if time.time() - state.get("ts", 0) > max_age_sec:
+        return LEVEL_NORMAL
+    return int(state.get("level", LEVEL_NORMAL))
+
+def log_decision(decision):
+    print(f"🌡️ Controle térmico: {LEVEL_NAMES[decision['from']]} -> {LEVEL_NAMES[decision['to']]}"
+          f" ({decision['reason']})")
+    metrics.emit("thermal_decision", level=decision["to"], level_name=LEVEL_NAMES[decision["to"]],
+                 **{k: decision[k] for k in ("reason", "temp_c", "load", "speed")})
+
+
+def replay(path):
+    """Roda o controlador sobre amostras sintéticas e mostra cada decisão."""
+    ctrl = AdaptiveController()
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            s = json.loads(line)
+            level, reason = ctrl.update(s.get("temp_c"), s.get("load"), s.get("speed"))
+            print(f"{n:4d}  temp={s.get('temp_c')}  load={s.get('load')}  speed={s.get('speed')}"
+                  f"  -> {LEVEL_NAMES[level]}{'  (' + reason + ')' if reason else ''}")
+    return ctrl.decisions
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("uso: python3 thermal.py amostras.jsonl")
+        sys.exit(1)
+    replay(sys.argv[1])
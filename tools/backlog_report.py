@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# Relatório semanal de capacidade: gravação x janelas FREE2UP x uplink medido,
+# orçamento de bitrate por slot e a curva projetada do backlog de upload.
+#   uso: python3 tools/backlog_report.py [--host xcpc16] [--uplink-mbit 8]
+import os
+import sys
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import capacity
+
+BAR_WIDTH = 40
+
+
+def _curve_rows(curve, every_sec=3 * 3600):
+    """Uma amostra a cada every_sec (a curva tem passo SIM_STEP_SEC)."""
+    step = max(1, every_sec // capacity.SIM_STEP_SEC)
+    return curve[::step] + ([curve[-1]] if (len(curve) - 1) % step else [])
+
+def main():
+    parser = argparse.ArgumentParser(description="Projeção semanal do backlog de upload")
+    parser.add_argument("--host", default=None, help="equipamento (padrão: hostname)")
+    parser.add_argument("--uplink-mbit", type=float, default=None, help="sobrepõe o uplink medido")
+    args = parser.parse_args()
+
+    agenda = capacity.load_agenda(args.host)
+    bps = args.uplink_mbit * 1e6 / 8 if args.uplink_mbit else None
+    model = capacity.weekly_model(agenda, bps)
+    bps = model["uplink_bps"]
+
+    print(f"📊 Capacidade semanal ({args.host or 'este equipamento'})")
+    print(f"   🎥 {model['recordings']} gravação(ões), {model['record_sec'] / 3600:.1f} h")
+    print(f"   📤 Janelas FREE2UP: {model['window_sec'] / 3600:.1f} h @ {bps * 8 / 1e6:.2f} Mbit/s "
+          f"= {model['capacity_bytes'] / 1e9:.1f} GB")
+    print(f"   💾 Gravações no bitrate da agenda: {model['scheduled_bytes'] / 1e9:.1f} GB")
+    print(f"   📦 Backlog atual: {model['backlog_bytes'] / 1e9:.1f} GB")
+    budget = model["budget_video_bps"]
+    if budget is not None:
+        print(f"   🎯 Bitrate sustentável: {budget / 1e6:.2f} Mbit/s de vídeo"
+              f"{' (abaixo do mínimo, backlog vai crescer)' if budget < capacity.MIN_BITRATE_BPS else ''}")
+
+    print("\n🔸 Bitrate por slot:")
+    for r in sorted(agenda, key=lambda r: (capacity.WEEKDAYS.index(str(r.get("day", "")).lower())
+                                           if str(r.get("day", "")).lower() in capacity.WEEKDAYS else 7,
+                                           int(r.get("hour", 0) or 0), int(r.get("minute", 0) or 0))):
+        if str(r.get("type", "RECORDING")).upper() != "RECORDING":
+            continue
+        bitrate, reason = capacity.slot_bitrate(r, model)
+        print(f"   {r.get('day'):<9} {int(r.get('hour', 0)):02d}:{int(r.get('minute', 0)):02d} "
+              f"{r.get('customer', ''):<8} agenda {r.get('bitrate') or capacity.DEFAULT_BITRATE:>6} -> {bitrate:>6}  ({reason})")
+
+    now = datetime.now()
+    as_is = capacity.project_backlog(agenda, bps, model["backlog_bytes"], use_budget=False, now=now)
+    budgeted = capacity.project_backlog(agenda, bps, model["backlog_bytes"], use_budget=True, now=now)
+    peak = max(b for _t, b in as_is + budgeted) or 1
+
+    print("\n📈 Backlog projetado (█ agenda atual, ░ com orçamento):")
+    for (t, a), (_t, b) in zip(_curve_rows(as_is), _curve_rows(budgeted)):
+        bar_a = "█" * int(BAR_WIDTH * a / peak)
+        bar_b = "░" * int(BAR_WIDTH * b / peak)
+        print(f"   {t.strftime('%a %d %H:%M')}  {a / 1e9:6.1f} GB {bar_a}")
+        print(f"   {'':>12}  {b / 1e9:6.1f} GB {bar_b}")
+    print(f"\n   Fim da semana: {as_is[-1][1] / 1e9:.1f} GB (agenda) x {budgeted[-1][1] / 1e9:.1f} GB (orçamento)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# Compara o custo de CPU do broadcast com encode em tempo real (libx264) x remux (-c copy)
+# sobre uma gravação de amostra. Saída FLV vai para um arquivo temporário, não para o YouTube.
+#   uso: python3 tools/bench_broadcast_cpu.py /xcoutfy/uploaded_videos/<arquivo> [--seconds 60]
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from a07broadcast import build_stream_cmd
+from benchlib import broadcast_assets, run_measured
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de CPU: broadcast encode x copy")
+    parser.add_argument("sample")
+    parser.add_argument("--seconds", type=int, default=60, help="trecho transmitido em cada modo (-re)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="xc_bench_")
+    try:
+        clip, asset, res, prep_cpu = broadcast_assets(args.sample, args.seconds, workdir)
+        print(f"🗜️ Preparação do asset: {res['status']} em {res['elapsed']:.1f}s, CPU {prep_cpu:.1f}s "
+              f"(off-peak, uma vez por vídeo)")
+
+        sink = os.path.join(workdir, "out.flv")
+        rows = []
+        for label, path, copy in (("encode libx264", clip, False), ("remux -c copy", asset, True)):
+            rc, cpu, wall = run_measured(build_stream_cmd(path, sink, copy)[:-1] + ["-y", sink])
+            rows.append((label, rc, cpu, wall))
+
+        print(f"\n📊 Broadcast de {args.seconds}s em tempo real (-re):")
+        for label, rc, cpu, wall in rows:
+            pct = 100 * cpu / wall if wall else 0
+            print(f"   {label:<16} rc={rc}  CPU {cpu:6.1f}s  parede {wall:6.1f}s  média {pct:5.1f}% de um núcleo")
+        if rows[0][2] > 0:
+            print(f"   ➡️ copy usa {100 * rows[1][2] / rows[0][2]:.1f}% da CPU do encode")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# Confere e mede o frame_faults fora da gravação:
+#   1) sequências sintéticas (campo parado com ruído, imagem travada, preto, movimento)
+#      pelo FrameFaultDetector, com o alerta esperado para cada uma e a CPU do detector;
+#   2) com ffmpeg: custo do ramo de análise (1 fps, 1/8, cinza) no mesmo processo da
+#      gravação, sobre a câmera sintética 2560x720@30 (meta: < 5% de CPU a mais).
+#   uso: python3 tools/bench_frame_faults.py [--seconds 60] [--no-ffmpeg]
+#   sai com código 1 se alguma sequência não der o alerta esperado.
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import frame_faults
+from benchlib import CROP_FILTER, RECORD_ARGS, SYNTHETIC_INPUTS, run_measured
+
+LENS_WIDTH, CROP_HEIGHT = 980, 720   # corte padrão do 01v4record
+SAMPLES = 20
+
+
+def _sequences(np, width, height):
+    """{nome: (quadros, falhas esperadas em cada lente)}"""
+    rng = np.random.default_rng(7)
+    # gramado/arquibancada: textura fixa; o ruído do sensor já chega reduzido pelo 1/8
+    field = rng.normal(110, 25, (height, width)).clip(0, 255)
+
+    def noisy(base, sigma):
+        return [(base + rng.normal(0, sigma, base.shape)).round().clip(0, 255).astype(np.uint8)
+                for _ in range(SAMPLES)]
+
+    frozen = field.round().astype(np.uint8)
+    return {
+        "campo parado (ruído 0.5)": (noisy(field, 0.5), set()),
+        "campo parado (ruído 0.3)": (noisy(field, 0.3), set()),
+        "captura travada": ([frozen] * SAMPLES, {frame_faults.FAULT_FROZEN}),
+        "preto": (noisy(np.full((height, width), 4.0), 1.0), {frame_faults.FAULT_BLACK}),
+        "em movimento": ([np.roll(frozen, 3 * n, axis=1) for n in range(SAMPLES)], set()),
+    }
+
+def check_detector():
+    import numpy as np
+
+    width, height, split = frame_faults.analysis_geometry(LENS_WIDTH, LENS_WIDTH, CROP_HEIGHT)
+    ok, cpu, samples = True, 0.0, 0
+    print(f"🔍 Detector em {width}x{height} (divisão na coluna {split}), {SAMPLES} amostras por sequência:")
+    for name, (frames, expected) in _sequences(np, width, height).items():
+        det = frame_faults.FrameFaultDetector(width, height, split)
+        for frame in frames:
+            det.feed(frame.tobytes())
+        cpu += det.cpu_sec
+        samples += det.samples
+        got = {lens: {f["fault"] for f in det.faults if f["lens"] == lens} for lens in ("esquerda", "direita")}
+        passed = all(faults == expected for faults in got.values())
+        ok = ok and passed
+        shown = ", ".join(sorted(expected)) or "nenhum alerta"
+        print(f"   {'✅' if passed else '❌'} {name:<26} esperado: {shown:<16} obtido: {got}")
+    per_sample = cpu / samples if samples else 0
+    print(f"   CPU do detector: {per_sample * 1000:.2f} ms por amostra "
+          f"= {100 * per_sample * frame_faults.ANALYSIS_FPS:.2f}% de um núcleo a {frame_faults.ANALYSIS_FPS} fps")
+    return ok
+
+def bench_ffmpeg(seconds):
+    width, height, _split = frame_faults.analysis_geometry(LENS_WIDTH, LENS_WIDTH, CROP_HEIGHT)
+    workdir = tempfile.mkdtemp(prefix="xc_bench_faults_")
+    try:
+        out = os.path.join(workdir, "full.mp4")
+        rows = []
+        for label, analysis in (("só gravação", False), ("gravação + análise", True)):
+            if analysis:
+                graph = (f"{CROP_FILTER},split=2[out][an];"
+                         + frame_faults.analysis_filter("an", "an_gray", width, height))
+            else:
+                graph = f"{CROP_FILTER}[out]"
+            cmd = ["ffmpeg", "-v", "error", *SYNTHETIC_INPUTS, "-filter_complex", graph,
+                   "-t", str(seconds), "-map", "[out]", "-map", "1:a", *RECORD_ARGS, "-y", out]
+            if analysis:
+                cmd += ["-t", str(seconds), "-map", "[an_gray]", "-f", "rawvideo", "-pix_fmt", "gray", os.devnull]
+            rows.append((label,) + run_measured(cmd))
+
+        print(f"\n📊 {seconds}s de gravação (testsrc2 2560x720@30):")
+        for label, rc, cpu, wall in rows:
+            print(f"   {label:<18} rc={rc}  CPU {cpu:6.1f}s  = {100 * cpu / seconds:5.1f}% de um núcleo em tempo real")
+        base, both = rows[0][2], rows[1][2]
+        if base > 0:
+            print(f"   ➡️ o ramo de análise acrescenta {100 * (both - base) / base:.1f}% de CPU à gravação")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Conferência e benchmark do frame_faults")
+    parser.add_argument("--seconds", type=int, default=60)
+    parser.add_argument("--no-ffmpeg", action="store_true", help="só as sequências sintéticas")
+    args = parser.parse_args()
+
+    if not frame_faults.available():
+        print("❌ NumPy ausente: o frame_faults fica desativado na gravação.")
+        sys.exit(1)
+    ok = check_detector()
+    if not args.no_ffmpeg:
+        if shutil.which("ffmpeg"):
+            bench_ffmpeg(args.seconds)
+        else:
+            print("\n⚠️ ffmpeg não encontrado: custo do ramo de análise não medido.")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# Mede o custo de CPU da prévia (proxy) gerada no mesmo ffmpeg da gravação:
+# encode só da versão completa x completa + prévia a partir do mesmo quadro cortado.
+# Sem câmera: a entrada é uma gravação de amostra ou um testsrc2 2560x720 sintético.
+#   uso: python3 tools/bench_proxy_cpu.py [/xcoutfy/recorded_videos/<arquivo>.mp4] [--seconds 60]
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import proxy
+from benchlib import CROP_FILTER, RECORD_ARGS, SYNTHETIC_INPUTS, run_measured
+
+
+def build_cmd(inputs, crop, seconds, full_out, proxy_out=None):
+    """ffmpeg no formato do 01v4record: um corte, split para cada saída."""
+    cropped = CROP_FILTER if crop else "[0:v]null"
+    if proxy_out:
+        graph = f"{cropped},split=2[out][proxy];" + proxy.proxy_filter("proxy", "proxy_s")
+    else:
+        graph = f"{cropped}[out]"
+    cmd = ["ffmpeg", "-v", "error", *inputs, "-filter_complex", graph,
+           "-t", str(seconds), "-map", "[out]", "-map", "1:a", *RECORD_ARGS, "-y", full_out]
+    if proxy_out:
+        cmd += ["-t", str(seconds)] + proxy.output_args("proxy_s", "1:a", "anull") + ["-y", proxy_out]
+    return cmd
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de CPU: gravação com e sem prévia")
+    parser.add_argument("sample", nargs="?", help="gravação de amostra (padrão: testsrc2 sintético)")
+    parser.add_argument("--seconds", type=int, default=60)
+    args = parser.parse_args()
+
+    if args.sample:
+        # gravação já cortada: só o split/encode é medido
+        inputs, crop = ["-i", args.sample, "-i", args.sample], False
+    else:
+        inputs, crop = SYNTHETIC_INPUTS, True
+
+    workdir = tempfile.mkdtemp(prefix="xc_bench_proxy_")
+    try:
+        full_out = os.path.join(workdir, "full.mp4")
+        proxy_out = os.path.join(workdir, "full_proxy.mp4")
+        rows = []
+        for label, p_out in (("só completa", None), ("completa + prévia", proxy_out)):
+            rc, cpu, wall = run_measured(build_cmd(inputs, crop, args.seconds, full_out, p_out))
+            rows.append((label, rc, cpu, wall))
+
+        print(f"\n📊 {args.seconds}s de gravação ({'amostra' if args.sample else 'testsrc2 2560x720@30'}):")
+        for label, rc, cpu, wall in rows:
+            print(f"   {label:<18} rc={rc}  CPU {cpu:6.1f}s  = {100 * cpu / args.seconds:5.1f}% de um núcleo em tempo real")
+        base, both = rows[0][2], rows[1][2]
+        if base > 0:
+            print(f"   ➡️ a prévia acrescenta {100 * (both - base) / base:.1f}% de CPU à gravação")
+        if os.path.exists(proxy_out) and os.path.exists(full_out):
+            p_size, f_size = os.path.getsize(proxy_out), os.path.getsize(full_out)
+            print(f"   🔹 Prévia {p_size / 1e6:.1f} MB ({p_size * 8 / args.seconds / 1e6:.2f} Mbit/s) "
+                  f"x completa {f_size / 1e6:.1f} MB: {100 * p_size / f_size:.1f}% dos bytes da janela")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# Peças comuns dos benchmarks em tools/: CPU dos processos filhos e o asset de broadcast de amostra.
+import os
+import sys
+import time
+import shutil
+import resource
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# mesmo corte padrão do 01v4record (2 lentes 1280x720, 300px de sobreposição)
+CROP_FILTER = (
+    "[0:v]split=2[left][right];"
+    "[left]crop=980:720:0:0[left_crop];"
+    "[right]crop=980:720:1580:0[right_crop];"
+    "[left_crop][right_crop]hstack=inputs=2"
+)
+RECORD_ARGS = ["-c:v", "mpeg4", "-b:v", "5M", "-c:a", "aac", "-b:a", "128k"]
+# câmera sintética: as duas lentes lado a lado + áudio
+SYNTHETIC_INPUTS = ["-f", "lavfi", "-i", "testsrc2=size=2560x720:rate=30",
+                    "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100"]
+
+
+def children_cpu():
+    """CPU (user + sys) acumulada dos filhos já esperados, em segundos."""
+    ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return ru.ru_utime + ru.ru_stime
+
+def run_measured(cmd):
+    """Roda cmd até o fim. Retorna (returncode, CPU dos filhos em s, tempo de parede em s)."""
+    cpu0, t0 = children_cpu(), time.time()
+    rc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+    return rc, children_cpu() - cpu0, time.time() - t0
+
+def broadcast_assets(sample, seconds, workdir):
+    """
+    Corta `seconds` da amostra (-c copy) e prepara a cópia como asset de
+    broadcast (transcode.py, igual ao off-peak). Retorna (clip, asset,
+    resultado do transcode, CPU gasta na preparação).
+    """
+    import transcode
+
+    clip = os.path.join(workdir, "clip.mp4")
+    subprocess.run(["ffmpeg", "-v", "error", "-i", sample, "-t", str(seconds),
+                    "-c", "copy", "-y", clip], check=True)
+    asset = os.path.join(workdir, "asset.uploaded")
+    shutil.copy(clip, asset)
+    cpu0 = children_cpu()
+    res = transcode.transcode_file(asset, transcode.KIND_BROADCAST)
+    return clip, asset, res, children_cpu() - cpu0
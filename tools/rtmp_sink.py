@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# Receptor RTMP local para testar a07broadcast.py e setupcamera_caio.py sem o YouTube.
+# Um relay TCP fica na frente de um "ffmpeg -listen 1" (que descarta o vídeo) e mede
+# tempo até o primeiro pacote, throughput e quedas; pode derrubar a conexão de propósito.
+#   uso: python3 tools/rtmp_sink.py serve [--drop-after 30 --drops 2]
+#        (em outro terminal: XC_RTMP_BASE_URL=rtmp://127.0.0.1:1935/live2 python3 setupcamera_caio.py ...)
+#        python3 tools/rtmp_sink.py bench <amostra.uploaded> [--seconds 60] [--drop-after 20]
+#        python3 tools/rtmp_sink.py camera [--seconds 60] [--drop-after 20]   (no equipamento, com a câmera)
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchlib import broadcast_assets, children_cpu
+
+LISTEN_HOST = "127.0.0.1"
+LISTEN_PORT = 1935
+BACKEND_PORT = 19350          # ffmpeg -listen interno; o relay repassa para cá
+STREAM_PATH = "live2"
+STREAM_KEY = "xcoutfy-sink"
+HANDSHAKE_BYTES = 1 + 1536 + 1536   # C0 + C1 + C2 do handshake RTMP
+FIRST_MEDIA_BYTES = HANDSHAKE_BYTES + 4096  # depois do handshake e do connect/publish
+
+
+# =========================
+# Receptor: ffmpeg listener + relay TCP
+# =========================
+class RtmpSink(object):
+    """
+    Aceita conexões RTMP em LISTEN_PORT e repassa para um ffmpeg em modo
+    listener (um por conexão, como o YouTube aceitaria uma reconexão).
+    drop_after (s): fecha cada conexão depois desse tempo, até `drops` vezes.
+    """
+
+    def __init__(self, port=LISTEN_PORT, backend_port=BACKEND_PORT, drop_after=None, drops=0):
+        self.port = port
+        self.backend_port = backend_port
+        self.drop_after = drop_after
+        self.drops_left = drops
+        self.t0 = time.time()
+        self.sessions = []
+        self.sink_cpu = 0.0
+        self._lock = threading.Lock()
+        self._server = None
+        self._stop = threading.Event()
+
+    def url(self, key=STREAM_KEY):
+        return f"rtmp://{LISTEN_HOST}:{self.port}/{STREAM_PATH}/{key}"
+
+    def start(self):
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((LISTEN_HOST, self.port))
+        self._server.listen(4)
+        self._server.settimeout(1.0)
+        threading.Thread(target=self._accept_loop, name="rtmp_sink", daemon=True).start()
+        print(f"📡 Receptor RTMP local em {self.url('<chave>')}")
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.close()
+
+    def _start_backend(self):
+        cmd = [
+            "ffmpeg", "-v", "error", "-listen", "1",
+            "-i", f"rtmp://{LISTEN_HOST}:{self.backend_port}/{STREAM_PATH}/{STREAM_KEY}",
+            "-c", "copy", "-f", "null", "-"
+        ]
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            try:
+                return proc, socket.create_connection((LISTEN_HOST, self.backend_port), timeout=1)
+            except OSError:
+                time.sleep(0.1)
+        proc.kill()
+        raise RuntimeError("ffmpeg listener não subiu")
+
+    def _reap(self, proc):
+        """Espera o listener e desconta a CPU dele da medição do cliente."""
+        try:
+            _pid, _status, ru = os.wait4(proc.pid, 0)
+            proc.returncode = 0
+            with self._lock:
+                self.sink_cpu += ru.ru_utime + ru.ru_stime
+        except ChildProcessError:
+            pass
+
+    def _accept_loop(self):
+        while not self._stop.is_set():
+            try:
+                client, _addr = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            threading.Thread(target=self._relay, args=(client,), daemon=True).start()
+
+    def _relay(self, client):
+        session = {"connected_at": time.time() - self.t0, "first_byte_sec": None,
+                   "first_media_sec": None, "bytes": 0, "duration_sec": 0.0, "dropped": False}
+        with self._lock:
+            self.sessions.append(session)
+        try:
+            proc, backend = self._start_backend()
+        except (RuntimeError, OSError) as e:
+            print(f"⚠️ Receptor indisponível: {e}")
+            client.close()
+            return
+        print(f"🔗 Conexão #{len(self.sessions)} aceita")
+
+        drop = False
+        with self._lock:
+            if self.drop_after and self.drops_left > 0:
+                self.drops_left -= 1
+                drop = True
+
+        def downstream():
+            try:
+                while True:
+                    data = backend.recv(65536)
+                    if not data:
+                        break
+                    client.sendall(data)
+            except OSError:
+                pass
+
+        threading.Thread(target=downstream, daemon=True).start()
+        start = time.time()
+        client.settimeout(1.0)
+        try:
+            while not self._stop.is_set():
+                if drop and time.time() - start >= self.drop_after:
+                    session["dropped"] = True
+                    print(f"✂️ Queda injetada na conexão #{len(self.sessions)} após {self.drop_after}s")
+                    break
+                try:
+                    data = client.recv(65536)
+                except socket.timeout:
+                    continue
+                if not data:
+                    break
+                now = time.time() - self.t0
+                if session["first_byte_sec"] is None:
+                    session["first_byte_sec"] = now
+                session["bytes"] += len(data)
+                if session["first_media_sec"] is None and session["bytes"] >= FIRST_MEDIA_BYTES:
+                    session["first_media_sec"] = now
+                backend.sendall(data)
+        except OSError:
+            pass
+        finally:
+            session["duration_sec"] = time.time() - start
+            for s in (client, backend):
+                try:
+                    s.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                s.close()
+            if session["dropped"]:
+                proc.kill()
+            self._reap(proc)
+
+    def report(self, client_started=None):
+        base = client_started - self.t0 if client_started is not None else 0.0
+        print(f"\n📊 Receptor: {len(self.sessions)} conexão(ões)")
+        for n, s in enumerate(self.sessions, start=1):
+            rate = s["bytes"] * 8 / s["duration_sec"] / 1e6 if s["duration_sec"] else 0
+            first = f"{s['first_media_sec'] - base:.2f}s" if s["first_media_sec"] is not None else "-"
+            print(f"   #{n}: 1º pacote de mídia {first}, {s['bytes'] / 1e6:.1f} MB em "
+                  f"{s['duration_sec']:.1f}s ({rate:.2f} Mbit/s){' [queda injetada]' if s['dropped'] else ''}")
+
+
+# =========================
+# Medição por cliente
+# =========================
+def _measure(sink, label, run):
+    """
+    Roda run() (o cliente RTMP) e mede contra as sessões que ele abriu no
+    receptor: CPU do cliente (sem a do listener), 1º pacote, bytes e conexões.
+    """
+    first = len(sink.sessions)
+    cpu0, sink0, t0 = children_cpu(), sink.sink_cpu, time.time()
+    rc = run()
+    time.sleep(1)  # deixa o relay fechar a sessão e reaproveitar o listener
+    wall = time.time() - t0
+    cpu = (children_cpu() - cpu0) - (sink.sink_cpu - sink0)
+    sessions = sink.sessions[first:]
+    firsts = [s["first_media_sec"] - (t0 - sink.t0) for s in sessions if s["first_media_sec"] is not None]
+    nbytes = sum(s["bytes"] for s in sessions)
+    return (label, rc, cpu, wall, firsts[0] if firsts else None, nbytes, len(sessions))
+
+def _print_rows(title, rows):
+    print(f"\n📊 {title}:")
+    for label, rc, cpu, wall, first, nbytes, conns in rows:
+        first_txt = f"{first:5.2f}s" if first is not None else "    -"
+        print(f"   {label:<20} rc={rc}  1º pacote {first_txt}  {nbytes * 8 / wall / 1e6:5.2f} Mbit/s  "
+              f"CPU {100 * cpu / wall:5.1f}% de um núcleo  conexões={conns}")
+
+
+# =========================
+# Benchmark dos modos do a07broadcast
+# =========================
+def bench(sink, sample, seconds):
+    import a07broadcast
+
+    workdir = tempfile.mkdtemp(prefix="xc_sink_")
+    os.environ.setdefault("XC_BROADCAST_HEALTH_DIR", workdir)
+    a07broadcast.HEALTH_DIR = os.environ["XC_BROADCAST_HEALTH_DIR"]
+    a07broadcast.PLAYLIST_PATH = os.path.join(workdir, "playlist.ffconcat")
+    clip, asset, _res, _cpu = broadcast_assets(sample, seconds, workdir)
+
+    def direct(path, copy):
+        return lambda: subprocess.run(a07broadcast.build_stream_cmd(path, sink.url(), copy),
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+
+    def monitored(path):
+        item = (os.path.basename(path), path, a07broadcast.probe_duration(path))
+        return lambda: 0 if a07broadcast.stream_playlist([item], sink.url(), lambda _f: None) else 1
+
+    rows = [_measure(sink, "encode libx264", direct(clip, False)),
+            _measure(sink, "remux -c copy", direct(asset, True)),
+            _measure(sink, "playlist monitorada", monitored(asset))]
+    _print_rows(f"Broadcast de {seconds}s para o receptor local", rows)
+    print(f"   (arquivos temporários em {workdir})")
+
+
+# =========================
+# Transmissão direta da câmera (setupcamera_caio)
+# =========================
+def bench_camera(sink, seconds):
+    """
+    Roda o setupcamera_caio.py de verdade (câmera + encode + RTMP) contra o
+    receptor, nos modos direto e spool. Precisa da câmera: roda no equipamento.
+    """
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "setupcamera_caio.py")
+    env = dict(os.environ, XC_RTMP_BASE_URL=f"rtmp://{LISTEN_HOST}:{sink.port}/{STREAM_PATH}")
+
+    def camera(spool):
+        return lambda: subprocess.run([sys.executable, script, "--stream_key", STREAM_KEY,
+                                       "--duration", str(seconds), "--spool", str(spool)], env=env).returncode
+
+    rows = [_measure(sink, "direto (flv)", camera(0)),
+            _measure(sink, "spool + relay", camera(1))]
+    _print_rows(f"Transmissão da câmera por {seconds}s para o receptor local", rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Receptor RTMP local para testes de broadcast/transmissão")
+    parser.add_argument("mode", choices=["serve", "bench", "camera"])
+    parser.add_argument("sample", nargs="?", help="vídeo de amostra (modo bench)")
+    parser.add_argument("--seconds", type=int, default=60)
+    parser.add_argument("--port", type=int, default=LISTEN_PORT)
+    parser.add_argument("--drop-after", type=float, default=None, help="derruba cada conexão após N segundos")
+    parser.add_argument("--drops", type=int, default=1, help="quantas quedas injetar (com --drop-after)")
+    args = parser.parse_args()
+
+    sink = RtmpSink(port=args.port, drop_after=args.drop_after, drops=args.drops if args.drop_after else 0)
+    sink.start()
+    try:
+        if args.mode == "bench":
+            if not args.sample:
+                parser.error("bench precisa de um vídeo de amostra")
+            bench(sink, args.sample, args.seconds)
+        elif args.mode == "camera":
+            bench_camera(sink, args.seconds)
+        else:
+            print(f"   export XC_RTMP_BASE_URL=rtmp://{LISTEN_HOST}:{args.port}/{STREAM_PATH}")
+            print("   Ctrl+C para encerrar e ver o relatório.")
+            while True:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.stop()
+        if args.mode == "serve":
+            sink.report()
+
+
+if __name__ == "__main__":
+    main()
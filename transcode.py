@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# === transcode.py (transcode H.264 em segundo plano: pré-upload e assets de broadcast) ===
+import os
+import json
+import time
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+import psutil
+import file_ready
+import sidecar
+import storage
+from sidecar import probe
+
+TRANSCODE_ENABLED = os.getenv("XC_TRANSCODE", "0") == "1"
+BROADCAST_PREP_ENABLED = os.getenv("XC_BROADCAST_PREP", "0") == "1"
+TRANSCODE_DIRS = storage.RECORDING_TIERS
+BROADCAST_DIR = "/xcoutfy/uploaded_videos"
+TRANSCODE_CRF = int(os.getenv("XC_TRANSCODE_CRF", 28))
+TRANSCODE_MAXRATE = os.getenv("XC_TRANSCODE_MAXRATE", "2M")   # teto de bitrate
+TRANSCODE_PRESET = os.getenv("XC_TRANSCODE_PRESET", "veryfast")
+TRANSCODE_WORKERS = int(os.getenv("XC_TRANSCODE_WORKERS", 1))
+TRANSCODE_NICE = 15
+MAX_ATTEMPTS = 3
+DURATION_TOLERANCE_SEC = 1.0
+SCAN_INTERVAL_SEC = 60
+STATE_PATH = "/xcoutfy/schedules/transcode_state.json"
+
+# marcador no nome do temporário; também identifica nossos ffmpeg no stop()
+TMP_MARKER = ".h264"
+
+KIND_UPLOAD = "upload"        # .mp4 antes do upload: menos bytes na janela
+KIND_BROADCAST = "broadcast"  # .uploaded antes do broadcast: permite -c copy no RTMP
+
+
+def _stem(filename):
+    """Chave estável entre .mp4 / .uploaded / .broadcasted."""
+    return os.path.splitext(os.path.basename(filename))[0]
+
+def load_state():
+    try:
+        with open(STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def _save_state(state):
+    os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+    tmp = STATE_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, STATE_PATH)
+
+def _entry(state, path, kind):
+    """Upload fica na raiz da entrada (compatível); broadcast numa sub-chave."""
+    entry = state.setdefault(_stem(path), {})
+    return entry if kind == KIND_UPLOAD else entry.setdefault(KIND_BROADCAST, {})
+
+def saved_bytes(filename):
+    """Bytes economizados pelo transcode deste vídeo (0 se não foi transcodado)."""
+    entry = load_state().get(_stem(filename), {})
+    if entry.get("status") != "done":
+        return 0
+    return max(0, int(entry.get("orig_bytes", 0)) - int(entry.get("new_bytes", 0)))
+
+def broadcast_compatible(info):
+    """H.264 yuv420p + AAC: o RTMP/FLV aceita com -c copy."""
+    return bool(info) and info["codec"] == "h264" and info["pix_fmt"] == "yuv420p" and info["audio"] == "aac"
+
+
+# =========================
+# Worker (roda no pool, com nice)
+# =========================
+def _lower_priority():
+    try:
+        os.nice(TRANSCODE_NICE)
+    except OSError:
+        pass
+
+def transcode_file(path, kind=KIND_UPLOAD):
+    """
+    Transcodifica para H.264 (e AAC, no caso de broadcast) num temporário,
+    verifica (codec, duração, tamanho) e só então substitui o original.
+    Retorna dict com o resultado.
+    """
+    result = {"path": path, "kind": kind, "status": "failed", "orig_bytes": 0, "new_bytes": 0, "elapsed": 0.0}
+    src = probe(path)
+    if not src:
+        return result
+    result["orig_bytes"] = os.path.getsize(path)
+    if kind == KIND_UPLOAD and src["codec"] == "h264":
+        result["status"] = "skipped"
+        return result
+    if kind == KIND_BROADCAST and broadcast_compatible(src):
+        result["status"] = "skipped"
+        return result
+
+    tmp = f"{path}{TMP_MARKER}{file_ready.PARTIAL_SUFFIX}"
+    cmd = ["ffmpeg", "-v", "error", "-i", path]
+    if kind == KIND_BROADCAST and not src["audio"]:
+        cmd += ["-f", "lavfi", "-i", "anullsrc=r=44100:cl=mono", "-shortest", "-map", "0:v:0", "-map", "1:a:0"]
+    cmd += [
+        "-c:v", "libx264", "-preset", TRANSCODE_PRESET, "-crf", str(TRANSCODE_CRF),
+        "-maxrate", TRANSCODE_MAXRATE, "-bufsize", TRANSCODE_MAXRATE,
+        "-pix_fmt", "yuv420p", "-force_key_frames", "expr:gte(t,n_forced*2)",
+    ]
+    if kind == KIND_BROADCAST and src["audio"] != "aac":
+        cmd += ["-c:a", "aac", "-b:a", "128k"]
+    else:
+        cmd += ["-c:a", "copy"]
+    cmd += ["-movflags", "+faststart", "-f", "mp4", "-y", tmp]
+
+    t0 = time.time()
+    rc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+    result["elapsed"] = time.time() - t0
+    try:
+        new = probe(tmp) if rc == 0 else None
+        ok = (
+            new is not None
+            and new["codec"] == "h264"
+            and (kind == KIND_UPLOAD or broadcast_compatible(new))
+            and abs(new["duration"] - src["duration"]) <= DURATION_TOLERANCE_SEC
+            and os.path.getsize(tmp) > 0
+            # no pré-upload só compensa se ficar menor
+            and (kind == KIND_BROADCAST or os.path.getsize(tmp) < result["orig_bytes"])
+        )
+        if ok:
+            result["new_bytes"] = os.path.getsize(tmp)
+            os.replace(tmp, path)
+            result["status"] = "done"
+            sidecar.update(path, transcoded=kind, **sidecar.probe_fields(new, result["new_bytes"]))
+        elif kind == KIND_UPLOAD and new is not None and os.path.getsize(tmp) >= result["orig_bytes"]:
+            result["status"] = "skipped"   # não compensa: mantém o original
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return result
+
+
+# =========================
+# Estágio (roda dentro do 00agenda)
+# =========================
+class TranscodeStage(object):
+    def __init__(self, workers=TRANSCODE_WORKERS):
+        self.workers = workers
+        self.pool = None
+        self.inflight = {}
+        self._stopping = False
+        self._last_scan = 0
+
+    def _candidates(self, state):
+        jobs = []
+        if TRANSCODE_ENABLED:
+            jobs += [(d, ".mp4", KIND_UPLOAD) for d in TRANSCODE_DIRS]
+        if BROADCAST_PREP_ENABLED:
+            jobs.append((BROADCAST_DIR, ".uploaded", KIND_BROADCAST))
+        for d, suffix, kind in jobs:
+            try:
+                names = sorted(os.listdir(d))
+            except OSError:
+                continue
+            for f in names:
+                path = os.path.join(d, f)
+                if not f.endswith(suffix) or path in self.inflight:
+                    continue
+                entry = state.get(_stem(f), {})
+                entry = entry if kind == KIND_UPLOAD else entry.get(KIND_BROADCAST, {})
+                if entry.get("status") in ("done", "skipped"):
+                    continue
+                if int(entry.get("attempts", 0)) >= MAX_ATTEMPTS:
+                    continue
+                if file_ready.is_file_ready(path):
+                    yield path, kind
+
+    def tick(self, idle):
+        """Coleta resultados e, se idle (sem RECORDING/upload ativo), enfileira novos arquivos."""
+        if not (TRANSCODE_ENABLED or BROADCAST_PREP_ENABLED):
+            return
+        self._collect()
+        if not idle or len(self.inflight) >= self.workers:
+            return
+        if time.time() - self._last_scan < SCAN_INTERVAL_SEC:
+            return
+        self._last_scan = time.time()
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_lower_priority)
+        state = load_state()
+        for path, kind in self._candidates(state):
+            if len(self.inflight) >= self.workers:
+                break
+            label = "pré-upload" if kind == KIND_UPLOAD else "asset de broadcast"
+            print(f"🗜️ Transcode H.264 ({label}) em segundo plano: {os.path.basename(path)}")
+            self.inflight[path] = (kind, self.pool.submit(transcode_file, path, kind))
+
+    def _collect(self):
+        if not self.inflight:
+            return
+        state = None
+        for path, (kind, fut) in list(self.inflight.items()):
+            if not fut.done():
+                continue
+            del self.inflight[path]
+            try:
+                res = fut.result()
+            except Exception as e:
+                res = {"status": "failed", "orig_bytes": 0, "new_bytes": 0, "elapsed": 0.0}
+                print(f"⚠️ Transcode falhou para {os.path.basename(path)}: {e}")
+            state = state if state is not None else load_state()
+            entry = _entry(state, path, kind)
+            entry.update({
+                "status": res["status"],
+                "orig_bytes": res["orig_bytes"],
+                "new_bytes": res["new_bytes"],
+                "elapsed": round(res["elapsed"], 1),
+            })
+            # interrupção nossa (stop) não conta como tentativa
+            if not self._stopping or res["status"] == "done":
+                entry["attempts"] = int(entry.get("attempts", 0)) + 1
+            if res["status"] == "done":
+                saved = res["orig_bytes"] - res["new_bytes"]
+                if kind == KIND_BROADCAST:
+                    # o objetivo aqui é o -c copy no RTMP; o asset pode crescer
+                    print(f"✅ Asset de broadcast pronto: {os.path.basename(path)} "
+                          f"({res['orig_bytes'] / 1e6:.1f} -> {res['new_bytes'] / 1e6:.1f} MB)")
+                else:
+                    print(f"✅ Transcode ok: {os.path.basename(path)} ({saved / 1e6:.1f} MB a menos)")
+            else:
+                print(f"ℹ️ Transcode {res['status']}: {os.path.basename(path)}")
+        if state is not None:
+            _save_state(state)
+
+    def stop(self):
+        """Interrompe transcodes em andamento (ex.: antes de um RECORDING). O original fica intacto."""
+        if not self.inflight:
+            return
+        print("⏸️ Interrompendo transcodes em andamento para liberar CPU...")
+        for child in psutil.Process().children(recursive=True):
+            try:
+                if child.name() == "ffmpeg" and any(TMP_MARKER in a for a in child.cmdline()):
+                    child.kill()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        for _kind, fut in self.inflight.values():
+            fut.cancel()
+        self._stopping = True
+        try:
+            self._collect_all()
+        finally:
+            self._stopping = False
+
+    def _collect_all(self):
+        deadline = time.time() + 10
+        while self.inflight and time.time() < deadline:
+            self._collect()
+            time.sleep(0.2)
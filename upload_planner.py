@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# === upload_planner.py (planejamento de uploads dentro da janela FREE2UP) ===
+import os
+import json
+import socket
+from datetime import datetime
+import metrics
+import proxy
+
+THROUGHPUT_PATH = "/xcoutfy/schedules/uplink_throughput.json"
+# Vídeos que o 02upload deixou para a próxima janela: o 00agenda não relança o
+# upload por eles (segue para o broadcast) até a janela acabar ou chegar mídia nova
+DEFERRED_PATH = "/xcoutfy/schedules/upload_deferred.json"
+DEFAULT_THROUGHPUT_BPS = 1_000_000   # bytes/s (~8 Mbit/s) até termos medições reais
+EWMA_ALPHA = 0.3                     # peso da medição mais recente na média móvel
+MIN_SAMPLE_BYTES = 5 * 1024 * 1024   # uploads menores que isso não entram na estimativa
+PER_FILE_OVERHEAD_SEC = 15           # link + Sheets + move por arquivo
+SAFETY_MARGIN = 0.9                  # usa só 90% do tempo restante no plano
+
+
+# =========================
+# Estimativa de throughput
+# =========================
+def _load_state():
+    try:
+        with open(THROUGHPUT_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def load_throughput():
+    """Retorna a estimativa de uplink (bytes/s) deste equipamento."""
+    entry = _load_state().get(socket.gethostname(), {})
+    try:
+        bps = float(entry.get("bps", 0))
+    except (TypeError, ValueError):
+        bps = 0
+    return bps if bps > 0 else DEFAULT_THROUGHPUT_BPS
+
+def update_throughput(nbytes, seconds):
+    """Atualiza a média móvel (EWMA) com um upload medido. Retorna a nova estimativa."""
+    current = load_throughput()
+    if nbytes < MIN_SAMPLE_BYTES or seconds <= 0:
+        return current
+    sample = nbytes / seconds
+    state = _load_state()
+    host = socket.gethostname()
+    entry = state.get(host, {})
+    if entry.get("bps"):
+        bps = EWMA_ALPHA * sample + (1 - EWMA_ALPHA) * current
+    else:
+        bps = sample
+    state[host] = {"bps": bps, "samples": int(entry.get("samples", 0)) + 1, "last_sample_bps": sample}
+    try:
+        os.makedirs(os.path.dirname(THROUGHPUT_PATH), exist_ok=True)
+        tmp = THROUGHPUT_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, THROUGHPUT_PATH)
+    except Exception as e:
+        print(f"⚠️ Falha ao salvar throughput: {e}")
+    return bps
+
+def predict_seconds(size_bytes, bps):
+    return size_bytes / bps + PER_FILE_OVERHEAD_SEC
+
+
+# =========================
+# Planejamento
+# =========================
+def _by_age(items):
+    # prévias primeiro (cliente vê algo já nesta janela), depois por idade
+    return sorted(items, key=lambda i: (not proxy.is_proxy(i["path"]), os.path.basename(i["path"])))
+
+def plan_uploads(paths, seconds_left, bps):
+    """
+    Seleciona os arquivos que cabem em seconds_left maximizando a quantidade
+    de uploads concluídos (menores primeiro), e devolve os selecionados em
+    ordem de idade (nome começa com YYYY_MM_DD___HH_MM). As prévias
+    (*_proxy.mp4) reservam o orçamento antes das versões completas e vão
+    na frente da fila.
+    seconds_left=None significa janela sem fim conhecido: envia tudo.
+    """
+    items = []
+    for p in paths:
+        try:
+            size = os.path.getsize(p)
+        except OSError:
+            continue
+        items.append({"path": p, "size": size, "predicted_sec": predict_seconds(size, bps)})
+
+    if seconds_left is None:
+        return _by_age(items)
+
+    budget = seconds_left * SAFETY_MARGIN
+    selected = []
+    for item in sorted(items, key=lambda i: (not proxy.is_proxy(i["path"]), i["size"])):
+        if item["predicted_sec"] > budget:
+            continue
+        budget -= item["predicted_sec"]
+        selected.append(item)
+    return _by_age(selected)
+
+
+# =========================
+# Adiados para a próxima janela
+# =========================
+def save_deferred(paths, window_end):
+    try:
+        os.makedirs(os.path.dirname(DEFERRED_PATH), exist_ok=True)
+        tmp = DEFERRED_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"window_end": window_end.isoformat(timespec="seconds"),
+                       "files": sorted(os.path.basename(p) for p in paths)}, f, indent=2)
+        os.replace(tmp, DEFERRED_PATH)
+    except Exception as e:
+        print(f"⚠️ Falha ao salvar adiados: {e}")
+
+def clear_deferred():
+    try:
+        os.remove(DEFERRED_PATH)
+    except OSError:
+        pass
+
+def is_deferred(paths):
+    """True se todos os paths já foram adiados pelo 02upload nesta janela (nada novo a planejar)."""
+    try:
+        with open(DEFERRED_PATH, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if datetime.now() >= datetime.fromisoformat(state["window_end"]):
+            return False
+        return {os.path.basename(p) for p in paths} <= set(state["files"])
+    except Exception:
+        return False
+
+
+# =========================
+# Relatório plano x realizado
+# =========================
+class WindowReport(object):
+    def __init__(self, window_end, bps):
+        self.window_end = window_end
+        self.bps_start = bps
+        self.plan = []
+        self.total_files = 0
+        self.results = []
+
+    def set_plan(self, plan, total_files):
+        self.plan = [dict(i) for i in plan]
+        self.total_files = total_files
+
+    def record(self, item, actual_sec, ok, saved_bytes=0, verify_sec=0.0, verify_failed=False):
+        self.results.append({
+            "file": os.path.basename(item["path"]),
+            "size": item["size"],
+            "predicted_sec": round(item["predicted_sec"], 1),
+            "actual_sec": round(actual_sec, 1),
+            "ok": ok,
+            "saved_bytes": saved_bytes,
+            "verify_sec": round(verify_sec, 1),
+            "verify_failed": verify_failed,
+        })
+
+    def log(self):
+        planned_names = {os.path.basename(i["path"]) for i in self.plan}
+        done = [r for r in self.results if r["ok"]]
+        pred = sum(i["predicted_sec"] for i in self.plan)
+        actual = sum(r["actual_sec"] for r in self.results)
+        saved = sum(r["saved_bytes"] for r in done)
+        saved_sec = saved / self.bps_start if self.bps_start else 0
+        verify_sec = sum(r["verify_sec"] for r in self.results)
+        verify_failures = sum(1 for r in self.results if r["verify_failed"])
+        print("📋 Relatório da janela (plano x realizado):")
+        print(f"   🎯 Planejados: {len(self.plan)}/{self.total_files} arquivo(s), "
+              f"{pred:.0f}s previstos @ {self.bps_start * 8 / 1e6:.2f} Mbit/s")
+        print(f"   ✅ Concluídos: {len(done)} arquivo(s) em {actual:.0f}s")
+        print(f"   🔒 Verificação: {verify_sec:.0f}s no total, {verify_failures} falha(s)")
+        if saved:
+            print(f"   💾 Transcode economizou {saved / 1e6:.1f} MB (~{saved_sec:.0f}s de upload)")
+        for r in self.results:
+            tag = "plano" if r["file"] in planned_names else "extra"
+            print(f"   🔸 [{tag}] {r['file']}: previsto {r['predicted_sec']}s, real {r['actual_sec']}s"
+                  f"{'' if r['ok'] else ' (falhou)'}")
+        metrics.emit(
+            "upload_window",
+            window_end=self.window_end.isoformat() if self.window_end else None,
+            planned=len(self.plan),
+            total_files=self.total_files,
+            completed=len(done),
+            predicted_sec=round(pred, 1),
+            actual_sec=round(actual, 1),
+            verify_sec=round(verify_sec, 1),
+            verify_failures=verify_failures,
+            transcode_saved_bytes=saved,
+            transcode_saved_sec=round(saved_sec, 1),
+            bps_start=round(self.bps_start),
+            bps_end=round(load_throughput()),
+            files=self.results,
+        )